@@ -0,0 +1,484 @@
+"""
+Batch download of many URLs with one shared worker pool
+
+Usage:
+    blockbatch manifest.yaml [--boost 8] [--per-host 4] [--limit-rate 10M] [--progress]
+
+The manifest is either a YAML file with a list of downloads:
+
+    downloads:
+    - url: https://example.com/a.iso
+      name: a
+      target: /tmp/a
+
+or a plain text file with one "url name target" entry per line.
+
+Created on 2025-06-02
+
+@author: wf
+"""
+import argparse
+import os
+import threading
+from dataclasses import field
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Set
+from urllib.parse import urlparse
+
+from basemkit.yamlable import lod_storable
+
+from bdown.block import StatusSymbol
+from bdown.download import BlockDownload, RemoteFileChanged
+from bdown.rate_limit import RateLimiter
+
+if TYPE_CHECKING:
+    import requests
+
+
+@lod_storable
+class BatchEntry:
+    """
+    a single download of a batch
+    """
+
+    url: str
+    name: str
+    target: str
+    blocksize: int = 32
+    unit: str = "MB"
+    size: Optional[int] = None
+
+    @property
+    def yaml_path(self) -> str:
+        yaml_path = os.path.join(self.target, f"{self.name}.yaml")
+        return yaml_path
+
+    def get_block_download(self) -> BlockDownload:
+        """
+        get the BlockDownload for this entry - resuming from
+        an existing manifest if there is one
+        """
+        if os.path.exists(self.yaml_path):
+            bd = BlockDownload.ofYamlPath(self.yaml_path)
+        else:
+            os.makedirs(self.target, exist_ok=True)
+            bd = BlockDownload(
+                name=self.name,
+                url=self.url,
+                blocksize=self.blocksize,
+                unit=self.unit,
+                size=self.size,
+            )
+            bd.yaml_path = self.yaml_path
+        return bd
+
+
+@lod_storable
+class BatchManifest:
+    """
+    a list of downloads to be processed together
+    """
+
+    downloads: List[BatchEntry] = field(default_factory=list)
+
+    @classmethod
+    def ofFile(cls, path: str) -> "BatchManifest":
+        """
+        read a batch manifest from a YAML file or a plain text
+        file with whitespace separated "url name target" lines
+
+        Args:
+            path: the manifest file path
+
+        Returns:
+            BatchManifest: the manifest
+        """
+        if path.endswith((".yaml", ".yml")):
+            manifest = cls.load_from_yaml_file(path)  # @UndefinedVariable
+        else:
+            manifest = cls()
+            with open(path, "r") as f:
+                for line_no, line in enumerate(f, start=1):
+                    line = line.strip()
+                    if not line or line.startswith("#"):
+                        continue
+                    parts = line.split()
+                    if len(parts) != 3:
+                        raise ValueError(
+                            f"{path}:{line_no}: expected 'url name target' but got '{line}'"
+                        )
+                    url, name, target = parts
+                    manifest.downloads.append(BatchEntry(url=url, name=name, target=target))
+        return manifest
+
+
+class BatchJob:
+    """
+    the block download state of a single file in a batch
+    """
+
+    def __init__(
+        self,
+        bd: BlockDownload,
+        target: str,
+        from_block: int = 0,
+        to_block: int = None,
+        force: bool = False,
+    ):
+        self.bd = bd
+        self.target = target
+        self.force = force
+        self.host = urlparse(bd.url).netloc
+        self.block_specs = bd.prepare_download(target, from_block, to_block)
+        self.expected_blocks = {index for index, _start, _end in self.block_specs}
+        self.pending = list(self.block_specs)
+        self.processed_blocks: Set[int] = set()
+        self.progress_bar = None
+        self.active = 0
+        self.paused = False
+        self.cancelled = False
+        # True if the server ignores ranges - one worker streams all blocks
+        self.single_stream = False
+        # set if the remote file changed while the job was running
+        self.changed: Optional[RemoteFileChanged] = None
+        self.finished = False
+        # optional callback called with this job when it is finished
+        self.on_finish: Optional[Callable[["BatchJob"], None]] = None
+
+    @property
+    def missed_blocks(self) -> Set[int]:
+        missed_blocks = self.expected_blocks - self.processed_blocks
+        return missed_blocks
+
+    def finish(self):
+        """
+        collect and save the downloaded blocks
+        """
+        missed_blocks = self.missed_blocks
+        if self.changed:
+            print(f"{StatusSymbol.FAIL.value} {self.bd.name}: {self.changed}")
+            # the cancel only stopped the remaining blocks of this job
+            self.bd.cancel_event.clear()
+        else:
+            if missed_blocks and not self.cancelled:
+                print(
+                    f"{StatusSymbol.WARN.value} {self.bd.name}: Failed to process blocks: {sorted(missed_blocks)}"
+                )
+            self.bd.save_blocks(self.target)
+        if self.progress_bar:
+            self.progress_bar.close()
+        if self.on_finish:
+            self.on_finish(self)
+
+
+class BatchScheduler:
+    """
+    spread one global worker budget across the blocks
+    of many downloads with a per host connection cap
+    """
+
+    def __init__(
+        self,
+        boost: int = 4,
+        per_host: int = 2,
+        progress: bool = False,
+        resident: bool = False,
+        rate_limiter: RateLimiter = None,
+    ):
+        """
+        constructor
+
+        Args:
+            boost: total number of concurrent download threads
+            per_host: maximum number of concurrent connections per host
+            progress: if True show a progress bar per file
+            resident: if True the workers wait for new jobs until stop() is called
+            rate_limiter: optional bandwidth limit shared by all jobs
+        """
+        self.boost = boost
+        self.per_host = per_host
+        self.progress = progress
+        self.resident = resident
+        self.rate_limiter = rate_limiter
+        self.jobs: List[BatchJob] = []
+        self.host_connections: Dict[str, int] = {}
+        self.condition = threading.Condition()
+        self.next_job = 0
+        self.stopped = False
+        self.threads: List[threading.Thread] = []
+        # one requests.Session per host - the blocks of all jobs reuse its connections
+        self.sessions: Dict[str, "requests.Session"] = {}
+
+    def add(
+        self,
+        bd: BlockDownload,
+        target: str,
+        from_block: int = 0,
+        to_block: int = None,
+        force: bool = False,
+        paused: bool = False,
+        on_finish: Callable[[BatchJob], None] = None,
+    ) -> BatchJob:
+        """
+        add the given block download to the batch
+        """
+        if self.rate_limiter:
+            bd.rate_limiter = self.rate_limiter
+        job = BatchJob(bd, target, from_block, to_block, force)
+        job.paused = paused
+        job.on_finish = on_finish
+        if self.progress:
+            _, to_block, _ = bd.compute_total_bytes(from_block, to_block)
+            job.progress_bar = bd.get_progress_bar(from_block, to_block)
+        with self.condition:
+            bd.session = self.get_session(job.host)
+        if job.pending and not bd.supports_ranges():
+            bd.logger.warning(f"⚠️ {bd.url} does not support range requests - using a single stream")
+            job.single_stream = True
+        with self.condition:
+            self.jobs.append(job)
+            is_done = self.check_done(job)
+            self.condition.notify_all()
+        if is_done:
+            job.finish()
+        return job
+
+    def get_session(self, host: str) -> "requests.Session":
+        """
+        get the HTTP session of the given host - its connection pool
+        is sized to the per host connection cap
+        """
+        session = self.sessions.get(host)
+        if session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, self.per_host))
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self.sessions[host] = session
+        return session
+
+    def close_sessions(self):
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
+
+    def check_done(self, job: BatchJob) -> bool:
+        """
+        check whether the given job just got done - needs to be called
+        with the condition held
+
+        Returns:
+            bool: True if the job is done and needs to be finished by the caller
+        """
+        is_done = not job.finished and not job.pending and job.active == 0
+        if is_done:
+            job.finished = True
+        return is_done
+
+    def pause(self, job: BatchJob):
+        """
+        pause the given job - blocks already being downloaded will complete
+        """
+        with self.condition:
+            job.paused = True
+
+    def resume(self, job: BatchJob):
+        """
+        resume the given paused job
+        """
+        with self.condition:
+            job.paused = False
+            self.condition.notify_all()
+
+    def cancel(self, job: BatchJob):
+        """
+        cancel the given job - the part files downloaded so far are kept
+        """
+        with self.condition:
+            job.cancelled = True
+            job.pending.clear()
+            is_done = self.check_done(job)
+            self.condition.notify_all()
+        if is_done:
+            job.finish()
+
+    def change(self, job: BatchJob, ex: RemoteFileChanged):
+        """
+        stop the given job since its remote file has changed - the blocks
+        of the old version that are being downloaded are discarded
+        """
+        with self.condition:
+            if job.changed is None:
+                job.changed = ex
+            job.pending.clear()
+
+    def next_task(self):
+        """
+        pick the next block of the next job in round robin order
+        whose host still has connection capacity
+
+        Returns:
+            tuple: (job, block_specs) with the (index, start, end) block specifications
+            to download - all pending blocks for a single stream job - or None if
+            there is nothing left to do
+        """
+        with self.condition:
+            while not self.stopped:
+                has_pending = False
+                job_count = len(self.jobs)
+                for offset in range(job_count):
+                    job = self.jobs[(self.next_job + offset) % job_count]
+                    if not job.pending or job.paused:
+                        continue
+                    has_pending = True
+                    connections = self.host_connections.get(job.host, 0)
+                    if connections < self.per_host:
+                        self.host_connections[job.host] = connections + 1
+                        self.next_job = (self.next_job + offset + 1) % job_count
+                        job.active += 1
+                        if job.single_stream:
+                            block_specs, job.pending = job.pending, []
+                        else:
+                            block_specs = [job.pending.pop(0)]
+                        return job, block_specs
+                if not has_pending and not self.resident:
+                    return None
+                self.condition.wait()
+            return None
+
+    def task_done(self, job: BatchJob):
+        with self.condition:
+            self.host_connections[job.host] -= 1
+            job.active -= 1
+            is_done = self.check_done(job)
+            self.condition.notify_all()
+        if is_done:
+            job.finish()
+
+    def work(self):
+        """
+        worker thread loop
+        """
+        while True:
+            task = self.next_task()
+            if task is None:
+                break
+            job, block_specs = task
+            index = block_specs[0][0]
+            try:
+                if job.single_stream:
+                    self.stream(job, block_specs)
+                else:
+                    index, start, end = block_specs[0]
+                    job.bd.download_block(
+                        index, start, end, job.target, job.progress_bar, job.force
+                    )
+                    # a block skipped after a change of the remote file is not processed
+                    if not job.bd.cancel_event.is_set():
+                        job.processed_blocks.add(index)
+            except RemoteFileChanged as ex:
+                self.change(job, ex)
+            except Exception as e:
+                print(f"Error processing block {index} of {job.bd.name}: {e}")
+            finally:
+                self.task_done(job)
+
+    def stream(self, job: BatchJob, block_specs):
+        """
+        download the given blocks of a job whose server ignores ranges
+        with a single request
+        """
+
+        def processed(block):
+            job.processed_blocks.add(block.block)
+
+        job.bd.add_block_callback(processed)
+        try:
+            job.bd.download_single_stream(
+                block_specs, job.target, job.progress_bar, job.force
+            )
+        finally:
+            job.bd.block_callbacks.remove(processed)
+
+    def start(self):
+        """
+        start the worker threads
+        """
+        self.threads = [
+            threading.Thread(target=self.work, name=f"blockbatch-{i}", daemon=self.resident)
+            for i in range(max(1, self.boost))
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        """
+        stop the worker threads after their current block
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.close_sessions()
+
+    def run(self):
+        """
+        download all blocks of all jobs and save the manifests
+        """
+        self.start()
+        for thread in self.threads:
+            thread.join()
+        self.close_sessions()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Download many files with one shared pool of range request workers."
+    )
+    parser.add_argument(
+        "manifest",
+        help="YAML batch manifest or text file with 'url name target' lines",
+    )
+    parser.add_argument(
+        "--boost",
+        type=int,
+        default=4,
+        help="Total number of concurrent download threads (default: 4)",
+    )
+    parser.add_argument(
+        "--per-host",
+        type=int,
+        default=2,
+        help="Maximum concurrent connections per host (default: 2)",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Overwrite existing part files"
+    )
+    parser.add_argument(
+        "--progress", action="store_true", help="Show a tqdm progress bar per file"
+    )
+    parser.add_argument(
+        "--limit-rate", help="Total bandwidth limit e.g. 500K, 10M or 1G bytes/s"
+    )
+    args = parser.parse_args()
+    manifest = BatchManifest.ofFile(args.manifest)
+    rate_limiter = None
+    if args.limit_rate:
+        rate_limiter = RateLimiter(RateLimiter.parse_rate(args.limit_rate))
+    scheduler = BatchScheduler(
+        boost=args.boost,
+        per_host=args.per_host,
+        progress=args.progress,
+        rate_limiter=rate_limiter,
+    )
+    for entry in manifest.downloads:
+        bd = entry.get_block_download()
+        scheduler.add(bd, entry.target, force=args.force)
+    scheduler.run()
+
+
+if __name__ == "__main__":
+    main()
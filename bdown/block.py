@@ -6,12 +6,19 @@ Created on 2025-05-06
 
 import hashlib
 import os
+from collections.abc import Iterable, Iterator, MutableSet
+from contextlib import closing
 from enum import Enum
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 from dataclasses import dataclass
-import requests
 from basemkit.yamlable import lod_storable
-from tqdm import tqdm as Progressbar
+
+from bdown.io_policy import IoPolicy
+
+if TYPE_CHECKING:
+    # requests and tqdm are only imported where they are used to keep the startup fast
+    import requests
+    from tqdm import tqdm as Progressbar
 
 class StatusSymbol(Enum):
     """
@@ -21,13 +28,64 @@ class StatusSymbol(Enum):
     FAIL = "❌"
     WARN = "⚠️"
 
+class BlockBitmap(MutableSet):
+    """
+    a set of block indices kept as a bitmap - one bit per block
+    instead of a Python int object and a hash table slot per index
+    """
+
+    def __init__(self, indices: Iterable[int] = ()):
+        self.bits = bytearray()
+        self.count = 0
+        for index in indices:
+            self.add(index)
+
+    def __contains__(self, index) -> bool:
+        byte, bit = divmod(index, 8)
+        contained = 0 <= byte < len(self.bits) and bool(self.bits[byte] & (1 << bit))
+        return contained
+
+    def __iter__(self) -> Iterator[int]:
+        for byte, value in enumerate(self.bits):
+            if value:
+                for bit in range(8):
+                    if value & (1 << bit):
+                        yield byte * 8 + bit
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __repr__(self) -> str:
+        return f"BlockBitmap({sorted(self)})"
+
+    def add(self, index: int):
+        if index < 0:
+            raise ValueError(f"invalid block index {index}")
+        byte, bit = divmod(index, 8)
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(byte + 1 - len(self.bits)))
+        if not self.bits[byte] & (1 << bit):
+            self.bits[byte] |= 1 << bit
+            self.count += 1
+
+    def discard(self, index: int):
+        if index in self:
+            byte, bit = divmod(index, 8)
+            self.bits[byte] &= ~(1 << bit)
+            self.count -= 1
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.bits)
+
 class Status:
     """
     Track block comparison results and provide symbolic summary.
     """
 
     def __init__(self):
-        self.symbol_blocks = {symbol: set() for symbol in StatusSymbol}
+        # one bitmap per symbol instead of a set of ints per symbol
+        self.symbol_blocks = {symbol: BlockBitmap() for symbol in StatusSymbol}
 
     def update(self, symbol: StatusSymbol, index: int):
         self.symbol_blocks[symbol].add(index)
@@ -65,11 +123,42 @@ class BlockIterator:
     offset: int # offset of the block in the outer file to be reassembled later
     size: int # size of the block
     block_path: str # relative path of the block file
-    progress_bar: Optional[Progressbar] = None
+    progress_bar: Optional["Progressbar"] = None
     target_file: any = None
     target_offset: int = 0 # e.g. for block rechunking
     chunk_size: int=8192 # default chunk size
     hash_total: any =None
+    rate_limiter: any = None # optional shared bandwidth limit
+
+@dataclass
+class ValidationStamp:
+    """
+    identity of a file at the time its digest was verified
+    """
+    size: int
+    mtime_ns: int
+    inode: int
+    md5: str  # the verified full md5 of the block
+
+    @classmethod
+    def ofStat(cls, stat_result: os.stat_result, md5: str) -> "ValidationStamp":
+        stamp = cls(
+            size=stat_result.st_size,
+            mtime_ns=stat_result.st_mtime_ns,
+            inode=stat_result.st_ino,
+            md5=md5,
+        )
+        return stamp
+
+    def matches(self, stat_result: os.stat_result, md5: str) -> bool:
+        """Check if the file is provably unchanged since the given md5 was verified"""
+        matches = (
+            self.size == stat_result.st_size
+            and self.mtime_ns == stat_result.st_mtime_ns
+            and self.inode == stat_result.st_ino
+            and self.md5 == md5
+        )
+        return matches
 
 @lod_storable
 class Block:
@@ -82,6 +171,9 @@ class Block:
     offset: int
     md5: str = ""  # full md5 hash
     md5_head: str = ""  # hash of first chunk
+    size: Optional[int] = None  # size of the block in bytes
+    virtual: Optional[bool] = None  # True if path is the complete source file to be read at offset
+    validated: Optional[ValidationStamp] = None  # validation cache
 
     def is_consistent(self, other: 'Block') -> bool:
         """Check if blocks are consistent"""
@@ -98,6 +190,9 @@ class Block:
 
     def yaml_exists(self, base_path: str) -> bool:
         """Check if the yaml metadata file exists."""
+        if self.virtual:
+            # virtual blocks are only listed in the manifest
+            return True
         yaml_path = self.path.replace('.part', '.yaml')
         full_yaml_path = os.path.join(base_path, yaml_path)
         exists = os.path.exists(full_yaml_path)
@@ -121,12 +216,56 @@ class Block:
 
         return matches
 
-    def is_valid(self, base_path: str, check_head: bool = True) -> bool:
-        """Check if block file exists and passes MD5 validation."""
+    def is_unchanged(self, base_path: str) -> bool:
+        """Check if the block file is provably unchanged since its full md5 was verified."""
+        if not self.validated or not self.md5:
+            return False
+        try:
+            stat_result = os.stat(os.path.join(base_path, self.path))
+        except OSError:
+            return False
+        unchanged = self.validated.matches(stat_result, self.md5)
+        return unchanged
+
+    def stamp(self, base_path: str, stat_before: os.stat_result = None):
+        """
+        Record the identity of the block file after its full md5 has been verified.
+
+        Args:
+            base_path: Directory where the block's relative path is located.
+            stat_before: optional stat taken before hashing - if the file
+                changed in the meantime no stamp is recorded
+        """
+        stat_result = os.stat(os.path.join(base_path, self.path))
+        if stat_before is not None:
+            identity_before = (stat_before.st_size, stat_before.st_mtime_ns, stat_before.st_ino)
+            identity_after = (stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino)
+            if identity_before != identity_after:
+                self.validated = None
+                return
+        self.validated = ValidationStamp.ofStat(stat_result, self.md5)
+
+    def is_valid(
+        self, base_path: str, check_head: bool = True, paranoid: bool = False
+    ) -> bool:
+        """
+        Check if block file exists and passes MD5 validation.
+
+        Args:
+            base_path: Directory where the block's relative path is located.
+            check_head: if True only check md5_head else the full md5
+            paranoid: if True always hash - ignore the validation cache
+
+        Returns:
+            bool: True if the block is valid
+        """
         file_present = self.file_exists(base_path)
         if not file_present:
             return False
 
+        if not paranoid and self.is_unchanged(base_path):
+            return True
+
         if check_head:
             chunk_limit = 1
             expected_hash = self.md5_head
@@ -138,9 +277,14 @@ class Block:
         if not has_expected_hash:
             return False
 
+        stat_before = os.stat(os.path.join(base_path, self.path))
         calculated_hash = self.calc_md5(base_path, chunk_limit=chunk_limit)
         hash_valid = calculated_hash == expected_hash
         valid = file_present and hash_valid
+        if not valid:
+            self.validated = None
+        elif not check_head:
+            self.stamp(base_path, stat_before)
         return valid
 
     def ensure_yaml(self, base_path: str):
@@ -158,6 +302,7 @@ class Block:
         chunk_limit: int = None,
         progress_bar=None,
         seek_to_offset: bool = False,
+        io_policy: IoPolicy = None,
     ) -> str:
         """
         Calculate the MD5 checksum of this block's file.
@@ -168,6 +313,8 @@ class Block:
             chunk_limit: Maximum number of chunks to read (e.g. 1 for md5_head).
             progress_bar: if supplied update the progress_bar
             seek_to_offset: Whether seek to the block's offset (default: False) - needs to be True for non blocked complete files
+                and is implied for virtual blocks. When seeking, at most self.size bytes are read if the size is known.
+            io_policy: the IoPolicy to read with (default: IoPolicy.get_default())
 
         Returns:
             str: The MD5 hexadecimal digest.
@@ -175,12 +322,14 @@ class Block:
         full_path = os.path.join(base_path, self.path)
         hash_md5 = hashlib.md5()
         index = 0
-
-        with open(full_path, "rb") as f:
-            # seek to offset in case self.path is a large file containing multiple blocks
-            if seek_to_offset:
-                f.seek(self.offset)
-            for chunk in iter(lambda: f.read(chunk_size), b""):
+        seek_to_offset = seek_to_offset or bool(self.virtual)
+        # read at the offset in case self.path is a large file containing multiple blocks
+        offset = self.offset if seek_to_offset else 0
+        size = self.size if seek_to_offset else None
+        policy = io_policy or IoPolicy.get_default()
+
+        with closing(policy.read_chunks(full_path, offset, size, chunk_size)) as chunks:
+            for chunk in chunks:
                 hash_md5.update(chunk)
                 index += 1
                 # Update progress bar if provided
@@ -211,33 +360,42 @@ class Block:
         output_path: str,
         chunk_size: int = 1024 * 1024,
         md5 = None,
+        io_policy: IoPolicy = None,
     ) -> int:
         """
         Copy block data from part file to the correct offset in target file
+        - virtual blocks are read at their offset in the source file
 
         Args:
             parts_dir: Directory containing part files
             output_path: Path to output file where block will be copied
             chunk_size: Size of read/write chunks
             md5: Optional hashlib.md5() instance for on-the-fly update
+            io_policy: the IoPolicy to use (default: IoPolicy.get_default())
 
         Returns:
             Number of bytes copied
         """
         part_path = os.path.join(parts_dir, self.path)
         bytes_copied = 0
-
-        with open(part_path, "rb") as part_file:
-            with open(output_path, "r+b") as out_file:
-                out_file.seek(self.offset)
-                while True:
-                    chunk = part_file.read(chunk_size)
-                    if not chunk:
-                        break
-                    out_file.write(chunk)
-                    if md5:
-                        md5.update(chunk)
-                    bytes_copied += len(chunk)
+        policy = io_policy or IoPolicy.get_default()
+        offset = self.offset if self.virtual else 0
+        size = self.size if self.virtual else None
+
+        out_fd = os.open(output_path, os.O_WRONLY)
+        try:
+            for chunk in policy.read_chunks(part_path, offset, size, chunk_size):
+                written = 0
+                while written < len(chunk):
+                    written += os.pwrite(
+                        out_fd, chunk[written:], self.offset + bytes_copied + written
+                    )
+                if md5:
+                    md5.update(chunk)
+                bytes_copied += len(chunk)
+            policy.drop_written(out_fd, self.offset, bytes_copied)
+        finally:
+            os.close(out_fd)
 
         return bytes_copied
 
@@ -302,6 +460,8 @@ class Block:
                 first = False
             if bi.progress_bar:
                 bi.progress_bar.update(len(chunk))
+            if bi.rate_limiter:
+                bi.rate_limiter.consume(len(chunk))
 
         created_block = Block(
             block=bi.index,
@@ -316,7 +476,7 @@ class Block:
     def ofResponse(
         cls,
         bi:BlockIterator,
-        response: requests.Response,
+        response: "requests.Response",
     ) -> "Block":
         """
         Create a Block from a download HTTP response.
@@ -336,20 +496,11 @@ class Block:
         """
         Create a Block from a file.
         """
-        def file_chunk_iterator():
-            with open(source_path, "rb") as f:
-                f.seek(bi.offset)
-                bytes_read = 0
-                while bytes_read < bi.size:
-                    bytes_to_read = min(bi.chunk_size, bi.size - bytes_read)
-                    chunk = f.read(bytes_to_read)
-                    if not chunk:
-                        break
-                    bytes_read += len(chunk)
-                    yield chunk
-
+        chunks = IoPolicy.get_default().read_chunks(
+            source_path, bi.offset, bi.size, bi.chunk_size
+        )
         file_block = cls.ofIterator(
             bi,
-            chunks_iterator=file_chunk_iterator(),
+            chunks_iterator=chunks,
         )
         return file_block
\ No newline at end of file
@@ -8,10 +8,15 @@ import time
 import hashlib
 import os
 from dataclasses import dataclass, field
-from typing import List, Tuple
+from typing import TYPE_CHECKING, List, Optional, Tuple
 
-from tqdm import tqdm as Progressbar
 from bdown.block import Block
+from bdown.block_table import BlockTable
+from bdown.io_policy import IoPolicy
+from bdown.part_layout import PartLayout
+
+if TYPE_CHECKING:
+    from tqdm import tqdm as Progressbar
 
 
 @dataclass
@@ -24,6 +29,8 @@ class BlockFiddler:
     unit: str = "MB"  # KB, MB, or GB
     chunk_size: int = 8192  # size of a response chunk
     md5: str = ""
+    state_db: Optional[str] = None  # optional SQLite state store path
+    part_layout: Optional[str] = None  # flat (default) or sharded - see PartLayout
 
     blocks: List[Block] = field(default_factory=list)
 
@@ -37,6 +44,10 @@ class BlockFiddler:
         }
         if self.unit not in self.unit_multipliers:
             raise ValueError(f"Unsupported unit: {self.unit} - must be KB, MB or GB")
+        # optional compact BlockTable backing the blocks - see set_block_table
+        self.table = None
+        # the layout of the existing part files - a different part_layout asks for a migration
+        self.files_layout = self.part_layout
 
     @property
     def blocksize_bytes(self) -> int:
@@ -60,12 +71,149 @@ class BlockFiddler:
             last_block_size = self.size - same_size_total
         return last_block_size
 
+    @property
+    def state_store(self):
+        """
+        the optional SQLite state store - opened on first use
+        """
+        if not self.state_db:
+            return None
+        if getattr(self, "_state_store", None) is None:
+            from bdown.state_store import SqliteStateStore
+
+            self._state_store = SqliteStateStore(self.state_db)
+        return self._state_store
+
+    def record_block(self, block: Block):
+        """
+        record the given finished block in the state store (if any)
+        """
+        if self.state_store:
+            self.state_store.save_block(self.name, block)
+
+    def export_yaml(self, yaml_path: str = None):
+        """
+        export the blocks of the state store to a YAML manifest
+
+        Args:
+            yaml_path: the path of the YAML file - default: self.yaml_path
+        """
+        yaml_path = yaml_path or getattr(self, "yaml_path", None)
+        if self.state_store:
+            self.blocks = self.state_store.get_blocks(self.name)
+        self.sort_blocks()
+        if yaml_path:
+            self.save_to_yaml_file(yaml_path)
+
+    def get_block(self, index: int) -> Optional[Block]:
+        """
+        get the block with the given index
+
+        Args:
+            index: the block index
+
+        Returns:
+            Block: the block or None if there is no block with this index
+        """
+        if self.table is not None:
+            return self.table.get_block(index)
+        # fast path for a sorted and complete list of blocks
+        if index < len(self.blocks) and self.blocks[index].block == index:
+            return self.blocks[index]
+        for block in self.blocks:
+            if block.block == index:
+                return block
+        return None
+
     def sort_blocks(self):
         """
         Sort the blocks list by block index
         """
+        if self.table is not None:
+            # the lazy blocks of a table are in index order
+            return
         self.blocks.sort(key=lambda b: b.block)
 
+    @property
+    def layout(self) -> PartLayout:
+        """
+        the naming of the part and block YAML files
+        """
+        layout = PartLayout(self.name, self.total_blocks, self.part_layout)
+        return layout
+
+    def part_path(self, index: int) -> str:
+        """
+        the path of the part file of the given block relative to the parts directory
+        """
+        return self.layout.part_path(index)
+
+    def part_yaml_path(self, index: int) -> str:
+        """
+        the path of the block YAML file of the given block relative to the parts directory
+        """
+        return self.layout.yaml_path(index)
+
+    def migrate_parts(self, parts_dir: str) -> int:
+        """
+        move the files of a flat parts directory into the configured layout - the
+        directory is only scanned if the part files are known to be flat, the
+        manifest records the layout once it is saved
+
+        Returns:
+            int: the number of moved blocks
+        """
+        moved = 0
+        layout = self.layout
+        was_flat = (self.files_layout or PartLayout.FLAT) == PartLayout.FLAT
+        if layout.layout != PartLayout.FLAT and was_flat and layout.has_flat_files(parts_dir):
+            moved = layout.migrate(parts_dir, self.blocks)
+            if moved:
+                self.logger.info(f"moved {moved} blocks of {self.name} to the {self.part_layout} layout")
+        self.files_layout = self.part_layout
+        return moved
+
+    def get_block_table(self) -> BlockTable:
+        """
+        get the compact BlockTable of the blocks
+
+        Returns:
+            BlockTable: the backing table or a new table created from the blocks
+        """
+        if self.table is not None:
+            return self.table
+        table = BlockTable.ofBlocks(self.blocks, self.total_blocks, name=self.name, layout=self.layout)
+        return table
+
+    def set_block_table(self, table: BlockTable):
+        """
+        back the blocks by the given table - the blocks become a read only
+        list whose Block objects are only created on access
+        """
+        self.table = table
+        self.blocks = table.as_list()
+
+    def save_table_yaml(self, yaml_path: str):
+        """
+        save the manifest streaming the blocks of the table one at
+        a time instead of creating all Block objects at once
+        """
+        blocks = self.blocks
+        self.blocks = []
+        try:
+            header = self.to_yaml()
+        finally:
+            self.blocks = blocks
+        with open(yaml_path, "w", encoding="utf-8") as yaml_file:
+            yaml_file.write(header)
+            if len(self.table) > 0:
+                yaml_file.write("blocks:\n")
+            for block in self.table.iter_blocks():
+                lines = block.to_yaml().splitlines()
+                yaml_file.write(f"- {lines[0]}\n")
+                for line in lines[1:]:
+                    yaml_file.write(f"  {line}\n")
+
     def format_size(self, size_bytes, unit=None, decimals=2, show_unit: bool = True):
         """
         Format byte size to appropriate units
@@ -173,7 +321,7 @@ class BlockFiddler:
 
         return from_block, to_block, total_bytes
 
-    def get_progress_bar(self, from_block: int, to_block: int = None) -> Progressbar:
+    def get_progress_bar(self, from_block: int, to_block: int = None) -> "Progressbar":
         """
         Create a progress bar for processing a range of blocks.
 
@@ -184,6 +332,8 @@ class BlockFiddler:
         Returns:
             Progressbar: tqdm Progress bar configured with total bytes for the block range
         """
+        from tqdm import tqdm as Progressbar
+
         total_bytes = self.calc_block_range_size_bytes(from_block, to_block)
         progress_bar = Progressbar(total=total_bytes, unit="B", unit_scale=True)
         progress_bar.set_description(f"Processing {self.name}")
@@ -193,15 +343,23 @@ class BlockFiddler:
     def save(self, update_md5_from_total_hash:bool=True):
         """
         Save block metadata to YAML file with optional MD5 update.
+        With a state store only the download metadata is saved to the store.
 
         Args:
             update_md5_from_total_hash: Whether to update MD5 from total_hash before saving
         """
-        self.sort_blocks()
         if not self.md5 or update_md5_from_total_hash:
             self.md5 = self.total_hash.hexdigest()
+        if self.state_store:
+            # blocks are stored one by one - YAML is only written by export_yaml
+            self.state_store.save_download(self)
+            return
+        self.sort_blocks()
         if hasattr(self, "yaml_path") and self.yaml_path:
-            self.save_to_yaml_file(self.yaml_path)
+            if self.table is not None:
+                self.save_table_yaml(self.yaml_path)
+            else:
+                self.save_to_yaml_file(self.yaml_path)
 
     def reassemble(
         self,
@@ -237,6 +395,7 @@ class BlockFiddler:
 
         with open(output_path, "wb") as f:
             f.truncate(self.size)
+            IoPolicy.get_default().preallocate_fd(f.fileno(), self.size)
 
         total = 0
         md5 = hashlib.md5() if compute_md5 else None
@@ -247,17 +406,16 @@ class BlockFiddler:
         else:
             self.sort_blocks()
             blocks_source = self.blocks
+        if on_the_fly:
+            # the blocks of a running download are only known and complete
+            # once their block YAML files show up
+            indices = range(self.total_blocks) if blocks_iterator is None else (block.block for block in blocks_iterator)
+            blocks_source = (
+                self.wait_for_block_availability(parts_dir, index, timeout=timeout)
+                for index in indices
+            )
 
         for block in blocks_source:
-            if on_the_fly:
-                # Wait for both .part and .yaml files
-                self.wait_for_block_availability(parts_dir, block, timeout=timeout)
-                # load block metadata from individual YAML which might
-                # just have gotten available a few msecs ago
-                block_yaml = os.path.join(parts_dir, f"{self.name}-{block.index:04d}.yaml")
-                if os.path.exists(block_yaml):
-                    block = Block.load_from_yaml_file(block_yaml) # @UndefinedVariable
-
             block_size = block.copy_to(parts_dir, output_path, md5=md5)
             total += block_size
             if progress_bar:
@@ -275,33 +433,36 @@ class BlockFiddler:
     def wait_for_block_availability(
         self,
         parts_dir: str,
-        block: Block,
+        index: int,
         sleep_time: float = 0.2,
         timeout: float = 600.0
-    ):
+    ) -> Block:
         """
-        Wait for block file to exist and have correct size
+        Wait for the block YAML file of the given block - it is written
+        after the part file is complete so the size of a part file
+        that is still being written is never trusted
 
         Args:
             parts_dir: Directory containing part files
-            block: Block to wait for
+            index: the index of the block to wait for
             sleep_time: Sleep interval between checks
             timeout: Maximum wait time in seconds
 
+        Returns:
+            Block: the block loaded from its block YAML file
+
         Raises:
             TimeoutError: If block doesn't become available within timeout
         """
-        part_file = os.path.join(parts_dir, f"{block.block_path}")
-        expected_size = block.size
         start_time = time.time()
 
         while True:
-            if os.path.exists(part_file):
-                actual_size = os.path.getsize(part_file)
-                if actual_size == expected_size:
-                    break
+            block_yaml = self.layout.find_yaml(parts_dir, index)
+            if block_yaml:
+                block = Block.load_from_yaml_file(block_yaml) # @UndefinedVariable
+                return block
 
             if time.time() - start_time > timeout:
-                raise TimeoutError(f"Block {block.index} not ready after {timeout}s")
+                raise TimeoutError(f"Block {index} not ready after {timeout}s")
 
             time.sleep(sleep_time)
\ No newline at end of file
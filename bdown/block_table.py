@@ -0,0 +1,243 @@
+"""
+Created on 2025-06-11
+
+@author: wf
+"""
+from array import array
+from collections.abc import Sequence
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from bdown.block import Block, BlockBitmap, ValidationStamp
+from bdown.part_layout import PartLayout
+
+
+class BlockTable:
+    """
+    compact block table for millions of blocks - offsets, sizes, binary
+    digests and validation stamps are kept in parallel arrays indexed by
+    the block index with one state byte per block. Block objects are only
+    created on demand e.g. for the YAML export.
+    """
+
+    PRESENT = 1
+    HAS_MD5 = 2
+    HAS_HEAD = 4
+    HAS_STAMP = 8
+    VIRTUAL = 16
+    HAS_SIZE = 32
+
+    def __init__(
+        self, total_blocks: int, name: str = None, path: str = None, layout: PartLayout = None
+    ):
+        """
+        constructor
+
+        Args:
+            total_blocks: the number of blocks
+            name: the name of the download for the default part file paths
+            path: the path shared by all blocks e.g. the file of a dcheck manifest
+                - default: the part file of each block
+            layout: the naming of the part files - default: flat
+        """
+        self.total_blocks = total_blocks
+        self.name = name
+        self.path = path
+        self.layout = layout or PartLayout(name, total_blocks)
+        self.path_overrides: Dict[int, str] = {}
+        self.state = bytearray(total_blocks)
+        self.offsets = array("q", bytes(8 * total_blocks))
+        self.sizes = array("q", bytes(8 * total_blocks))
+        self.md5s = bytearray(16 * total_blocks)
+        self.heads = bytearray(16 * total_blocks)
+        # validation stamps - the stamped md5 is the md5 of the block
+        self.stamp_sizes = array("q", bytes(8 * total_blocks))
+        self.stamp_mtimes = array("q", bytes(8 * total_blocks))
+        self.stamp_inodes = array("q", bytes(8 * total_blocks))
+        self.count = 0
+
+    @classmethod
+    def ofBlocks(
+        cls, blocks: Iterable[Block], total_blocks: int, name: str = None, layout: PartLayout = None
+    ) -> "BlockTable":
+        """
+        create a block table from the given blocks
+        """
+        table = cls(total_blocks, name=name, layout=layout)
+        for block in blocks:
+            table.add_block(block)
+        return table
+
+    def default_path(self, index: int) -> str:
+        if self.path:
+            return self.path
+        return self.layout.part_path(index)
+
+    def set_block(
+        self,
+        index: int,
+        offset: int,
+        size: int = None,
+        md5: str = None,
+        md5_head: str = None,
+        validated: ValidationStamp = None,
+        path: str = None,
+        virtual: bool = False,
+    ):
+        """
+        set the block with the given index
+        """
+        state = self.PRESENT
+        self.offsets[index] = offset
+        if size is not None:
+            self.sizes[index] = size
+            state |= self.HAS_SIZE
+        if md5:
+            self.md5s[16 * index : 16 * index + 16] = bytes.fromhex(md5)
+            state |= self.HAS_MD5
+        if md5_head:
+            self.heads[16 * index : 16 * index + 16] = bytes.fromhex(md5_head)
+            state |= self.HAS_HEAD
+        if validated is not None and validated.md5 == md5:
+            self.stamp_sizes[index] = validated.size
+            self.stamp_mtimes[index] = validated.mtime_ns
+            self.stamp_inodes[index] = validated.inode
+            state |= self.HAS_STAMP
+        if virtual:
+            state |= self.VIRTUAL
+        if path is not None and path != self.default_path(index):
+            self.path_overrides[index] = path
+        else:
+            self.path_overrides.pop(index, None)
+        if not self.state[index] & self.PRESENT:
+            self.count += 1
+        self.state[index] = state
+
+    def add_block(self, block: Block):
+        self.set_block(
+            block.block,
+            block.offset,
+            size=block.size,
+            md5=block.md5,
+            md5_head=block.md5_head,
+            validated=block.validated,
+            path=block.path,
+            virtual=bool(block.virtual),
+        )
+
+    def has(self, index: int) -> bool:
+        has_block = 0 <= index < self.total_blocks and bool(self.state[index] & self.PRESENT)
+        return has_block
+
+    def md5_digest(self, index: int) -> Optional[bytes]:
+        """
+        the binary md5 of the given block or None if it is not known
+        """
+        if not self.state[index] & self.HAS_MD5:
+            return None
+        return bytes(self.md5s[16 * index : 16 * index + 16])
+
+    def head_digest(self, index: int) -> Optional[bytes]:
+        """
+        the binary md5_head of the given block or None if it is not known
+        """
+        if not self.state[index] & self.HAS_HEAD:
+            return None
+        return bytes(self.heads[16 * index : 16 * index + 16])
+
+    def indices(self) -> Iterator[int]:
+        """
+        the indices of the present blocks in ascending order
+        """
+        for index, state in enumerate(self.state):
+            if state & self.PRESENT:
+                yield index
+
+    def present(self) -> BlockBitmap:
+        present = BlockBitmap(self.indices())
+        return present
+
+    def get_block(self, index: int) -> Optional[Block]:
+        """
+        create the Block object for the given index
+
+        Returns:
+            Block: the block or None if the block is not present
+        """
+        if not self.has(index):
+            return None
+        state = self.state[index]
+        md5_digest = self.md5_digest(index)
+        head_digest = self.head_digest(index)
+        md5 = md5_digest.hex() if md5_digest else ""
+        block = Block(
+            block=index,
+            path=self.path_overrides.get(index, self.default_path(index)),
+            offset=self.offsets[index],
+            md5=md5,
+            md5_head=head_digest.hex() if head_digest else "",
+            size=self.sizes[index] if state & self.HAS_SIZE else None,
+            virtual=True if state & self.VIRTUAL else None,
+        )
+        if state & self.HAS_STAMP:
+            block.validated = ValidationStamp(
+                size=self.stamp_sizes[index],
+                mtime_ns=self.stamp_mtimes[index],
+                inode=self.stamp_inodes[index],
+                md5=md5,
+            )
+        return block
+
+    def iter_blocks(self) -> Iterator[Block]:
+        """
+        create the Block objects of the present blocks one at a time
+        """
+        for index in self.indices():
+            yield self.get_block(index)
+
+    def as_list(self) -> "LazyBlockList":
+        lazy_list = LazyBlockList(self)
+        return lazy_list
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        """
+        the approximate memory used by the arrays
+        """
+        arrays: List = [
+            self.state,
+            self.offsets,
+            self.sizes,
+            self.md5s,
+            self.heads,
+            self.stamp_sizes,
+            self.stamp_mtimes,
+            self.stamp_inodes,
+        ]
+        nbytes = sum(len(a) * getattr(a, "itemsize", 1) for a in arrays)
+        return nbytes
+
+
+class LazyBlockList(Sequence):
+    """
+    read only list of the present blocks of a block table in index
+    order - the Block objects are created on access
+    """
+
+    def __init__(self, table: BlockTable):
+        self.table = table
+        self.indices = array("q", table.indices())
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self.table.get_block(index) for index in self.indices[position]]
+        return self.table.get_block(self.indices[position])
+
+    def __iter__(self) -> Iterator[Block]:
+        for index in self.indices:
+            yield self.table.get_block(index)
@@ -8,22 +8,41 @@ Usage:
   Generate .yaml metadata:
     dcheck --url URL --create [--blocksize SIZE] [--unit UNIT] file
 
+  Generate .yaml metadata for the remote file without downloading it to disk:
+    dcheck --url URL --create --remote [--boost N] file
+
   Compare two files:
     dcheck --url URL file1 file2 [--head-only]
 
   Compare two .yaml files:
     dcheck --url URL file1.yaml file2.yaml [--head-only]
 
+  Compare two files directly reading both in parallel block by block:
+    dcheck --url URL file1 file2 --parallel [--boost N] [--early-exit] [--raw] [--cache-yaml]
+
+  Quick statistical check sampling random sub-ranges of each block:
+    dcheck --url URL file1 file2 --sample N [--sample-kb KB] [--seed SEED]
+    dcheck --url URL file --remote --confidence 0.99 [--corrupt-fraction 0.01]
+
 Created on 2025-05-06
 Author: wf
 """
 import argparse
+import hashlib
+import itertools
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
 from dataclasses import dataclass, field
+from typing import Dict, Iterator, Tuple
 
 from bdown.block import Block, Status, StatusSymbol
 from bdown.block_fiddler import BlockFiddler
+from bdown.block_table import BlockTable
 from bdown.download import BlockDownload
+from bdown.io_policy import IoPolicy
+from bdown.sampling import SampleCheck
 
 
 @dataclass
@@ -36,6 +55,7 @@ class BlockCheck(BlockFiddler):
     file2: str = None
     head_only: bool = False
     create: bool = False
+    paranoid: bool = False  # ignore the validation cache and always rehash
     status: Status = field(default_factory=Status)
 
     def __post_init__(self):
@@ -53,9 +73,13 @@ class BlockCheck(BlockFiddler):
         print(
             f"Processing {path}... (file size: {os.path.getsize(path) / (1024**3):.2f} GB)"
         )
+        bd = None
         if os.path.exists(yaml_path):
             bd = BlockDownload.ofYamlPath(yaml_path)
-        else:
+            if self.paranoid or self.is_stale(bd, path):
+                print(f"{yaml_path} is outdated - recreating")
+                bd = None
+        if bd is None:
             bd = BlockDownload(
                 name=os.path.basename(path),
                 url=url,
@@ -69,6 +93,8 @@ class BlockCheck(BlockFiddler):
             from_block = 0
             _, to_block, _ = bd.compute_total_bytes(from_block)
             progress = bd.get_progress_bar(from_block, to_block)
+            # the blocks are kept in a compact table - each Block is only temporary
+            table = BlockTable(bd.total_blocks, name=bd.name, path=os.path.basename(path))
             with progress:
                 for index, start, end in bd.block_ranges(from_block, to_block):
                     block = Block(
@@ -79,12 +105,14 @@ class BlockCheck(BlockFiddler):
                         os.path.dirname(path), chunk_limit=1, seek_to_offset=True
                     )
                     if not self.head_only:
+                        stat_before = os.stat(path)
                         block.md5 = block.calc_md5(
                             os.path.dirname(path),
                             progress_bar=progress,
                             seek_to_offset=True,
                         )
-                    bd.blocks.append(block)
+                        block.stamp(os.path.dirname(path), stat_before)
+                    table.add_block(block)
                     block_range = self.format_block_index_range(index, to_block)
                     from_size = self.format_size(start, unit="GB", show_unit=False)
                     to_size = self.format_size(end, unit="GB")
@@ -93,13 +121,33 @@ class BlockCheck(BlockFiddler):
                     if self.head_only:
                         progress.update(bd.blocksize_bytes)
             bd.yaml_path = yaml_path
-            bd.sort_blocks()
+            bd.set_block_table(table)
             bd.save()
             formatted_size = bd.format_size(bd.size)
             msg = f"{yaml_path} created with {bd.total_blocks} blocks ({formatted_size} processed)"
             print(msg)
         return bd
 
+    def is_stale(self, bd: BlockDownload, path: str) -> bool:
+        """
+        check whether the blocks of the given manifest have been verified
+        against an older version of the file at the given path
+
+        Args:
+            bd: the manifest
+            path: the path of the file
+
+        Returns:
+            bool: True if the validation cache shows that the file has changed
+        """
+        base_path = os.path.dirname(path)
+        stale = False
+        for block in bd.blocks:
+            if block.validated and not block.is_unchanged(base_path):
+                stale = True
+                break
+        return stale
+
     def generate_yaml(self, url: str):
         self.get_or_create_yaml(path=self.file1, url=url)
 
@@ -132,6 +180,22 @@ class BlockCheck(BlockFiddler):
         bd2 = BlockDownload.ofYamlPath(yaml_file2)
         self.compare_block_downloads(bd1, bd2)
 
+    @staticmethod
+    def common_blocks(blocks1, blocks2) -> Iterator[Tuple[Block, Block]]:
+        """
+        yield the pairs of blocks with the same index of two lists sorted by block index
+        """
+        iter1, iter2 = iter(blocks1), iter(blocks2)
+        block1, block2 = next(iter1, None), next(iter2, None)
+        while block1 is not None and block2 is not None:
+            if block1.block < block2.block:
+                block1 = next(iter1, None)
+            elif block2.block < block1.block:
+                block2 = next(iter2, None)
+            else:
+                yield block1, block2
+                block1, block2 = next(iter1, None), next(iter2, None)
+
     def compare_block_downloads(self, bd1, bd2):
         """
         Compare two BlockDownload instances
@@ -140,10 +204,13 @@ class BlockCheck(BlockFiddler):
             bd1: First BlockDownload instance
             bd2: Second BlockDownload instance
         """
-        b1 = {b.block: b for b in bd1.blocks}
-        b2 = {b.block: b for b in bd2.blocks}
-        common = sorted(set(b1.keys()) & set(b2.keys()))
-        if not common:
+        # walk both sorted block lists side by side - no index is built on top of
+        # the loaded blocks, a table backed manifest provides its blocks lazily
+        bd1.sort_blocks()
+        bd2.sort_blocks()
+        common = self.common_blocks(bd1.blocks, bd2.blocks)
+        first = next(common, None)
+        if first is None:
             print("⚠️  No common block indices between the two BlockDownload instances.")
             return
 
@@ -151,26 +218,206 @@ class BlockCheck(BlockFiddler):
         progress = bd1.get_progress_bar(0, to_block)
 
         with progress:
-            for i in common:
-                block1 = b1[i]
-                block2 = b2[i]
-
+            for block1, block2 in itertools.chain([first], common):
                 md5_1 = block1.md5_head if self.head_only else block1.md5
                 md5_2 = block2.md5_head if self.head_only else block2.md5
 
-                if md5_1 is None or md5_2 is None:
+                if not md5_1 or not md5_2:
                     symbol = StatusSymbol.WARN
                 elif md5_1 == md5_2:
                     symbol = StatusSymbol.SUCCESS
                 else:
                     symbol = StatusSymbol.FAIL
 
-                self.status.update(symbol, i)
+                self.status.update(symbol, block1.block)
                 self.status.set_description(progress)
                 progress.update(bd1.blocksize_bytes)
 
         print("\nFinal:", self.status.summary())
 
+    def compare_block_direct(
+        self,
+        index: int,
+        start: int,
+        size: int,
+        raw: bool,
+        buffer_size: int,
+        stop_event,
+        early_exit: bool = False,
+    ):
+        """
+        compare the given block of both files reading them side by side
+
+        Args:
+            index: the block index
+            start: the offset of the block
+            size: the size of the block
+            raw: if True compare the raw bytes and stop at the first difference
+                instead of comparing digests
+            buffer_size: the read size
+            stop_event: set to skip the block
+            early_exit: if True set the stop_event for a differing block
+
+        Returns:
+            tuple: (StatusSymbol, digests) with digests a list of (md5, md5_head)
+            per file or None for raw comparisons - None if the block was skipped
+        """
+        if stop_event.is_set():
+            return None
+        policy = IoPolicy.get_default()
+        md5s = [hashlib.md5(), hashlib.md5()]
+        heads = [None, None]
+        equal = True
+        with closing(policy.read_chunks(self.file1, start, size, buffer_size)) as chunks1, closing(
+            policy.read_chunks(self.file2, start, size, buffer_size)
+        ) as chunks2:
+            for chunk1, chunk2 in zip(chunks1, chunks2):
+                if raw:
+                    if chunk1 != chunk2:
+                        equal = False
+                        break
+                    continue
+                for i, chunk in enumerate((chunk1, chunk2)):
+                    md5s[i].update(chunk)
+                    if heads[i] is None:
+                        heads[i] = hashlib.md5(chunk[: self.chunk_size]).hexdigest()
+        digests = None
+        if not raw:
+            digests = [(md5s[i].hexdigest(), heads[i]) for i in range(2)]
+            equal = digests[0] == digests[1]
+        symbol = StatusSymbol.SUCCESS if equal else StatusSymbol.FAIL
+        if not equal and early_exit:
+            stop_event.set()
+        return symbol, digests
+
+    def compare_direct(
+        self,
+        url: str = None,
+        workers: int = 2,
+        early_exit: bool = False,
+        raw: bool = False,
+        cache_yaml: bool = False,
+        buffer_size: int = 1024 * 1024,
+    ) -> Status:
+        """
+        compare two files directly - blocks are read from both files side by side
+        on a pool of workers instead of creating both manifests one after the other
+
+        Args:
+            url: the URL for the cached manifests
+            workers: number of blocks compared in parallel
+            early_exit: if True stop at the first differing block
+            raw: if True compare the raw bytes instead of digests
+            cache_yaml: if True save the manifests of both files for later use
+                - needs digests and a complete comparison
+            buffer_size: the read size
+
+        Returns:
+            Status: the per block status
+        """
+        size2 = os.path.getsize(self.file2)
+        if size2 != self.size:
+            print(f"⚠️  size mismatch {self.size} != {size2}")
+        common_size = min(self.size, size2)
+        stop_event = threading.Event()
+        digests: Dict[int, Tuple] = {}
+        progress = self.get_progress_bar(0)
+        with progress, ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = {}
+            for index, start, end in self.block_ranges(0, self.total_blocks - 1):
+                if start >= common_size:
+                    # the block is missing in the shorter file
+                    self.status.update(StatusSymbol.FAIL, index)
+                    continue
+                size = min(end + 1, common_size) - start
+                future = executor.submit(
+                    self.compare_block_direct,
+                    index,
+                    start,
+                    size,
+                    raw and not cache_yaml,
+                    buffer_size,
+                    stop_event,
+                    early_exit,
+                )
+                futures[future] = (index, size)
+            for future in as_completed(futures):
+                index, size = futures[future]
+                result = future.result()
+                if result is None:
+                    continue
+                symbol, block_digests = result
+                self.status.update(symbol, index)
+                if block_digests:
+                    digests[index] = block_digests
+                self.status.set_description(progress)
+                progress.update(size)
+        print("\nFinal:", self.status.summary())
+        if cache_yaml:
+            complete = size2 == self.size and len(digests) == self.total_blocks
+            if complete:
+                for i, path in enumerate((self.file1, self.file2)):
+                    self.save_direct_yaml(path, url, {index: d[i] for index, d in digests.items()})
+            else:
+                print("⚠️  comparison incomplete - manifests not cached")
+        return self.status
+
+    def save_direct_yaml(self, path: str, url: str, digests: Dict[int, Tuple[str, str]]):
+        """
+        save the manifest of the given file from the digests of a direct comparison
+        in the same format as get_or_create_yaml
+        """
+        bd = BlockDownload(
+            name=os.path.basename(path),
+            url=url,
+            blocksize=self.blocksize,
+            unit=self.unit,
+            size=os.path.getsize(path),
+        )
+        table = BlockTable(bd.total_blocks, name=bd.name, path=os.path.basename(path))
+        for index, start, end in bd.block_ranges(0, bd.total_blocks - 1):
+            md5, md5_head = digests[index]
+            block = Block(block=index, offset=start, path=os.path.basename(path))
+            block.size = end - start + 1
+            block.md5 = md5
+            block.md5_head = md5_head
+            block.stamp(os.path.dirname(path))
+            table.add_block(block)
+        bd.set_block_table(table)
+        bd.yaml_path = path + ".yaml"
+        bd.save()
+        print(f"{bd.yaml_path} cached with {bd.total_blocks} blocks")
+
+
+def create_remote_yaml(
+    url: str, path: str, blocksize: int, unit: str, boost: int = 1
+) -> BlockDownload:
+    """
+    create the .yaml metadata for the remote file at the given url
+    as if it was available locally at the given path - the remote
+    ranges are only hashed and never written to disk
+
+    Args:
+        url: the URL of the remote file
+        path: the local path the metadata is for - path.yaml is written
+        blocksize: the block size
+        unit: the block size unit
+        boost: number of parallel range requests
+
+    Returns:
+        BlockDownload: the manifest
+    """
+    bd = BlockDownload(
+        name=os.path.basename(path), url=url, blocksize=blocksize, unit=unit
+    )
+    bd.yaml_path = path + ".yaml"
+    progress = bd.get_progress_bar(0)
+    with progress:
+        bd.hash_remote(boost=boost, progress_bar=progress)
+    formatted_size = bd.format_size(bd.size)
+    print(f"{bd.yaml_path} created with {bd.total_blocks} blocks ({formatted_size} hashed remotely)")
+    return bd
+
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -192,12 +439,134 @@ def parse_args():
         "--unit", choices=["KB", "MB", "GB"], default="MB", help="Block size unit"
     )
     parser.add_argument("--head-only", action="store_true", help="Use md5_head only")
+    parser.add_argument(
+        "--remote",
+        action="store_true",
+        help="with --create hash the remote file at --url via range requests without storing it - with --sample/--confidence sample the remote file as reference",
+    )
+    parser.add_argument(
+        "--boost",
+        type=int,
+        default=1,
+        help="Number of parallel range requests for --remote or blocks compared in parallel with --parallel or --sample (default: 1)",
+    )
+    parser.add_argument(
+        "--paranoid",
+        action="store_true",
+        help="Ignore the validation cache and always rehash",
+    )
+    parser.add_argument(
+        "--parallel",
+        action="store_true",
+        help="compare two files directly reading both side by side in parallel (--boost blocks at a time)",
+    )
+    parser.add_argument(
+        "--early-exit",
+        action="store_true",
+        help="with --parallel stop at the first differing block",
+    )
+    parser.add_argument(
+        "--raw",
+        action="store_true",
+        help="with --parallel compare the raw bytes instead of digests",
+    )
+    parser.add_argument(
+        "--cache-yaml",
+        action="store_true",
+        help="with --parallel save the manifests of both files for later use",
+    )
+    parser.add_argument(
+        "--sample",
+        type=int,
+        default=0,
+        help="compare N random sub-ranges per block instead of hashing every byte (default: 0 - off)",
+    )
+    parser.add_argument(
+        "--confidence",
+        type=float,
+        help="sample as many sub-ranges per block as needed to detect --corrupt-fraction with this confidence e.g. 0.99",
+    )
+    parser.add_argument(
+        "--corrupt-fraction",
+        type=float,
+        default=0.01,
+        help="fraction of a corrupt block the sampling confidence is given for (default: 0.01)",
+    )
+    parser.add_argument(
+        "--sample-kb",
+        type=int,
+        default=64,
+        help="size of a sample in KB (default: 64)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="seed of the reproducible sample positions (default: 0)",
+    )
+    IoPolicy.add_arguments(parser)
     return parser.parse_args()
 
 
+def sample_check(args) -> Status:
+    """
+    sample check the given file against a local or the remote reference
+    """
+    files = args.file
+    samples = args.sample
+    if args.confidence is not None:
+        samples = SampleCheck.samples_for_confidence(args.confidence, args.corrupt_fraction)
+    size = os.path.getsize(files[0])
+    reference_download = None
+    if args.remote:
+        reference_download = BlockDownload(
+            name=os.path.basename(files[0]),
+            url=args.url,
+            blocksize=args.blocksize,
+            unit=args.unit,
+        )
+        fiddler = reference_download
+    else:
+        fiddler = BlockFiddler(
+            name=os.path.basename(files[0]), blocksize=args.blocksize, unit=args.unit, size=size
+        )
+    checker = SampleCheck(
+        fiddler,
+        files[0],
+        reference_path=None if args.remote else files[1],
+        reference_download=reference_download,
+        samples=samples,
+        sample_size=args.sample_kb * 1024,
+        seed=args.seed,
+        workers=args.boost,
+    )
+    progress = fiddler.get_progress_bar(0)
+    checker.progress_bar = progress
+    with progress:
+        status = checker.check()
+    checker.report(args.corrupt_fraction)
+    return status
+
+
 def main():
     args = parse_args()
+    IoPolicy.set_default(IoPolicy.ofArgs(args))
     files = args.file
+    sampling = args.sample > 0 or args.confidence is not None
+    if sampling:
+        if len(files) != (1 if args.remote else 2):
+            print("Usage:\n  check.py --url URL file1 file2 --sample N\n  check.py --url URL file --remote --sample N")
+            return
+        sample_check(args)
+        return
+    if args.remote:
+        if not args.create or len(files) != 1:
+            print("Usage:\n  check.py --url URL --create --remote file")
+            return
+        create_remote_yaml(
+            args.url, files[0], args.blocksize, args.unit, boost=args.boost
+        )
+        return
     checker = BlockCheck(
         name=os.path.basename(files[0]),
         file1=files[0],
@@ -206,9 +575,18 @@ def main():
         unit=args.unit,
         head_only=args.head_only,
         create=args.create,
+        paranoid=args.paranoid,
     )
     if args.create and len(files) == 1:
         checker.generate_yaml(args.url)
+    elif len(files) == 2 and args.parallel:
+        checker.compare_direct(
+            url=args.url,
+            workers=max(2, args.boost),
+            early_exit=args.early_exit,
+            raw=args.raw,
+            cache_yaml=args.cache_yaml,
+        )
     elif len(files) == 2:
         checker.compare(args.url)
     else:
@@ -0,0 +1,250 @@
+"""
+Created on 2025-06-09
+
+@author: wf
+"""
+import hashlib
+import os
+
+from basemkit.yamlable import lod_storable
+
+from bdown.block_fiddler import BlockFiddler
+from bdown.io_policy import IoPolicy
+
+
+@lod_storable
+class ConsumeState:
+    """
+    crash safe progress of a consuming reassembly - the first
+    consumed_blocks blocks are in the output and have been verified
+    """
+
+    name: str
+    output: str
+    consumed_blocks: int = 0
+
+
+class ConsumingReassembler:
+    """
+    reassemble a file from its part files with a peak disk usage near
+    the file size: the first part file becomes the output - unless it is
+    hardlinked e.g. into a content store - and every other part file is
+    removed as soon as it has been copied and verified
+    """
+
+    def __init__(
+        self,
+        fiddler: BlockFiddler,
+        parts_dir: str,
+        output_path: str,
+        progress_bar=None,
+        chunk_size: int = 1024 * 1024,
+        force: bool = False,
+    ):
+        """
+        constructor
+
+        Args:
+            fiddler: the BlockFiddler with the complete manifest
+            parts_dir: directory containing the part files
+            output_path: path of the file to create
+            progress_bar: optional progress bar
+            chunk_size: size of read/write chunks
+            force: if True replace an existing output that has no consume state
+        """
+        self.fiddler = fiddler
+        self.parts_dir = parts_dir
+        self.output_path = output_path
+        self.progress_bar = progress_bar
+        self.chunk_size = chunk_size
+        self.force = force
+        self.state_path = f"{output_path}.consume.yaml"
+        self.state = None
+        self.md5 = hashlib.md5()
+
+    def check_manifest(self):
+        """
+        check that all blocks are known with their md5
+
+        Raises:
+            ValueError: if a block or its md5 is missing - parts are only
+                removed after they have been verified
+        """
+        self.fiddler.sort_blocks()
+        indices = [block.block for block in self.fiddler.blocks]
+        if indices != list(range(self.fiddler.total_blocks)):
+            raise ValueError(f"{self.fiddler.name}: manifest is incomplete")
+        for block in self.fiddler.blocks:
+            if not block.md5:
+                raise ValueError(f"{self.fiddler.name}: block {block.block} has no md5")
+            if block.virtual:
+                raise ValueError(f"{self.fiddler.name}: virtual blocks can not be consumed")
+
+    def block_size(self, index: int) -> int:
+        if index == self.fiddler.total_blocks - 1:
+            size = self.fiddler.last_block_size
+        else:
+            size = self.fiddler.blocksize_bytes
+        return size
+
+    def save_state(self):
+        """
+        atomically save the consume state
+        """
+        tmp_path = f"{self.state_path}.tmp"
+        self.state.save_to_yaml_file(tmp_path)
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+        self.fsync_dir(os.path.dirname(os.path.abspath(self.state_path)))
+
+    @staticmethod
+    def fsync_dir(path: str):
+        """
+        make renames and removals in the given directory durable
+        """
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def load_state(self):
+        """
+        load the state of an interrupted run or start a new one
+
+        Raises:
+            FileExistsError: if the output exists without a consume state and force is not set
+        """
+        if os.path.exists(self.state_path):
+            self.state = ConsumeState.load_from_yaml_file(self.state_path)  # @UndefinedVariable
+        else:
+            if os.path.exists(self.output_path) and self.part_exists(0):
+                if not self.force:
+                    raise FileExistsError(
+                        f"Output file {self.output_path} already exists. Use --force to overwrite."
+                    )
+                # the part files still have all the data - the stale output is replaced
+                os.remove(self.output_path)
+            self.state = ConsumeState(name=self.fiddler.name, output=self.output_path)
+
+    def part_path(self, index: int) -> str:
+        block = self.fiddler.get_block(index)
+        path = os.path.join(self.parts_dir, block.path)
+        return path
+
+    def part_exists(self, index: int) -> bool:
+        exists = os.path.exists(self.part_path(index))
+        return exists
+
+    def is_linked(self, index: int) -> bool:
+        """
+        check whether the part file of the given block has other hardlinks
+        e.g. into a content store - it must not become the output since
+        the output is truncated and written to in place
+        """
+        linked = os.stat(self.part_path(index)).st_nlink > 1
+        return linked
+
+    def hash_output_range(self, offset: int, size: int) -> str:
+        """
+        hash the given range of the output and add it to the total md5
+        """
+        block_md5 = hashlib.md5()
+        for chunk in IoPolicy.get_default().read_chunks(
+            self.output_path, offset, size, self.chunk_size
+        ):
+            block_md5.update(chunk)
+            self.md5.update(chunk)
+        return block_md5.hexdigest()
+
+    def copy_part(self, index: int) -> str:
+        """
+        append the part file of the given block to the output
+
+        Returns:
+            str: the md5 of the copied data
+        """
+        block = self.fiddler.get_block(index)
+        block_md5 = hashlib.md5()
+        policy = IoPolicy.get_default()
+        out_fd = os.open(self.output_path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            # a partial copy of a crashed run is overwritten
+            os.ftruncate(out_fd, block.offset)
+            position = block.offset
+            for chunk in policy.read_chunks(self.part_path(index), 0, None, self.chunk_size):
+                written = 0
+                while written < len(chunk):
+                    written += os.pwrite(out_fd, chunk[written:], position + written)
+                position += len(chunk)
+                block_md5.update(chunk)
+            os.fdatasync(out_fd)
+            policy.drop_written(out_fd, block.offset, position - block.offset)
+        finally:
+            os.close(out_fd)
+        return block_md5.hexdigest()
+
+    def consume_block(self, index: int):
+        """
+        move the block with the given index into the output, verify it
+        and remove its part file
+        """
+        block = self.fiddler.get_block(index)
+        size = self.block_size(index)
+        if index == 0 and not os.path.exists(self.output_path) and not self.is_linked(0):
+            # the first part file becomes the output
+            try:
+                os.rename(self.part_path(0), self.output_path)
+                self.fsync_dir(os.path.dirname(os.path.abspath(self.output_path)))
+            except OSError:
+                # e.g. a different file system - copy instead
+                self.copy_part(0)
+        elif self.part_exists(index):
+            self.copy_part(index)
+        # the part file is gone if it was renamed or removed after
+        # a verified copy in an interrupted run - the output has the data
+        md5 = self.hash_output_range(block.offset, size)
+        if md5 != block.md5:
+            raise ValueError(
+                f"block {index}: md5 {md5} of the output does not match the manifest {block.md5} - part file kept"
+            )
+        self.state.consumed_blocks = index + 1
+        self.save_state()
+        if self.part_exists(index):
+            os.remove(self.part_path(index))
+        if self.progress_bar:
+            self.progress_bar.update(size)
+
+    def reassemble(self) -> str:
+        """
+        reassemble the output consuming the part files - an interrupted
+        run is resumed from the consume state and the manifest
+
+        Returns:
+            str: the md5 hex digest of the output
+        """
+        self.check_manifest()
+        self.load_state()
+        consumed = self.state.consumed_blocks
+        if consumed > 0:
+            # recreate the total md5 of the verified prefix
+            prefix_size = self.fiddler.get_block(consumed - 1).offset + self.block_size(consumed - 1)
+            self.hash_output_range(0, prefix_size)
+            if self.progress_bar:
+                self.progress_bar.update(prefix_size)
+        for index in range(consumed, self.fiddler.total_blocks):
+            self.consume_block(index)
+        # leftovers of an interrupted removal
+        for index in range(consumed):
+            if self.part_exists(index):
+                os.remove(self.part_path(index))
+        os.remove(self.state_path)
+        md5_hex = self.md5.hexdigest()
+        print(f"created {self.output_path} - {self.fiddler.format_size(self.fiddler.size)}\nmd5: {md5_hex}")
+        return md5_hex
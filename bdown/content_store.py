@@ -0,0 +1,139 @@
+"""
+Created on 2025-06-08
+
+@author: wf
+"""
+import errno
+import os
+import shutil
+import threading
+import uuid
+
+
+class ContentStore:
+    """
+    content addressed store of blocks keyed by their md5 digest
+    to deduplicate identical blocks across downloads
+    """
+
+    # ioctl request code of FICLONE on Linux
+    FICLONE = 0x40049409
+
+    def __init__(self, root: str):
+        """
+        constructor
+
+        Args:
+            root: the root directory of the store
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def path_for(self, md5: str) -> str:
+        """
+        get the path of the block with the given digest
+        """
+        path = os.path.join(self.root, md5[:2], md5[2:4], f"{md5}.block")
+        return path
+
+    def has(self, md5: str) -> bool:
+        has_block = bool(md5) and os.path.exists(self.path_for(md5))
+        return has_block
+
+    @classmethod
+    def reflink(cls, src: str, dst: str) -> bool:
+        """
+        try a copy on write clone of src to dst
+
+        Returns:
+            bool: True if the clone was created
+        """
+        try:
+            import fcntl
+        except ImportError:
+            return False
+        with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+            try:
+                fcntl.ioctl(dst_file.fileno(), cls.FICLONE, src_file.fileno())
+                return True
+            except OSError:
+                pass
+        os.remove(dst)
+        return False
+
+    @classmethod
+    def link_or_copy(cls, src: str, dst: str) -> str:
+        """
+        make dst have the content of src by reflink, hardlink or copy
+        - in this order of preference
+
+        Returns:
+            str: the method used - reflink, hardlink or copy
+        """
+        if os.path.exists(dst):
+            os.remove(dst)
+        if cls.reflink(src, dst):
+            return "reflink"
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError as ex:
+            if ex.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+        shutil.copyfile(src, dst)
+        return "copy"
+
+    def add(self, md5: str, src_path: str):
+        """
+        add the given block file to the store if its digest is not known yet
+        """
+        if not md5 or self.has(md5):
+            return
+        store_path = self.path_for(md5)
+        os.makedirs(os.path.dirname(store_path), exist_ok=True)
+        tmp_path = f"{store_path}.{uuid.uuid4().hex}.tmp"
+        self.link_or_copy(src_path, tmp_path)
+        os.replace(tmp_path, store_path)
+
+    def fetch(self, md5: str, dst_path: str) -> bool:
+        """
+        provide the block with the given digest at dst_path
+
+        Args:
+            md5: the expected digest
+            dst_path: where to put the block
+
+        Returns:
+            bool: True on a hit, False if the block is not in the store
+        """
+        if not self.has(md5):
+            with self.lock:
+                self.misses += 1
+            return False
+        store_path = self.path_for(md5)
+        self.link_or_copy(store_path, dst_path)
+        with self.lock:
+            self.hits += 1
+            self.bytes_saved += os.path.getsize(store_path)
+        return True
+
+    def count_miss(self):
+        with self.lock:
+            self.misses += 1
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return rate
+
+    def summary(self) -> str:
+        summary = (
+            f"dedup: {self.hits} hits, {self.misses} misses "
+            f"({self.hit_rate:.0%}), {self.bytes_saved / (1024 * 1024):.1f} MB saved"
+        )
+        return summary
@@ -0,0 +1,442 @@
+"""
+Long running block download daemon with a local JSON job API
+
+Usage:
+    blockdaemon [--state-dir DIR] [--port 8765] [--socket PATH] [--boost 8]
+
+API:
+    GET  /jobs               list all jobs
+    POST /jobs               submit a job {"url":..., "name":..., "target":...}
+    GET  /jobs/{id}          query a job
+    POST /jobs/{id}/pause    pause a job
+    POST /jobs/{id}/resume   resume a paused job
+    POST /jobs/{id}/cancel   cancel a job
+
+All jobs share one BatchScheduler i.e. one worker pool with
+per host connection caps and an optional bandwidth limit.
+The job list is kept in {state-dir}/jobs.yaml and the block state
+in the usual {target}/{name}.yaml manifests so that jobs
+are resumed after a restart.
+
+Created on 2025-06-03
+
+@author: wf
+"""
+import argparse
+import json
+import os
+import socketserver
+import threading
+import uuid
+from dataclasses import field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from basemkit.yamlable import lod_storable
+
+from bdown.batch import BatchEntry, BatchJob, BatchScheduler
+from bdown.download import BlockDownload
+from bdown.rate_limit import RateLimiter
+
+
+@lod_storable
+class DownloadJob:
+    """
+    a download job of the daemon
+    """
+
+    url: str
+    name: str
+    target: str
+    blocksize: int = 32
+    unit: str = "MB"
+    size: Optional[int] = None
+    id: Optional[str] = None
+    state: str = "queued"  # queued, running, paused, reassembling, cancelled, done, failed
+    output: Optional[str] = None  # optional path of the reassembled file
+    force: bool = False
+    message: Optional[str] = None
+
+    def get_block_download(self) -> BlockDownload:
+        """
+        get the BlockDownload for this job - resuming from
+        an existing manifest if there is one
+        """
+        entry = BatchEntry(
+            url=self.url,
+            name=self.name,
+            target=self.target,
+            blocksize=self.blocksize,
+            unit=self.unit,
+            size=self.size,
+        )
+        bd = entry.get_block_download()
+        return bd
+
+    def as_dict(self, batch_job: BatchJob = None) -> dict:
+        """
+        get my json compatible status
+        """
+        status = self.to_dict()
+        if batch_job:
+            status["blocks_total"] = len(batch_job.expected_blocks)
+            status["blocks_done"] = len(batch_job.processed_blocks)
+        return status
+
+
+@lod_storable
+class JobRegistry:
+    """
+    the persistent list of jobs
+    """
+
+    jobs: List[DownloadJob] = field(default_factory=list)
+
+
+class DownloadDaemon:
+    """
+    a resident block downloader sharing one scheduler across jobs
+    """
+
+    def __init__(
+        self,
+        state_dir: str,
+        boost: int = 4,
+        per_host: int = 2,
+        rate_limit: float = None,
+    ):
+        """
+        constructor
+
+        Args:
+            state_dir: directory for the persistent job list
+            boost: total number of concurrent download threads
+            per_host: maximum number of concurrent connections per host
+            rate_limit: optional total bandwidth limit in bytes/s
+        """
+        self.state_dir = state_dir
+        os.makedirs(state_dir, exist_ok=True)
+        self.registry_path = os.path.join(state_dir, "jobs.yaml")
+        rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.scheduler = BatchScheduler(
+            boost=boost, per_host=per_host, resident=True, rate_limiter=rate_limiter
+        )
+        self.lock = threading.RLock()
+        self.jobs: Dict[str, DownloadJob] = {}
+        self.batch_jobs: Dict[str, BatchJob] = {}
+        self.servers = []
+
+    def save_registry(self):
+        with self.lock:
+            registry = JobRegistry(jobs=list(self.jobs.values()))
+            tmp_path = self.registry_path + ".tmp"
+            registry.save_to_yaml_file(tmp_path)
+            os.replace(tmp_path, self.registry_path)
+
+    def load_registry(self):
+        """
+        reload the jobs of a previous run and resume the unfinished ones
+        """
+        if not os.path.exists(self.registry_path):
+            return
+        registry = JobRegistry.load_from_yaml_file(self.registry_path)  # @UndefinedVariable
+        for job in registry.jobs:
+            self.jobs[job.id] = job
+            if job.state in ("queued", "running", "paused"):
+                self.schedule(job)
+
+    def start(self):
+        """
+        start the scheduler and resume the jobs of a previous run
+        """
+        self.scheduler.start()
+        self.load_registry()
+
+    def stop(self):
+        """
+        stop serving and downloading - the state is kept for a restart
+        """
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        self.scheduler.stop()
+        self.save_registry()
+
+    def schedule(self, job: DownloadJob):
+        """
+        hand the given job over to the scheduler
+        """
+        try:
+            bd = job.get_block_download()
+            batch_job = self.scheduler.add(
+                bd,
+                job.target,
+                force=job.force,
+                paused=job.state == "paused",
+                on_finish=lambda batch_job, job=job: self.on_finish(job, batch_job),
+            )
+            with self.lock:
+                self.batch_jobs[job.id] = batch_job
+                if job.state == "queued":
+                    job.state = "running"
+        except Exception as ex:
+            with self.lock:
+                job.state = "failed"
+                job.message = str(ex)
+        self.save_registry()
+
+    def on_finish(self, job: DownloadJob, batch_job: BatchJob):
+        """
+        callback for finished jobs
+        """
+        with self.lock:
+            if batch_job.cancelled:
+                job.state = "cancelled"
+            elif batch_job.changed:
+                job.state = "failed"
+                job.message = str(batch_job.changed)
+            elif batch_job.missed_blocks:
+                job.state = "failed"
+                job.message = f"missing blocks: {sorted(batch_job.missed_blocks)}"
+            elif job.output:
+                job.state = "reassembling"
+            else:
+                job.state = "done"
+        if job.state == "reassembling":
+            try:
+                md5 = batch_job.bd.reassemble(job.target, job.output, force=True)
+                batch_job.bd.md5 = md5
+                batch_job.bd.save(update_md5_from_total_hash=False)
+                state = "done"
+            except Exception as ex:
+                state = "failed"
+                job.message = str(ex)
+            with self.lock:
+                job.state = state
+        self.save_registry()
+
+    def submit(self, spec: dict) -> DownloadJob:
+        """
+        submit a new job
+
+        Args:
+            spec: dict with at least url, name and target
+
+        Returns:
+            DownloadJob: the new job
+        """
+        for key in ("url", "name", "target"):
+            if not spec.get(key):
+                raise ValueError(f"missing {key}")
+        job = DownloadJob.from_dict(spec)  # @UndefinedVariable
+        job.id = uuid.uuid4().hex[:12]
+        job.state = "queued"
+        with self.lock:
+            self.jobs[job.id] = job
+        self.schedule(job)
+        return job
+
+    def get_job(self, job_id: str) -> DownloadJob:
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        return job
+
+    def status(self, job_id: str) -> dict:
+        job = self.get_job(job_id)
+        status = job.as_dict(self.batch_jobs.get(job_id))
+        return status
+
+    def list_jobs(self) -> List[dict]:
+        with self.lock:
+            job_ids = list(self.jobs.keys())
+        status_list = [self.status(job_id) for job_id in job_ids]
+        return status_list
+
+    def pause(self, job_id: str) -> dict:
+        job = self.get_job(job_id)
+        batch_job = self.batch_jobs.get(job_id)
+        if job.state == "running" and batch_job:
+            self.scheduler.pause(batch_job)
+            job.state = "paused"
+            self.save_registry()
+        return self.status(job_id)
+
+    def resume(self, job_id: str) -> dict:
+        job = self.get_job(job_id)
+        batch_job = self.batch_jobs.get(job_id)
+        if job.state == "paused" and batch_job:
+            job.state = "running"
+            self.scheduler.resume(batch_job)
+            self.save_registry()
+        return self.status(job_id)
+
+    def cancel(self, job_id: str) -> dict:
+        job = self.get_job(job_id)
+        batch_job = self.batch_jobs.get(job_id)
+        if job.state in ("queued", "running", "paused"):
+            if batch_job:
+                self.scheduler.cancel(batch_job)
+            else:
+                job.state = "cancelled"
+                self.save_registry()
+        return self.status(job_id)
+
+    def handle(self, method: str, path: str, body: dict):
+        """
+        dispatch an API request
+
+        Returns:
+            tuple: (http status, json compatible result)
+        """
+        parts = [part for part in path.split("?")[0].split("/") if part]
+        try:
+            if parts == ["jobs"] and method == "GET":
+                return 200, self.list_jobs()
+            if parts == ["jobs"] and method == "POST":
+                job = self.submit(body)
+                return 201, self.status(job.id)
+            if len(parts) == 2 and parts[0] == "jobs" and method == "GET":
+                return 200, self.status(parts[1])
+            if len(parts) == 3 and parts[0] == "jobs" and method == "POST":
+                actions = {
+                    "pause": self.pause,
+                    "resume": self.resume,
+                    "cancel": self.cancel,
+                }
+                action = actions.get(parts[2])
+                if action:
+                    return 200, action(parts[1])
+        except KeyError as ex:
+            return 404, {"error": f"unknown job {ex}"}
+        except (ValueError, TypeError) as ex:
+            return 400, {"error": str(ex)}
+        return 404, {"error": f"unknown endpoint {method} {path}"}
+
+    def get_handler_class(self):
+        daemon = self
+
+        class JobRequestHandler(BaseHTTPRequestHandler):
+            """
+            JSON job API request handler
+            """
+
+            def address_string(self):
+                # unix socket clients have no address
+                if isinstance(self.client_address, tuple):
+                    return self.client_address[0]
+                return "unix"
+
+            def log_message(self, format, *args):  # @ReservedAssignment
+                pass
+
+            def reply(self, method: str):
+                body = {}
+                length = int(self.headers.get("Content-Length", 0))
+                if length:
+                    try:
+                        body = json.loads(self.rfile.read(length))
+                    except json.JSONDecodeError as ex:
+                        body = None
+                        status, result = 400, {"error": f"invalid json: {ex}"}
+                if body is not None:
+                    status, result = daemon.handle(method, self.path, body)
+                content = json.dumps(result, indent=2).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                self.reply("GET")
+
+            def do_POST(self):
+                self.reply("POST")
+
+        return JobRequestHandler
+
+    def serve_http(self, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+        """
+        serve the job API via HTTP in a background thread
+        """
+        server = ThreadingHTTPServer((host, port), self.get_handler_class())
+        server.daemon_threads = True
+        self.serve(server)
+        return server
+
+    def serve_unix(self, socket_path: str):
+        """
+        serve the job API via a unix domain socket in a background thread
+        """
+
+        class ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = ThreadingUnixServer(socket_path, self.get_handler_class())
+        self.serve(server)
+        return server
+
+    def serve(self, server):
+        self.servers.append(server)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Resident block downloader with a local JSON job API."
+    )
+    parser.add_argument(
+        "--state-dir",
+        default=os.path.join(os.path.expanduser("~"), ".blockdownload"),
+        help="Directory for the persistent job list (default: ~/.blockdownload)",
+    )
+    parser.add_argument(
+        "--host", default="127.0.0.1", help="HTTP bind address (default: 127.0.0.1)"
+    )
+    parser.add_argument(
+        "--port", type=int, default=8765, help="HTTP port (default: 8765)"
+    )
+    parser.add_argument("--socket", help="Path of a unix domain socket to serve instead of HTTP")
+    parser.add_argument(
+        "--boost",
+        type=int,
+        default=4,
+        help="Total number of concurrent download threads (default: 4)",
+    )
+    parser.add_argument(
+        "--per-host",
+        type=int,
+        default=2,
+        help="Maximum concurrent connections per host (default: 2)",
+    )
+    parser.add_argument(
+        "--limit-rate", help="Total bandwidth limit e.g. 500K, 10M or 1G bytes/s"
+    )
+    args = parser.parse_args()
+    rate_limit = RateLimiter.parse_rate(args.limit_rate) if args.limit_rate else None
+    daemon = DownloadDaemon(
+        state_dir=args.state_dir,
+        boost=args.boost,
+        per_host=args.per_host,
+        rate_limit=rate_limit,
+    )
+    daemon.start()
+    if args.socket:
+        daemon.serve_unix(args.socket)
+        print(f"blockdaemon listening on {args.socket}")
+    else:
+        daemon.serve_http(args.host, args.port)
+        print(f"blockdaemon listening on http://{args.host}:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        daemon.stop()
+
+
+if __name__ == "__main__":
+    main()
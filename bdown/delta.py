@@ -0,0 +1,168 @@
+"""
+Created on 2025-06-08
+
+@author: wf
+"""
+import os
+from typing import List
+
+from bdown.block import Block, StatusSymbol
+from bdown.check import BlockCheck
+from bdown.download import BlockDownload
+from bdown.filesplitter import FileSplitter
+
+
+class DeltaUpdate:
+    """
+    update to a new version of a remote file by copying the unchanged
+    blocks from a local older copy and downloading only the changed blocks
+    """
+
+    def __init__(
+        self,
+        reference_path: str,
+        reference: BlockDownload,
+        expected: BlockDownload,
+        target: str,
+        buffer_size: int = 4 * 1024 * 1024,
+    ):
+        """
+        constructor
+
+        Args:
+            reference_path: path of the local older copy
+            reference: the manifest of the older copy e.g. from dcheck --create
+            expected: the manifest with the expected hashes of the new remote file
+            target: directory for the .part files of the new version
+            buffer_size: buffer size of the pread/pwrite copy fallback
+        """
+        if reference.blocksize_bytes != expected.blocksize_bytes:
+            raise ValueError(
+                f"block size mismatch: reference {reference.blocksize}{reference.unit} "
+                f"!= expected {expected.blocksize}{expected.unit}"
+            )
+        self.reference_path = reference_path
+        self.reference = reference
+        self.expected = expected
+        self.target = target
+        self.buffer_size = buffer_size
+        self.unchanged_blocks: List[int] = []
+        self.copied_bytes = 0
+
+    @classmethod
+    def ofPaths(
+        cls,
+        reference_path: str,
+        expected_yaml: str,
+        target: str,
+        reference_yaml: str = None,
+    ) -> "DeltaUpdate":
+        """
+        create a delta update from the given paths
+
+        Args:
+            reference_path: path of the local older copy
+            expected_yaml: manifest of the new remote file
+            target: directory for the .part files of the new version
+            reference_yaml: manifest of the older copy - default: reference_path + ".yaml"
+        """
+        reference_yaml = reference_yaml or reference_path + ".yaml"
+        reference = BlockDownload.ofYamlPath(reference_yaml)
+        expected = BlockDownload.ofYamlPath(expected_yaml)
+        for block in expected.blocks:
+            # the stamps of the publisher do not apply to our part files
+            block.validated = None
+        expected.yaml_path = os.path.join(target, f"{expected.name}.yaml")
+        delta = cls(reference_path, reference, expected, target)
+        return delta
+
+    def compare(self) -> List[int]:
+        """
+        compare the reference and the expected manifest
+
+        Returns:
+            List[int]: the indices of the unchanged blocks
+        """
+        checker = BlockCheck(
+            name=self.expected.name,
+            file1=self.reference_path,
+            blocksize=self.expected.blocksize,
+            unit=self.expected.unit,
+        )
+        checker.compare_block_downloads(self.reference, self.expected)
+        self.unchanged_blocks = sorted(checker.status.symbol_blocks[StatusSymbol.SUCCESS])
+        return self.unchanged_blocks
+
+    def copy_unchanged(self, progress_bar=None):
+        """
+        copy the unchanged blocks from the reference file to part files
+        using a kernel copy
+        """
+        os.makedirs(self.target, exist_ok=True)
+        block_ranges = {
+            index: (start, end)
+            for index, start, end in self.expected.block_ranges(
+                0, self.expected.total_blocks - 1
+            )
+        }
+        src_fd = os.open(self.reference_path, os.O_RDONLY)
+        try:
+            for index in self.unchanged_blocks:
+                start, end = block_ranges[index]
+                block_size = end - start + 1
+                reference_block = self.reference.get_block(index)
+                expected_block = self.expected.get_block(index)
+                part_name = self.expected.part_path(index)
+                part_path = os.path.join(self.target, part_name)
+                os.makedirs(os.path.dirname(part_path), exist_ok=True)
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                dst_fd = os.open(part_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                try:
+                    FileSplitter.copy_range(
+                        src_fd, dst_fd, reference_block.offset, block_size, self.buffer_size
+                    )
+                finally:
+                    os.close(dst_fd)
+                block = Block(
+                    block=index,
+                    path=part_name,
+                    offset=start,
+                    md5=expected_block.md5,
+                    md5_head=expected_block.md5_head,
+                )
+                block.save_to_yaml_file(os.path.join(self.target, self.expected.part_yaml_path(index)))
+                self.copied_bytes += block_size
+                if progress_bar:
+                    progress_bar.set_description(f"Copying {part_name}")
+                    progress_bar.update(block_size)
+        finally:
+            os.close(src_fd)
+
+    def update(self, boost: int = 1, progress_bar=None) -> BlockDownload:
+        """
+        run the delta update - unchanged blocks are copied locally, all
+        other blocks are downloaded
+
+        Args:
+            boost: number of parallel download threads
+            progress_bar: optional progress bar
+
+        Returns:
+            BlockDownload: the download of the new version
+        """
+        self.compare()
+        self.copy_unchanged(progress_bar)
+        # the copied blocks are valid and skipped
+        self.expected.download(self.target, boost=boost, progress_bar=progress_bar)
+        return self.expected
+
+    def summary(self) -> str:
+        total = self.expected.total_blocks
+        copied = len(self.unchanged_blocks)
+        summary = (
+            f"delta: {copied}/{total} blocks copied locally "
+            f"({self.expected.format_size(self.copied_bytes)}), "
+            f"{total - copied} blocks downloaded"
+        )
+        return summary
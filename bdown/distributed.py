@@ -0,0 +1,615 @@
+"""
+Distributed block download - a coordinator hands out block range leases
+to workers on several hosts and merges their block manifests
+
+Usage:
+    blockcluster coordinator URL TARGET --name NAME [--port 8766] [--range-blocks 8] [--lease-timeout 120] [--local-workers N]
+    blockcluster worker COORDINATOR_URL TARGET [--boost 4] [--worker-id ID]
+
+API of the coordinator:
+    POST /leases                  acquire a lease {"worker":...}
+    POST /leases/{id}/renew       extend a lease
+    POST /leases/{id}/complete    hand in the blocks of a lease {"blocks":[...]}
+    POST /leases/{id}/fail        give a lease back
+    GET  /status                  progress of the distributed download
+
+A lease that is not renewed within the lease timeout expires and its
+block range is handed out again. The merged manifest is kept in
+{TARGET}/{NAME}.yaml so that a restarted coordinator only hands out
+the missing blocks. Each worker writes its part files to its own TARGET -
+with a shared TARGET e.g. local processes or a network file system the
+coordinator can reassemble the file.
+
+Created on 2025-06-11
+
+@author: wf
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from basemkit.yamlable import lod_storable
+
+from bdown.block import Block
+from bdown.download import BlockDownload
+
+
+@lod_storable
+class Lease:
+    """
+    a block range leased to a worker
+    """
+
+    id: str
+    worker: str
+    from_block: int
+    to_block: int
+    expires: float
+    state: str = "leased"  # leased, expired, failed, done
+
+
+class DownloadCoordinator:
+    """
+    hand out block ranges of a download to workers and merge the
+    block manifests they hand in
+    """
+
+    def __init__(
+        self,
+        bd: BlockDownload,
+        target: str,
+        range_blocks: int = 8,
+        lease_timeout: float = 120.0,
+    ):
+        """
+        constructor
+
+        Args:
+            bd: the download with the merged manifest
+            target: directory of the merged manifest
+            range_blocks: number of blocks per lease
+            lease_timeout: seconds after which a lease that has not been renewed expires
+        """
+        self.bd = bd
+        self.target = target
+        self.range_blocks = max(1, range_blocks)
+        self.lease_timeout = lease_timeout
+        self.lock = threading.RLock()
+        self.leases: Dict[str, Lease] = {}
+        self.pending: Deque[Tuple[int, int]] = deque()
+        self.done_ranges: Set[Tuple[int, int]] = set()
+        self.ranges = self.create_ranges()
+        self.pending.extend(self.ranges)
+        self.finished = threading.Event()
+        self.servers = []
+        if not self.ranges:
+            self.finished.set()
+
+    def create_ranges(self) -> List[Tuple[int, int]]:
+        """
+        split the blocks that are not in the merged manifest yet into ranges
+        """
+        present = {block.block for block in self.bd.blocks if block.md5}
+        ranges = []
+        start = None
+        for index in range(self.bd.total_blocks + 1):
+            missing = index < self.bd.total_blocks and index not in present
+            if missing and start is None:
+                start = index
+            range_full = start is not None and index - start == self.range_blocks
+            if start is not None and (not missing or range_full):
+                ranges.append((start, index - 1))
+                start = index if missing else None
+        return ranges
+
+    def expire_leases(self, now: float):
+        """
+        hand the ranges of overdue leases out again
+        """
+        for lease in self.leases.values():
+            if lease.state == "leased" and lease.expires < now:
+                lease.state = "expired"
+                block_range = (lease.from_block, lease.to_block)
+                if block_range not in self.done_ranges:
+                    self.pending.appendleft(block_range)
+
+    def acquire(self, worker: str) -> dict:
+        """
+        acquire a lease for the given worker
+
+        Returns:
+            dict: the lease with the download parameters, {"wait": True} if all
+            ranges are leased but not done yet or {"done": True}
+        """
+        with self.lock:
+            now = time.time()
+            self.expire_leases(now)
+            while self.pending and self.pending[0] in self.done_ranges:
+                self.pending.popleft()
+            if not self.pending:
+                if self.finished.is_set():
+                    return {"done": True}
+                return {"wait": True}
+            from_block, to_block = self.pending.popleft()
+            lease = Lease(
+                id=uuid.uuid4().hex[:12],
+                worker=worker,
+                from_block=from_block,
+                to_block=to_block,
+                expires=now + self.lease_timeout,
+            )
+            self.leases[lease.id] = lease
+        result = lease.to_dict()
+        result["lease_timeout"] = self.lease_timeout
+        result["download"] = {
+            "name": self.bd.name,
+            "url": self.bd.url,
+            "blocksize": self.bd.blocksize,
+            "unit": self.bd.unit,
+            "size": self.bd.size,
+            "etag": self.bd.etag,
+            "last_modified": self.bd.last_modified,
+            "part_layout": self.bd.part_layout,
+        }
+        return result
+
+    def get_lease(self, lease_id: str) -> Lease:
+        lease = self.leases.get(lease_id)
+        if lease is None:
+            raise KeyError(lease_id)
+        return lease
+
+    def renew(self, lease_id: str) -> dict:
+        """
+        extend the given lease
+
+        Raises:
+            ValueError: if the lease has expired - the range might have been handed out again
+        """
+        with self.lock:
+            lease = self.get_lease(lease_id)
+            if lease.state != "leased":
+                raise ValueError(f"lease {lease_id} is {lease.state}")
+            lease.expires = time.time() + self.lease_timeout
+        return lease.to_dict()
+
+    def fail(self, lease_id: str) -> dict:
+        """
+        give the range of the given lease back
+        """
+        with self.lock:
+            lease = self.get_lease(lease_id)
+            if lease.state == "leased":
+                lease.state = "failed"
+                self.pending.appendleft((lease.from_block, lease.to_block))
+        return lease.to_dict()
+
+    def complete(self, lease_id: str, block_records: List[dict]) -> dict:
+        """
+        merge the blocks of the given lease into the manifest - blocks of an
+        expired lease are still welcome if they are consistent
+
+        Args:
+            lease_id: the id of the lease
+            block_records: the blocks as dicts
+
+        Raises:
+            ValueError: if the blocks do not cover the range or conflict with the manifest
+        """
+        with self.lock:
+            lease = self.get_lease(lease_id)
+            blocks = [Block.from_dict(record) for record in block_records]  # @UndefinedVariable
+            self.merge_blocks(lease, blocks)
+            lease.state = "done"
+            self.done_ranges.add((lease.from_block, lease.to_block))
+            self.bd.save(update_md5_from_total_hash=False)
+            if len(self.done_ranges) == len(self.ranges):
+                self.finished.set()
+        return lease.to_dict()
+
+    def merge_blocks(self, lease: Lease, blocks: List[Block]):
+        """
+        merge the given blocks of a lease into the manifest
+
+        Raises:
+            ValueError: if the blocks do not cover the range of the lease or conflict with the manifest
+        """
+        indices = sorted(block.block for block in blocks)
+        if indices != list(range(lease.from_block, lease.to_block + 1)):
+            raise ValueError(
+                f"lease {lease.id} needs blocks {lease.from_block}-{lease.to_block} but got {indices}"
+            )
+        for block in blocks:
+            if not block.md5 or block.offset != block.block * self.bd.blocksize_bytes:
+                raise ValueError(f"invalid block {block.block} from {lease.worker}")
+            existing = self.bd.get_block(block.block)
+            if existing is not None and existing.md5 and not existing.is_consistent(block):
+                raise ValueError(
+                    f"block {block.block} from {lease.worker} md5 {block.md5} conflicts with {existing.md5}"
+                )
+        merged = {block.block: block for block in self.bd.blocks}
+        for block in blocks:
+            # the validation stamp is only meaningful on the host of the worker
+            block.validated = None
+            merged[block.block] = block
+        self.bd.blocks = list(merged.values())
+        self.bd.sort_blocks()
+
+    def status(self) -> dict:
+        with self.lock:
+            states = [lease.state for lease in self.leases.values()]
+            workers: Dict[str, int] = {}
+            for lease in self.leases.values():
+                if lease.state == "done":
+                    blocks = lease.to_block - lease.from_block + 1
+                    workers[lease.worker] = workers.get(lease.worker, 0) + blocks
+            status = {
+                "name": self.bd.name,
+                "ranges": len(self.ranges),
+                "done": len(self.done_ranges),
+                "leased": states.count("leased"),
+                "expired": states.count("expired"),
+                "blocks": len(self.bd.blocks),
+                "total_blocks": self.bd.total_blocks,
+                "workers": workers,
+                "finished": self.finished.is_set(),
+            }
+        return status
+
+    def handle(self, method: str, path: str, body: dict):
+        """
+        dispatch an API request
+
+        Returns:
+            tuple: (http status, json compatible result)
+        """
+        parts = [part for part in path.split("?")[0].split("/") if part]
+        try:
+            if parts == ["status"] and method == "GET":
+                return 200, self.status()
+            if parts == ["leases"] and method == "POST":
+                return 200, self.acquire(body.get("worker", "anonymous"))
+            if len(parts) == 3 and parts[0] == "leases" and method == "POST":
+                lease_id, action = parts[1], parts[2]
+                if action == "renew":
+                    return 200, self.renew(lease_id)
+                if action == "fail":
+                    return 200, self.fail(lease_id)
+                if action == "complete":
+                    return 200, self.complete(lease_id, body.get("blocks", []))
+        except KeyError as ex:
+            return 404, {"error": f"unknown lease {ex}"}
+        except (ValueError, TypeError) as ex:
+            return 409, {"error": str(ex)}
+        return 404, {"error": f"unknown endpoint {method} {path}"}
+
+    def get_handler_class(self):
+        coordinator = self
+
+        class LeaseRequestHandler(BaseHTTPRequestHandler):
+            """
+            JSON lease API request handler
+            """
+
+            def log_message(self, format, *args):  # @ReservedAssignment
+                pass
+
+            def reply(self, method: str):
+                body = {}
+                length = int(self.headers.get("Content-Length", 0))
+                if length:
+                    try:
+                        body = json.loads(self.rfile.read(length))
+                    except json.JSONDecodeError as ex:
+                        body = None
+                        status, result = 400, {"error": f"invalid json: {ex}"}
+                if body is not None:
+                    status, result = coordinator.handle(method, self.path, body)
+                content = json.dumps(result, indent=2).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                self.reply("GET")
+
+            def do_POST(self):
+                self.reply("POST")
+
+        return LeaseRequestHandler
+
+    def serve_http(self, host: str = "127.0.0.1", port: int = 8766) -> ThreadingHTTPServer:
+        """
+        serve the lease API via HTTP in a background thread
+        """
+        server = ThreadingHTTPServer((host, port), self.get_handler_class())
+        server.daemon_threads = True
+        self.servers.append(server)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server
+
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def spawn_local_workers(self, api_url: str, count: int, boost: int = 1) -> List[subprocess.Popen]:
+        """
+        start workers as local processes sharing the target directory - a
+        stand-in for workers on several hosts
+        """
+        processes = []
+        for i in range(count):
+            cmd = [
+                sys.executable,
+                "-m",
+                "bdown.distributed",
+                "worker",
+                api_url,
+                self.target,
+                "--boost",
+                str(boost),
+                "--worker-id",
+                f"{socket.gethostname()}-local{i}",
+            ]
+            processes.append(subprocess.Popen(cmd))
+        return processes
+
+
+class DownloadWorker:
+    """
+    download the block ranges leased from a coordinator
+    """
+
+    def __init__(
+        self,
+        api_url: str,
+        target: str,
+        boost: int = 1,
+        worker_id: str = None,
+        poll_interval: float = 0.5,
+        max_failures: int = 5,
+    ):
+        """
+        constructor
+
+        Args:
+            api_url: the URL of the coordinator
+            target: directory for the part files of this worker
+            boost: number of parallel download threads
+            worker_id: the name of this worker - default: host name and process id
+            poll_interval: seconds to wait when all ranges are leased to other workers
+            max_failures: number of failed leases in a row after which the worker gives up
+        """
+        self.api_url = api_url.rstrip("/")
+        self.target = target
+        self.boost = boost
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.poll_interval = poll_interval
+        self.max_failures = max_failures
+        self.completed_leases = 0
+        self.failed_leases = 0
+
+    def api(self, path: str, body: dict = None) -> dict:
+        """
+        call the coordinator API
+
+        Raises:
+            ValueError: if the coordinator rejects the request
+        """
+        data = json.dumps(body).encode() if body is not None else None
+        method = "POST" if body is not None else "GET"
+        request = urllib.request.Request(f"{self.api_url}{path}", data=data, method=method)
+        request.add_header("Content-Type", "application/json")
+        try:
+            with urllib.request.urlopen(request) as response:
+                result = json.loads(response.read())
+        except urllib.error.HTTPError as ex:
+            raise ValueError(f"{path}: HTTP {ex.code} {ex.read().decode()}") from ex
+        return result
+
+    def keep_alive(self, lease: dict, stop_event: threading.Event):
+        """
+        renew the given lease until the stop event is set
+        """
+        interval = max(0.05, lease["lease_timeout"] / 3)
+        while not stop_event.wait(interval):
+            try:
+                self.api(f"/leases/{lease['id']}/renew", {})
+            except ValueError:
+                # the lease has expired - the blocks are still handed in
+                return
+
+    def load_existing_blocks(self, bd: BlockDownload, from_block: int, to_block: int):
+        """
+        take the complete blocks of the given range that are already in the
+        target directory e.g. from a lost worker on a shared target - a
+        part file without its block YAML is incomplete and removed
+        """
+        layout = bd.layout
+        for index in range(from_block, to_block + 1):
+            block_yaml = layout.find_yaml(self.target, index)
+            if block_yaml:
+                bd.blocks.append(Block.load_from_yaml_file(block_yaml))  # @UndefinedVariable
+                continue
+            part_file = os.path.join(self.target, bd.part_path(index))
+            if os.path.exists(part_file):
+                os.remove(part_file)
+
+    def work_lease(self, lease: dict) -> bool:
+        """
+        download the block range of the given lease and hand in its blocks - a
+        lease that fails or whose blocks are rejected is given back
+
+        Returns:
+            bool: True if the coordinator accepted the blocks
+        """
+        from_block, to_block = lease["from_block"], lease["to_block"]
+        stop_event = threading.Event()
+        heartbeat = threading.Thread(target=self.keep_alive, args=(lease, stop_event), daemon=True)
+        heartbeat.start()
+        try:
+            bd = BlockDownload(**lease["download"])
+            self.load_existing_blocks(bd, from_block, to_block)
+            bd.download(
+                self.target,
+                from_block=from_block,
+                to_block=to_block,
+                boost=self.boost,
+            )
+            blocks = [block.to_dict() for block in bd.blocks if from_block <= block.block <= to_block]
+            self.api(f"/leases/{lease['id']}/complete", {"blocks": blocks})
+        except Exception as ex:
+            print(f"{self.worker_id}: lease {lease['id']} of blocks {from_block}-{to_block} failed: {ex}")
+            try:
+                self.api(f"/leases/{lease['id']}/fail", {})
+            except ValueError:
+                # e.g. a restarted coordinator that does not know the lease anymore
+                pass
+            return False
+        finally:
+            stop_event.set()
+            heartbeat.join()
+        return True
+
+    def run(self) -> int:
+        """
+        work on leases until the coordinator has no more blocks
+
+        Returns:
+            int: the number of completed leases
+
+        Raises:
+            RuntimeError: if max_failures leases failed in a row
+        """
+        os.makedirs(self.target, exist_ok=True)
+        failures = 0
+        while True:
+            lease = self.api("/leases", {"worker": self.worker_id})
+            if lease.get("done"):
+                break
+            if lease.get("wait"):
+                time.sleep(self.poll_interval)
+                continue
+            if self.work_lease(lease):
+                self.completed_leases += 1
+                failures = 0
+                continue
+            self.failed_leases += 1
+            failures += 1
+            if failures >= self.max_failures:
+                raise RuntimeError(f"{self.worker_id}: {failures} leases failed in a row")
+            time.sleep(self.poll_interval)
+        return self.completed_leases
+
+
+def coordinate(args) -> Optional[str]:
+    """
+    run a coordinator until all blocks have been merged
+
+    Returns:
+        str: the md5 of the reassembled file or None
+    """
+    yaml_path = os.path.join(args.target, f"{args.name}.yaml")
+    os.makedirs(args.target, exist_ok=True)
+    if os.path.exists(yaml_path):
+        bd = BlockDownload.ofYamlPath(yaml_path)
+    else:
+        bd = BlockDownload(name=args.name, url=args.url, blocksize=args.blocksize, unit=args.unit)
+        bd.yaml_path = yaml_path
+        bd.save(update_md5_from_total_hash=False)
+    coordinator = DownloadCoordinator(
+        bd, args.target, range_blocks=args.range_blocks, lease_timeout=args.lease_timeout
+    )
+    server = coordinator.serve_http(args.host, args.port)
+    host, port = server.server_address
+    api_url = f"http://{host}:{port}"
+    print(f"blockcluster coordinator for {bd.name} listening on {api_url}")
+    processes = coordinator.spawn_local_workers(api_url, args.local_workers, args.boost)
+    try:
+        while not coordinator.finished.wait(1.0):
+            pass
+        # let the workers get their done answer
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        return None
+    finally:
+        coordinator.stop()
+    print(f"merged {len(bd.blocks)} blocks into {yaml_path}")
+    md5 = None
+    if args.output:
+        md5 = bd.reassemble(args.target, args.output, force=True)
+        bd.md5 = md5
+        bd.save(update_md5_from_total_hash=False)
+    return md5
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Distributed block download with a coordinator and several workers."
+    )
+    subparsers = parser.add_subparsers(dest="role", required=True)
+    coordinator_parser = subparsers.add_parser("coordinator", help="hand out block ranges and merge the manifests")
+    coordinator_parser.add_argument("url", help="URL to download from")
+    coordinator_parser.add_argument("target", help="directory of the merged manifest")
+    coordinator_parser.add_argument("--name", required=True, help="name of the download")
+    coordinator_parser.add_argument("--blocksize", type=int, default=32, help="Block size (default: 32)")
+    coordinator_parser.add_argument(
+        "--unit", choices=["KB", "MB", "GB"], default="MB", help="Block size unit (default: MB)"
+    )
+    coordinator_parser.add_argument("--host", default="127.0.0.1", help="HTTP bind address (default: 127.0.0.1)")
+    coordinator_parser.add_argument("--port", type=int, default=8766, help="HTTP port (default: 8766)")
+    coordinator_parser.add_argument(
+        "--range-blocks", type=int, default=8, help="number of blocks per lease (default: 8)"
+    )
+    coordinator_parser.add_argument(
+        "--lease-timeout",
+        type=float,
+        default=120.0,
+        help="seconds after which a lease that has not been renewed is handed out again (default: 120)",
+    )
+    coordinator_parser.add_argument(
+        "--local-workers",
+        type=int,
+        default=0,
+        help="number of local worker processes sharing the target directory (default: 0)",
+    )
+    coordinator_parser.add_argument(
+        "--boost", type=int, default=1, help="download threads per local worker (default: 1)"
+    )
+    coordinator_parser.add_argument(
+        "--output", help="reassemble the file once all blocks are merged - needs a shared target directory"
+    )
+    worker_parser = subparsers.add_parser("worker", help="download the block ranges leased from a coordinator")
+    worker_parser.add_argument("coordinator", help="URL of the coordinator e.g. http://host:8766")
+    worker_parser.add_argument("target", help="directory for the part files")
+    worker_parser.add_argument("--boost", type=int, default=1, help="download threads (default: 1)")
+    worker_parser.add_argument("--worker-id", help="name of the worker (default: host name and process id)")
+    args = parser.parse_args()
+    if args.role == "coordinator":
+        coordinate(args)
+    else:
+        worker = DownloadWorker(args.coordinator, args.target, boost=args.boost, worker_id=args.worker_id)
+        leases = worker.run()
+        print(f"{worker.worker_id}: {leases} leases completed")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,21 +4,41 @@ Created on 2025-05-05
 @author: wf
 """
 from concurrent.futures import ThreadPoolExecutor
-import glob
+import io
 import os
-from queue import Queue
+from queue import Full, Queue
+import re
 import subprocess
-from threading import Lock
-from typing import List
+from threading import Event, Lock, Thread, get_ident
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Iterator, List, Optional, Tuple
 
 from bdown.block import Block, StatusSymbol, BlockIterator
 from bdown.block_fiddler import BlockFiddler
 from basemkit.yamlable import lod_storable
-import requests
+
+if TYPE_CHECKING:
+    # the HTTP stack is only imported when there is something to download
+    import requests
+
+class RemoteFileChanged(Exception):
+    """
+    the remote file has changed since its validators were pinned -
+    blocks of the old and the new version must not be mixed
+    """
+
+
+class RangeNotSupported(Exception):
+    """
+    the server ignores range requests and sends the full body
+    """
+
 
 @lod_storable
 class BlockDownload(BlockFiddler):
     url: str = None
+    # validators of the remote file pinned at the start of the download
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
 
     def __post_init__(self):
         """
@@ -30,6 +50,31 @@ class BlockDownload(BlockFiddler):
         self.progress_lock = Lock()
         # Add a queue for thread-safe block collection
         self.block_queue = Queue()
+        # optional RateLimiter shared e.g. by all jobs of a daemon
+        self.rate_limiter = None
+        # optional requests.Session shared e.g. by all jobs of a host in a batch
+        self.session = None
+        # validation of existing blocks: full md5 instead of md5_head
+        self.full_check = False
+        # validation of existing blocks: ignore the validation cache
+        self.paranoid = False
+        # optional ContentStore to deduplicate blocks by their md5
+        self.content_store = None
+        # optional reference manifest with the known good md5 of each block
+        self.reference = None
+        # alternative URLs of the same file to refetch blocks from
+        self.mirrors = []
+        # number of refetches of a block that does not match the reference
+        self.max_retries = 2
+        # callables called with each completed Block - see add_block_callback
+        self.block_callbacks = []
+        # set to stop starting further blocks e.g. when a consumer stops iterating
+        self.cancel_event = Event()
+        self.validator_lock = Lock()
+        # range request support of the server - None: not probed yet
+        self.range_support = None
+        # a manifest with a known size skips the HEAD request - the pinned
+        # validators are checked with each range request instead
         if self.size is None:
             self.size = self.get_remote_file_size()
 
@@ -74,6 +119,103 @@ class BlockDownload(BlockFiddler):
         block_download.set_blocks_state()
         return block_download
 
+    @classmethod
+    def ofStateStore(cls, state_db: str, name: str):
+        """
+        load the download with the given name from a SQLite state store
+
+        Args:
+            state_db: path of the SQLite database
+            name: the name of the download
+
+        Returns:
+            BlockDownload: the download or None if the store does not know it
+        """
+        from bdown.state_store import SqliteStateStore
+
+        store = SqliteStateStore(state_db)
+        record = store.load_download(name)
+        if record is None:
+            store.close()
+            return None
+        block_download = cls(**record, state_db=state_db)
+        block_download._state_store = store
+        block_download.blocks = store.get_blocks(name)
+        return block_download
+
+    def set_reference(self, reference: BlockFiddler):
+        """
+        set the reference manifest e.g. from dcheck --create by the publisher
+        to check each downloaded block against
+
+        Args:
+            reference: the reference manifest
+
+        Raises:
+            ValueError: if the block geometry of the reference does not match
+        """
+        geometry_matches = (
+            reference.size == self.size
+            and reference.blocksize_bytes == self.blocksize_bytes
+        )
+        if not geometry_matches:
+            raise ValueError(
+                f"reference {reference.name} ({reference.size} bytes, {reference.blocksize}{reference.unit} blocks) "
+                f"does not match {self.name} ({self.size} bytes, {self.blocksize}{self.unit} blocks)"
+            )
+        self.reference = reference
+
+    def get_expected_block(self, index: int) -> Block:
+        """
+        get the block with the known good md5 for the given index
+
+        Returns:
+            Block: the reference block, the manifest block or None if no md5 is known
+        """
+        expected_block = None
+        if self.reference:
+            expected_block = self.reference.get_block(index)
+        if expected_block is None or not expected_block.md5:
+            expected_block = self.get_block(index)
+        if expected_block is not None and not expected_block.md5:
+            expected_block = None
+        return expected_block
+
+    def fetch_verified(self, index: int, block_size: int, fetch, progress_bar=None) -> Block:
+        """
+        fetch a block and check its md5 against the reference as soon as its
+        stream ends - a mismatch triggers a refetch from the next mirror
+
+        Args:
+            index: the block index
+            block_size: the size of the block
+            fetch: callable that fetches the block from the given url
+            progress_bar: optional progress bar to roll back on a mismatch
+
+        Returns:
+            Block: the verified block
+
+        Raises:
+            ValueError: if the block still does not match after max_retries refetches
+        """
+        expected_block = self.reference.get_block(index) if self.reference else None
+        urls = [self.url] + list(self.mirrors)
+        for attempt in range(self.max_retries + 1):
+            url = urls[attempt % len(urls)]
+            block = fetch(url)
+            if expected_block is None or not expected_block.md5:
+                return block
+            if block.md5 == expected_block.md5:
+                return block
+            self.logger.warning(
+                f"❌ block {index} from {url}: md5 {block.md5} != reference {expected_block.md5} - refetching"
+            )
+            if progress_bar:
+                progress_bar.update(-block_size)
+        raise ValueError(
+            f"block {index} does not match the reference md5 {expected_block.md5} after {self.max_retries} refetches"
+        )
+
     def set_blocks_state(self):
         # Determine final state
         no_issues = len(self.issues) == 0
@@ -84,7 +226,7 @@ class BlockDownload(BlockFiddler):
         elif len(self.blocks) == 0:
             self.blocks_state = "stub_empty"
         else:
-            self.self.blocks_state= "incomplete_inconsistent"
+            self.blocks_state = "incomplete_inconsistent"
 
     def check_blocks_from_part_yaml_files(self):
         """
@@ -115,10 +257,11 @@ class BlockDownload(BlockFiddler):
             else:
                 self.blocks_by_index[block.block] = block
 
-        # Check part files
+        # Check part files - flat directories are still read for a sharded layout
+        layout = self.layout
         for bi in range(self.total_blocks):
-            block_yaml = os.path.join(yaml_dir, f"{self.name}-{bi:04d}.yaml")
-            part_file_exists = os.path.exists(block_yaml)
+            block_yaml = layout.find_yaml(yaml_dir, bi)
+            part_file_exists = block_yaml is not None
 
             if part_file_exists:
                 part_block = Block.load_from_yaml_file(block_yaml) # @UndefinedVariable
@@ -136,11 +279,127 @@ class BlockDownload(BlockFiddler):
                         add_issue(self.issues, bi, "inconsistent")
 
     def get_remote_file_size(self) -> int:
+        import requests
+
         response = requests.head(self.url, allow_redirects=True)
         response.raise_for_status()
         file_size = int(response.headers.get("Content-Length", 0))
+        self.pin_validators(response.headers)
         return file_size
 
+    def http(self):
+        """
+        the requests API for range requests - the shared session
+        with its pooled keep-alive connections if there is one
+        """
+        if self.session is not None:
+            return self.session
+        import requests
+
+        return requests
+
+    def pin_validators(self, headers):
+        """
+        pin the ETag and Last-Modified validators from the given response
+        headers if none have been pinned yet
+        """
+        with self.validator_lock:
+            if self.etag is None and self.last_modified is None:
+                self.etag = headers.get("ETag")
+                self.last_modified = headers.get("Last-Modified")
+
+    def supports_ranges(self) -> bool:
+        """
+        check whether the server supports range requests - the result of
+        the probe is kept for the lifetime of this download
+
+        Returns:
+            bool: True if a test range is answered with 206 and a matching Content-Range
+        """
+        if self.range_support is None:
+            self.range_support = self.probe_range_support()
+        return self.range_support
+
+    def probe_range_support(self) -> bool:
+        """
+        probe the range support of the server with a test range - an
+        Accept-Ranges header alone is not trusted
+        """
+        if self.size is not None and self.size <= 1:
+            # a test range can not be told apart from the full body
+            return False
+        try:
+            response = self.get_range_response(0, 0)
+        except RangeNotSupported as ex:
+            self.logger.warning(f"⚠️ {ex}")
+            return False
+        response.close()
+        accept_ranges = response.headers.get("Accept-Ranges", "bytes")
+        supported = accept_ranges.lower() != "none"
+        return supported
+
+    def check_content_range(self, response: "requests.Response", start: int, end: int):
+        """
+        check the range of a 206 response
+
+        Raises:
+            RemoteFileChanged: if the total size differs from the known size
+            IOError: if the Content-Range does not match the requested range
+        """
+        content_range = response.headers.get("Content-Range", "")
+        match = re.match(r"bytes (\d+)-(\d+)/(\d+|\*)", content_range)
+        if self.size is not None:
+            end = min(end, self.size - 1)
+        if match is None or (int(match.group(1)), int(match.group(2))) != (start, end):
+            response.close()
+            raise IOError(
+                f"{self.url}: Content-Range '{content_range}' does not match the requested range {start}-{end}"
+            )
+        total = match.group(3)
+        if total != "*" and self.size is not None and int(total) != self.size:
+            response.close()
+            raise RemoteFileChanged(f"{self.url}: size changed from {self.size} to {total}")
+
+    @property
+    def if_range(self) -> Optional[str]:
+        """
+        the If-Range value for range requests - a weak ETag
+        can not be used so Last-Modified is the fallback
+        """
+        if self.etag and not self.etag.startswith("W/"):
+            return self.etag
+        return self.last_modified
+
+    def check_validators(self, response: "requests.Response", if_range: Optional[str]):
+        """
+        check the response of a range request against the pinned validators
+
+        Args:
+            response: the response
+            if_range: the If-Range value that was sent or None
+
+        Raises:
+            RemoteFileChanged: if the remote file has changed
+        """
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if self.etag:
+            same = etag == self.etag
+            changed = etag is not None and not same
+        else:
+            same = last_modified is not None and last_modified == self.last_modified
+            changed = bool(self.last_modified and last_modified) and not same
+        if if_range is not None and response.status_code == 200 and not same:
+            # the full body answer to If-Range of a changed file - with unchanged
+            # validators the server just does not support ranges
+            changed = True
+        if changed:
+            response.close()
+            raise RemoteFileChanged(
+                f"{self.url} changed: ETag {etag} Last-Modified {last_modified} - pinned ETag {self.etag} Last-Modified {self.last_modified}"
+            )
+        self.pin_validators(response.headers)
+
     def boosted_download(self, block_specs, target, progress_bar, boost, force):
         """Handle parallel downloading of blocks with proper tracking"""
         processed_blocks = set()
@@ -153,15 +412,48 @@ class BlockDownload(BlockFiddler):
                 futures.append((index, future))
 
             # Wait for all tasks to complete and track which completed successfully
+            changed = None
             for index, future in futures:
                 try:
                     future.result()
                     processed_blocks.add(index)
+                except RemoteFileChanged as ex:
+                    changed = ex
                 except Exception as e:
                     print(f"Error processing block {index}: {e}")
+        if changed:
+            raise changed
 
         return processed_blocks
 
+    def prepare_download(
+        self, target: str, from_block: int = 0, to_block: int = None
+    ) -> List[Tuple[int, int, int]]:
+        """
+        Prepare the target directory and metadata for downloading a block range.
+
+        Args:
+            target: Directory to store .part files.
+            from_block: Index of the first block to download.
+            to_block: Index of the last block (inclusive), or None to download until end.
+
+        Returns:
+            List of (index, start, end) block specifications to download.
+        """
+        if self.size is None:
+            self.size = self.get_remote_file_size()
+        os.makedirs(target, exist_ok=True)
+        # part files of a flat directory are moved to a sharded layout
+        self.migrate_parts(target)
+
+        if to_block is None:
+            to_block = self.total_blocks - 1
+
+        block_specs = self.block_ranges(from_block, to_block)
+        # Save YAML early for otf synchronization
+        self.save()
+        return block_specs
+
     def download(
         self,
         target: str,
@@ -169,7 +461,8 @@ class BlockDownload(BlockFiddler):
         to_block: int = None,
         boost: int = 1,
         progress_bar=None,
-        force: bool=False
+        force: bool=False,
+        block_indices: List[int] = None,
     ):
         """
         Download selected blocks and save them to individual .part files.
@@ -181,31 +474,32 @@ class BlockDownload(BlockFiddler):
             boost: Number of parallel download threads to use (default: 1 = serial).
             progress_bar: Optional tqdm-compatible progress bar for visual feedback.
             force: if True override existing files unconditionally
+            block_indices: optional list of block indices to download e.g. the bad blocks of a verify run
         """
-        if self.size is None:
-            self.size = self.get_remote_file_size()
-        os.makedirs(target, exist_ok=True)
+        block_specs = self.prepare_download(target, from_block, to_block)
+        if block_indices is not None:
+            wanted = set(block_indices)
+            block_specs = [spec for spec in block_specs if spec[0] in wanted]
 
-        if to_block is None:
-            total_blocks = (
-                self.size + self.blocksize_bytes - 1
-            ) // self.blocksize_bytes
-            to_block = total_blocks - 1
-
-        block_specs = self.block_ranges(from_block, to_block)
-        # Save YAML early for otf synchronization
-        self.save()
-
-        if boost == 1:
-            for index, start, end in block_specs:
-                self.download_block(index, start, end, target, progress_bar,force)
-        else:
-            boosted_blocks=self.boosted_download(block_specs, target, progress_bar, boost,force)
-            # Check if we processed all expected blocks
-            expected_blocks = set(range(from_block, to_block + 1))
-            missed_blocks = expected_blocks - boosted_blocks
-            if missed_blocks:
-                print(f"{StatusSymbol.WARN}: Failed to process blocks: {sorted(missed_blocks)}")
+        try:
+            if block_specs and not self.supports_ranges():
+                self.logger.warning(f"⚠️ {self.url} does not support range requests - using a single stream")
+                self.download_single_stream(block_specs, target, progress_bar, force)
+            elif boost == 1:
+                for index, start, end in block_specs:
+                    self.download_block(index, start, end, target, progress_bar,force)
+            else:
+                boosted_blocks=self.boosted_download(block_specs, target, progress_bar, boost,force)
+                # Check if we processed all expected blocks
+                expected_blocks = {index for index, _start, _end in block_specs}
+                missed_blocks = expected_blocks - boosted_blocks
+                if missed_blocks:
+                    print(f"{StatusSymbol.WARN}: Failed to process blocks: {sorted(missed_blocks)}")
+        except RemoteFileChanged:
+            # the cancel only stopped the remaining blocks of this run - all of
+            # them are done now so a later download must not return at once
+            self.cancel_event.clear()
+            raise
 
         # After all downloads are complete, collect and save the blocks
         self.save_blocks(target)
@@ -229,6 +523,131 @@ class BlockDownload(BlockFiddler):
                 msg=f"{self.name} {self.block_range_str()}"
                 progress_bar.set_description(msg)
 
+    def add_block_callback(self, callback: Callable[[Block], None]):
+        """
+        add a callback that is called with each completed Block - downloaded,
+        taken from the content store or already valid - as soon as it has landed.
+        The callback runs on the download thread of the block so a slow
+        callback throttles the download.
+
+        Args:
+            callback: the callable to call with the Block
+        """
+        self.block_callbacks.append(callback)
+
+    def notify_block(self, block: Block):
+        """
+        call the block callbacks for the given completed block
+        """
+        for callback in self.block_callbacks:
+            callback(block)
+
+    def iter_completed_blocks(
+        self,
+        target: str,
+        from_block: int = 0,
+        to_block: int = None,
+        boost: int = 1,
+        progress_bar=None,
+        force: bool = False,
+        block_indices: List[int] = None,
+        max_pending: int = None,
+    ) -> Iterator[Block]:
+        """
+        Download like download() in a background thread and yield each Block with
+        its path, offset and digests as soon as it has been completed.
+
+        Args:
+            target: Directory to store .part files.
+            from_block: Index of the first block to download.
+            to_block: Index of the last block (inclusive), or None to download until end.
+            boost: Number of parallel download threads to use.
+            progress_bar: Optional tqdm-compatible progress bar.
+            force: if True override existing files unconditionally
+            block_indices: optional list of block indices to download
+            max_pending: maximum number of completed blocks waiting for the
+                consumer (default: boost) - download threads wait while it is reached
+
+        Yields:
+            Block: the completed blocks in completion order
+
+        Raises:
+            Exception: the error of the background download
+        """
+        pending = Queue(maxsize=max_pending or max(1, boost))
+        done = object()
+        errors = []
+
+        def enqueue(block: Block):
+            # the bounded queue throttles the download threads
+            while not self.cancel_event.is_set():
+                try:
+                    pending.put(block, timeout=0.1)
+                    return
+                except Full:
+                    pass
+
+        def run():
+            try:
+                self.download(
+                    target,
+                    from_block=from_block,
+                    to_block=to_block,
+                    boost=boost,
+                    progress_bar=progress_bar,
+                    force=force,
+                    block_indices=block_indices,
+                )
+            except Exception as ex:
+                errors.append(ex)
+            finally:
+                enqueue(done)
+
+        self.cancel_event.clear()
+        self.add_block_callback(enqueue)
+        thread = Thread(target=run, name=f"{self.name}-download", daemon=True)
+        thread.start()
+        try:
+            while True:
+                block = pending.get()
+                if block is done:
+                    break
+                yield block
+        finally:
+            # the consumer might have stopped early - let the download finish
+            self.cancel_event.set()
+            thread.join()
+            self.block_callbacks.remove(enqueue)
+            self.cancel_event.clear()
+        if errors:
+            raise errors[0]
+
+    async def aiter_completed_blocks(self, target: str, **kwargs) -> AsyncIterator[Block]:
+        """
+        async variant of iter_completed_blocks - the download runs in threads
+        and the blocks are handed over to the event loop
+
+        Args:
+            target: Directory to store .part files.
+            **kwargs: the other arguments of iter_completed_blocks
+
+        Yields:
+            Block: the completed blocks in completion order
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        blocks = self.iter_completed_blocks(target, **kwargs)
+        done = object()
+        try:
+            while True:
+                block = await loop.run_in_executor(None, next, blocks, done)
+                if block is done:
+                    break
+                yield block
+        finally:
+            await loop.run_in_executor(None, blocks.close)
+
     def download_block(
         self,
         index: int,
@@ -255,18 +674,107 @@ class BlockDownload(BlockFiddler):
             - Updates progress bar
             - Adds block to thread-safe queue
         """
-        part_name = f"{self.name}-{index:04d}"
-        part_file = os.path.join(target, f"{part_name}.part")
-        block_yaml_path = os.path.join(target, f"{part_name}.yaml")
+        if self.cancel_event.is_set():
+            return
+        part_name = self.part_path(index)
+        part_file = os.path.join(target, part_name)
+        block_yaml_path = os.path.join(target, self.part_yaml_path(index))
         block_size = end - start + 1
 
-        # Check existing block using Block methods
-        has_existing_block = index < len(self.blocks)
-        if has_existing_block:
-            existing_block = self.blocks[index]
-            existing_block.path = part_name + ".part"  # Set relative path for validation
+        if not self.needs_download(index, target, progress_bar, block_size, force):
+            return
 
-            block_is_valid = existing_block.is_valid(target, check_head=True)
+        os.makedirs(os.path.dirname(part_file), exist_ok=True)
+        if self.content_store:
+            stored_block = None
+            expected_block = self.get_expected_block(index)
+            if expected_block is not None and not force:
+                stored_block = self.fetch_from_store(
+                    expected_block, part_file, block_yaml_path
+                )
+            else:
+                self.content_store.count_miss()
+            if stored_block:
+                if progress_bar:
+                    progress_bar.update(block_size)
+                stored_block.stamp(target)
+                self.record_block(stored_block)
+                self.block_queue.put(stored_block)
+                self.notify_block(stored_block)
+                return
+
+        # Download new block
+        self.logger.info(f"Downloading block {index}: bytes {start}-{end}")
+        self.update_progress(progress_bar, index + 1)
+
+        # each attempt goes to a temporary file - only a verified block replaces the part file
+        tmp_file = self.tmp_part_file(part_file)
+        expected_block = self.reference.get_block(index) if self.reference else None
+        verified = expected_block is not None and bool(expected_block.md5)
+        try:
+            downloaded_block = self.fetch_verified(
+                index,
+                block_size,
+                lambda url: self.fetch_block(
+                    index, start, end, tmp_file, progress_bar, url=url, hash_total=not verified
+                ),
+                progress_bar,
+            )
+        except Exception as ex:
+            self.discard_part(tmp_file, part_file, block_yaml_path)
+            if self.state_store:
+                self.state_store.mark_failed(self.name, index, str(ex))
+            if isinstance(ex, RemoteFileChanged):
+                # do not start further blocks of the old version
+                self.cancel_event.set()
+            raise
+        self.accept_part(downloaded_block, tmp_file, target, hashed=not verified)
+
+        self.logger.info(f"✅ {part_name} downloaded successfully")
+        self.update_progress(progress_bar, -(index + 1))
+        self.notify_block(downloaded_block)
+
+    def tmp_part_file(self, part_file: str) -> str:
+        """
+        the temporary file for a download of the given part file - unique
+        per process and thread since workers may share a target directory
+        """
+        tmp_file = f"{part_file}.{os.getpid()}-{get_ident()}.tmp"
+        return tmp_file
+
+    def needs_download(
+        self, index: int, target: str, progress_bar, block_size: int, force: bool = False
+    ) -> bool:
+        """
+        check the existing block with the given index - a valid block
+        that matches the expected md5 is recorded and passed to the block
+        callbacks instead of being downloaded
+
+        Args:
+            index: Block index number
+            target: Target directory of the part files
+            progress_bar: Progress bar to update for a skipped block
+            block_size: the size of the block
+            force: if True override existing files unconditionally
+
+        Returns:
+            bool: True if the block needs to be downloaded
+        """
+        part_name = self.part_path(index)
+        part_file = os.path.join(target, part_name)
+        existing_block = self.get_block(index)
+        block_yaml_path = os.path.join(target, self.part_yaml_path(index))
+        if existing_block is None and os.path.exists(block_yaml_path):
+            # a complete part file whose block did not make it into the manifest e.g. after a crash
+            existing_block = Block.load_from_yaml_file(block_yaml_path)  # @UndefinedVariable
+        if existing_block is not None:
+            if not existing_block.virtual:
+                existing_block.path = part_name  # Set relative path for validation
+            expected_block = self.get_expected_block(index)
+            expected = expected_block is None or expected_block.md5 == existing_block.md5
+            block_is_valid = expected and existing_block.is_valid(
+                target, check_head=not self.full_check, paranoid=self.paranoid
+            )
             if block_is_valid and not force:
                 msg=f"✅ {part_name} already valid, skipping"
                 self.logger.info(msg)
@@ -274,30 +782,362 @@ class BlockDownload(BlockFiddler):
                     progress_bar.set_description(part_name)
                     progress_bar.update(block_size)
                 existing_block.ensure_yaml(target)
-                return
+                self.record_block(existing_block)
+                self.block_queue.put(existing_block)
+                self.notify_block(existing_block)
+                return False
         else:
             # No existing metadata, check if file exists
             file_present = os.path.exists(part_file)
             if file_present and not force:
-                msg=f"⚠️ ️{part_name}.part file exists, use --force to overwrite"
+                msg=f"⚠️ ️{part_name} file exists, use --force to overwrite"
                 self.logger.warning(msg)
-                return
+                return False
+        return True
 
-        # Download new block
-        self.logger.info(f"Downloading block {index}: bytes {start}-{end}")
-        self.update_progress(progress_bar, index + 1)
+    def accept_part(self, block: Block, tmp_file: str, target: str, hashed: bool = True):
+        """
+        move the verified temporary file of the given block to its part
+        file, write the block YAML and record the block
+
+        Args:
+            block: the downloaded block
+            tmp_file: the temporary file with the data of the block
+            target: Target directory of the part files
+            hashed: False if the data has not been fed to the total hash yet
+        """
+        part_file = os.path.join(target, self.part_path(block.block))
+        # a rename never writes through a hardlink into the content store
+        os.replace(tmp_file, part_file)
+        if not hashed:
+            with open(part_file, "rb") as f:
+                for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                    self.total_hash.update(chunk)
+        # the block yaml signals a complete part file to readers - it is
+        # renamed into place so that readers never see a partial YAML
+        block_yaml_path = os.path.join(target, self.part_yaml_path(block.block))
+        block.save_to_yaml_file(f"{block_yaml_path}.tmp")
+        os.replace(f"{block_yaml_path}.tmp", block_yaml_path)
+        if self.content_store:
+            self.content_store.add(block.md5, part_file)
+        # the full md5 has just been calculated from the written data
+        block.stamp(target)
+        self.record_block(block)
+        self.block_queue.put(block)
+
+    def discard_part(self, *paths: str):
+        """
+        remove the given files of a block that could not be verified - a
+        stale block YAML would otherwise mark the block as valid on resume
+        """
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def fetch_from_store(
+        self, expected_block: Block, part_file: str, block_yaml_path: str
+    ) -> Block:
+        """
+        Provide the part file from the content store instead of a range
+        request if a block with the expected md5 is available.
 
+        Args:
+            expected_block: the block with the expected md5 e.g. from the manifest
+            part_file: Path of the part file to provide
+            block_yaml_path: Path of the block YAML file to write
+
+        Returns:
+            Block: the block or None if the content store has no matching block
+        """
+        if not expected_block.md5:
+            self.content_store.count_miss()
+            return None
+        if not self.content_store.fetch(expected_block.md5, part_file):
+            return None
+        stored_block = Block(
+            block=expected_block.block,
+            path=self.part_path(expected_block.block),
+            offset=expected_block.offset,
+            md5=expected_block.md5,
+            md5_head=expected_block.md5_head,
+        )
+        stored_block.save_to_yaml_file(block_yaml_path)
+        self.logger.info(f"♻️ {stored_block.path} taken from content store")
+        return stored_block
+
+    def get_range_response(self, start: int, end: int, url: str = None) -> "requests.Response":
+        """
+        Send a range request for the given byte range - for the main URL
+        with If-Range so that a changed file is detected.
+
+        Args:
+            start: Starting byte offset
+            end: Ending byte offset (inclusive)
+            url: the URL to use e.g. a mirror - default: self.url
+
+        Returns:
+            requests.Response: the streaming response
+
+        Raises:
+            RemoteFileChanged: if the remote file has changed since the validators were pinned
+            RangeNotSupported: if the server ignored the range
+            IOError: if the Content-Range does not match the requested range
+        """
         headers = {"Range": f"bytes={start}-{end}"}
-        response = requests.get(self.url, headers=headers, stream=True)
+        # mirrors have their own validators
+        pinned = url is None or url == self.url
+        if_range = self.if_range if pinned else None
+        if if_range:
+            headers["If-Range"] = if_range
+        response = self.http().get(url or self.url, headers=headers, stream=True)
 
         response_valid = response.status_code in (200, 206)
         if not response_valid:
             error_message = f"HTTP {response.status_code}: {response.text}"
             self.logger.error(error_message)
             raise Exception(error_message)
+        if pinned:
+            self.check_validators(response, if_range)
+        if response.status_code == 206:
+            self.check_content_range(response, start, end)
+        elif not (start == 0 and self.size is not None and end >= self.size - 1):
+            response.close()
+            raise RangeNotSupported(f"{url or self.url} ignored the range {start}-{end} and sent the full body")
+        return response
+
+    def read_range(self, start: int, end: int) -> bytes:
+        """
+        read the given byte range into memory - only the requested bytes
+        are read from the response which is closed afterwards
+
+        Args:
+            start: Starting byte offset
+            end: Ending byte offset (inclusive)
+
+        Returns:
+            bytes: the data of the range
+
+        Raises:
+            RangeNotSupported: if the server ignored the range
+            IOError: if the range does not match or the response ends early
+        """
+        size = end - start + 1
+        response = self.get_range_response(start, end)
+        data = bytearray()
+        try:
+            for chunk in response.iter_content(chunk_size=min(size, self.chunk_size)):
+                data.extend(chunk[: size - len(data)])
+                if len(data) == size:
+                    break
+        finally:
+            response.close()
+        if len(data) != size:
+            raise IOError(f"{self.url}: range {start}-{end} ended after {len(data)} bytes")
+        return bytes(data)
+
+    def download_to_stream(
+        self,
+        stream,
+        from_block: int = 0,
+        to_block: int = None,
+        boost: int = 1,
+        window: int = None,
+        progress_bar=None,
+    ) -> str:
+        """
+        Download blocks in parallel and write them in offset order
+        to a sequential stream such as stdout or a pipe - no part files
+        are written.
+
+        Args:
+            stream: binary stream to write to
+            from_block: Index of the first block to download.
+            to_block: Index of the last block (inclusive), or None to download until end.
+            boost: Number of parallel download threads to use.
+            window: number of blocks that may be buffered in memory ahead of
+                the stream position (default: 2 * boost)
+            progress_bar: Optional tqdm-compatible progress bar
+
+        Returns:
+            str: the md5 hex digest of the streamed data
+        """
+        from bdown.stream import StreamSink
 
-        block_path = os.path.basename(part_file)
+        if to_block is None:
+            to_block = self.total_blocks - 1
+        window = window or 2 * boost
+        sink = StreamSink(stream, window=window, first_index=from_block)
+        block_specs = self.block_ranges(from_block, to_block)
+
+        def stream_block(index: int, start: int, end: int):
+            if sink.error is not None:
+                return
+            buffers = {}
+
+            def fetch(url: str) -> Block:
+                buffer = io.BytesIO()
+                buffers[index] = buffer
+                bi = BlockIterator(
+                    index=index,
+                    offset=start,
+                    size=end - start + 1,
+                    block_path=self.part_path(index),
+                    progress_bar=progress_bar,
+                    target_file=buffer,
+                    chunk_size=self.chunk_size,
+                    rate_limiter=self.rate_limiter,
+                )
+                response = self.get_range_response(start, end, url=url)
+                block = Block.ofResponse(bi, response)
+                return block
+
+            try:
+                block = self.fetch_verified(index, end - start + 1, fetch, progress_bar)
+                self.block_queue.put(block)
+                sink.put(index, buffers[index].getvalue())
+            except Exception as ex:
+                # unblock all other producers
+                sink.abort(ex)
+                raise
+
+        with ThreadPoolExecutor(max_workers=max(1, boost)) as executor:
+            futures = [
+                executor.submit(stream_block, index, start, end)
+                for index, start, end in block_specs
+            ]
+            for future in futures:
+                future.result()
+        sink.close()
+        md5_hex = sink.md5.hexdigest()
+        # keep the block metadata of the streamed data
+        self.collect_queued_blocks()
+        self.md5 = md5_hex
+        self.save(update_md5_from_total_hash=False)
+        return md5_hex
+
+    def hash_remote(self, boost: int = 1, progress_bar=None) -> str:
+        """
+        Create the manifest of the remote file without storing it - the ranges
+        are streamed in parallel and each chunk is hashed for its block and,
+        in block order, for the whole file and then discarded. The blocks are
+        in the same format as those created by dcheck --create for a local
+        file named like this download.
+
+        The whole file md5 is calculated without buffering blocks in memory so
+        the stream of a block waits while the blocks before it are incomplete.
+
+        Args:
+            boost: Number of parallel download threads to use.
+            progress_bar: Optional tqdm-compatible progress bar
+
+        Returns:
+            str: the md5 hex digest of the remote file
+        """
+        from bdown.stream import DiscardStream, OrderedHash
+
+        self.blocks = []
+        ordered_hash = OrderedHash()
+
+        def hash_block(index: int, start: int, end: int):
+            try:
+                bi = BlockIterator(
+                    index=index,
+                    offset=start,
+                    size=end - start + 1,
+                    block_path=self.name,
+                    progress_bar=progress_bar,
+                    target_file=DiscardStream(),
+                    chunk_size=self.chunk_size,
+                    hash_total=ordered_hash.block_hash(index),
+                    rate_limiter=self.rate_limiter,
+                )
+                response = self.get_range_response(start, end)
+                block = Block.ofResponse(bi, response)
+                ordered_hash.block_done(index)
+            except Exception as ex:
+                # unblock the streams of all later blocks
+                ordered_hash.abort(ex)
+                raise
+            block.size = end - start + 1
+            self.block_queue.put(block)
 
+        # the blocks are started in index order so the block whose turn it is always has a thread
+        with ThreadPoolExecutor(max_workers=max(1, boost)) as executor:
+            futures = [
+                executor.submit(hash_block, index, start, end)
+                for index, start, end in self.block_ranges(0, self.total_blocks - 1)
+            ]
+            for future in futures:
+                future.result()
+        self.collect_queued_blocks()
+        md5_hex = ordered_hash.md5.hexdigest()
+        self.md5 = md5_hex
+        self.save(update_md5_from_total_hash=False)
+        return md5_hex
+
+    def fetch_block(
+        self,
+        index: int,
+        start: int,
+        end: int,
+        part_file: str,
+        progress_bar,
+        url: str = None,
+        hash_total: bool = True,
+    ) -> Block:
+        """
+        Fetch the given byte range via a range request into a part file.
+
+        Args:
+            index: Block index number
+            start: Starting byte offset for the range request
+            end: Ending byte offset for the range request
+            part_file: Path of the file to write
+            progress_bar: Progress bar to update during download
+            url: the URL to use e.g. a mirror - default: self.url
+            hash_total: if True feed the data to the total hash
+
+        Returns:
+            Block: the downloaded block
+        """
+        response = self.get_range_response(start, end, url=url)
+        chunks = response.iter_content(chunk_size=self.chunk_size)
+        downloaded_block = self.write_part(
+            index, start, end, part_file, progress_bar, chunks, hash_total=hash_total
+        )
+        return downloaded_block
+
+    def write_part(
+        self,
+        index: int,
+        start: int,
+        end: int,
+        part_file: str,
+        progress_bar,
+        chunks,
+        hash_total: bool = True,
+    ) -> Block:
+        """
+        Write the data of a block to the given file - see accept_part
+        for the part file and the block YAML file.
+
+        Args:
+            index: Block index number
+            start: Starting byte offset of the block
+            end: Ending byte offset of the block
+            part_file: Path of the file to write
+            progress_bar: Progress bar to update during download
+            chunks: iterator of the data chunks of the block
+            hash_total: if True feed the data to the total hash
+
+        Returns:
+            Block: the written block
+        """
+        block_size = end - start + 1
+        block_path = self.part_path(index)
+        os.makedirs(os.path.dirname(part_file), exist_ok=True)
+
+        # no preallocation - the size of a part file is the size of its data so far
         with open(part_file, "wb") as target_file:
             bi = BlockIterator(
                 index=index,
@@ -307,21 +1147,87 @@ class BlockDownload(BlockFiddler):
                 progress_bar=progress_bar,
                 target_file=target_file,
                 chunk_size=self.chunk_size,
-                # do not try to calculate total hashes
-                hash_total=self.total_hash
+                hash_total=self.total_hash if hash_total else None,
+                rate_limiter=self.rate_limiter,
             )
 
-            downloaded_block = Block.ofResponse(bi, response)
-            downloaded_block.save_to_yaml_file(block_yaml_path)
-            self.block_queue.put(downloaded_block)
+            downloaded_block = Block.ofIterator(bi, chunks)
+            written = target_file.tell()
+        if written != block_size:
+            raise IOError(f"block {index}: the stream ended after {written} of {block_size} bytes")
+        return downloaded_block
 
-        self.logger.info(f"✅ {part_name} downloaded successfully")
-        self.update_progress(progress_bar, -(index + 1))
+    def download_single_stream(
+        self,
+        block_specs: List[Tuple[int, int, int]],
+        target: str,
+        progress_bar=None,
+        force: bool = False,
+    ):
+        """
+        Download the given blocks from a server without range support with a
+        single request - the body is split into blocks which are written to
+        part files and hashed just like range downloads. Valid existing
+        blocks are skipped in the stream.
+
+        Args:
+            block_specs: the (index, start, end) block specifications in offset order
+            target: Directory to store .part files.
+            progress_bar: Optional tqdm-compatible progress bar.
+            force: if True override existing files unconditionally
+        """
+        from bdown.stream import ChunkReader
+
+        response = self.http().get(self.url, stream=True)
+        response.raise_for_status()
+        self.check_validators(response, None)
+        reader = ChunkReader(response.iter_content(chunk_size=self.chunk_size))
+        try:
+            for index, start, end in block_specs:
+                if self.cancel_event.is_set():
+                    break
+                reader.skip(start - reader.position)
+                block_size = end - start + 1
+                if not self.needs_download(index, target, progress_bar, block_size, force):
+                    reader.skip(block_size)
+                    continue
+                part_file = os.path.join(target, self.part_path(index))
+                block_yaml_path = os.path.join(target, self.part_yaml_path(index))
+                tmp_file = self.tmp_part_file(part_file)
+                expected_block = self.get_expected_block(index)
+                self.update_progress(progress_bar, index + 1)
+                chunks = reader.read_chunks(block_size, self.chunk_size)
+                block = self.write_part(
+                    index, start, end, tmp_file, progress_bar, chunks, hash_total=expected_block is None
+                )
+                self.update_progress(progress_bar, -(index + 1))
+                if expected_block is not None and expected_block.md5 != block.md5:
+                    # the block stays missing - it can be refetched from a server with range support
+                    self.discard_part(tmp_file, part_file, block_yaml_path)
+                    message = f"block {index}: md5 {block.md5} != expected {expected_block.md5} - can not refetch without range support"
+                    self.logger.error(f"❌ {message}")
+                    if self.state_store:
+                        self.state_store.mark_failed(self.name, index, message)
+                    continue
+                self.accept_part(block, tmp_file, target, hashed=expected_block is None)
+                self.notify_block(block)
+        finally:
+            response.close()
+
+    def collect_queued_blocks(self):
+        """
+        move the downloaded blocks from the queue to the blocks list -
+        they replace outdated entries with the same index
+        """
+        blocks_by_index = {block.block: block for block in self.blocks}
+        while not self.block_queue.empty():
+            block = self.block_queue.get()
+            blocks_by_index[block.block] = block
+        self.blocks = list(blocks_by_index.values())
 
     def save_blocks(self, target_dir):
         """Save blocks and verify against the separately collected blocks"""
-        while not self.block_queue.empty():
-            self.blocks.append(self.block_queue.get())
+        self.collect_queued_blocks()
 
         # First sort and save all blocks
         self.save()
@@ -337,12 +1243,14 @@ class BlockDownload(BlockFiddler):
         if len(cblocks) != len(self.blocks):
             print(f"⚠️  Collected {len(cblocks)} blocks but have {len(self.blocks)} in memory")
 
+        if self.state_store:
+            self.export_yaml()
+
 
     def collect_blocks(self,target_dir)->List[Block]:
         """Collect all block YAMLs"""
-        block_files = glob.glob(os.path.join(target_dir, f"{self.name}-*.yaml"))
         blocks=[]
-        for block_file in sorted(block_files):
+        for block_file in self.layout.block_yaml_files(target_dir):
             block = Block.load_from_yaml_file(block_file) # @UndefinedVariable
             blocks.append(block)
         return blocks
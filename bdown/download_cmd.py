@@ -8,9 +8,14 @@ Created on 2025-05-05
 
 import argparse
 import os
+import stat
+import sys
 from argparse import Namespace
 
 from bdown.download import BlockDownload
+from bdown.io_policy import IoPolicy
+from bdown.part_layout import PartLayout
+from bdown.verify import BlockVerifier
 
 
 class BlockDownloadWorker:
@@ -21,6 +26,8 @@ class BlockDownloadWorker:
     def __init__(self, downloader: BlockDownload, args: Namespace):
         self.downloader = downloader
         self.args = args
+        # optional DeltaUpdate from a local older copy
+        self.delta = None
         self.from_block = args.from_block
         self.to_block = args.to_block
         if args.progress:
@@ -37,38 +44,120 @@ class BlockDownloadWorker:
         else:
             self.work()
 
+    @property
+    def stream_output(self) -> bool:
+        """
+        True if the output is stdout or a named pipe
+        """
+        output = self.args.output
+        is_stream = output == "-" or (
+            output is not None and os.path.exists(output) and stat.S_ISFIFO(os.stat(output).st_mode)
+        )
+        return is_stream
+
+    def work_stream(self):
+        """
+        stream the download to stdout or a named pipe in offset order
+        """
+        if self.progress_bar:
+            self.progress_bar.set_description("Streaming")
+        try:
+            if self.args.output == "-":
+                stream = sys.stdout.buffer
+                md5 = self.downloader.download_to_stream(
+                    stream,
+                    from_block=self.from_block,
+                    to_block=self.to_block,
+                    boost=self.args.boost,
+                    window=self.args.window,
+                    progress_bar=self.progress_bar,
+                )
+            else:
+                with open(self.args.output, "wb") as stream:
+                    md5 = self.downloader.download_to_stream(
+                        stream,
+                        from_block=self.from_block,
+                        to_block=self.to_block,
+                        boost=self.args.boost,
+                        window=self.args.window,
+                        progress_bar=self.progress_bar,
+                    )
+            print(f"streamed {self.downloader.name} md5: {md5}", file=sys.stderr)
+        except BrokenPipeError:
+            print("stream consumer closed the pipe", file=sys.stderr)
+
     def work(self):
         """
         handle the command line arguments
         """
+        if self.stream_output:
+            self.work_stream()
+            return
         if self.need_download:
             if self.progress_bar:
                 mode="Patching" if self.args.patch else "Downloading"
                 self.progress_bar.set_description(mode)
-            self.downloader.download(
-                target=self.args.target,
-                from_block=self.from_block,
-                to_block=self.to_block,
-                boost=self.args.boost,
-                progress_bar=self.progress_bar,
-                force=self.args.force
-            )
+            block_indices = None
+            force = self.args.force
+            if self.args.blocks:
+                block_indices = BlockVerifier.parse_blocks(self.args.blocks)
+                # the given blocks are known to be bad
+                force = True
+            if self.delta:
+                self.delta.update(boost=self.args.boost, progress_bar=self.progress_bar)
+                print(self.delta.summary())
+            else:
+                self.downloader.download(
+                    target=self.args.target,
+                    from_block=self.from_block,
+                    to_block=self.to_block,
+                    boost=self.args.boost,
+                    progress_bar=self.progress_bar,
+                    force=force,
+                    block_indices=block_indices,
+                )
+            if self.downloader.content_store:
+                print(self.downloader.content_store.summary())
         if self.args.split:
             from bdown.filesplitter import FileSplitter
             splitter = FileSplitter(
                 name=self.args.name,
                 blocksize=self.args.blocksize,
                 unit=self.args.unit,
+                state_db=self.args.state_db,
+                part_layout=self.args.layout,
             )
             splitter.split(
-                filepath=self.args.split,
+                file_path=self.args.split,
                 target_dir=self.args.target,
                 progress_bar=self.progress_bar,
+                workers=self.args.boost,
+                virtual=self.args.virtual,
+            )
+
+        if self.args.verify:
+            if self.progress_bar:
+                self.progress_bar.reset()
+                self.progress_bar.set_description("Verifying")
+            verifier = BlockVerifier(
+                self.downloader,
+                self.args.target,
+                workers=self.args.boost,
+                early_exit=self.args.early_exit,
+                progress_bar=self.progress_bar,
             )
+            verifier.verify()
+            verifier.report()
+            # keep the refreshed validation cache
+            self.downloader.save(update_md5_from_total_hash=False)
+            if self.args.bad_blocks:
+                verifier.save_bad_blocks(self.args.bad_blocks)
+                print(f"bad blocks saved to {self.args.bad_blocks}")
 
         if self.args.output:
             # Check if output file exists and force flag is not set
-            if os.path.exists(self.args.output) and not self.args.force:
+            resuming = self.args.consume and os.path.exists(f"{self.args.output}.consume.yaml")
+            if os.path.exists(self.args.output) and not self.args.force and not resuming:
                 print(
                     f"Error: Output file {self.args.output} already exists. Use --force to overwrite."
                 )
@@ -81,13 +170,25 @@ class BlockDownloadWorker:
                 self.progress_bar.set_description("Creating target")
 
             # Reassemble blocks into output file
-            md5 = self.downloader.reassemble(
-                parts_dir=self.args.target,
-                output_path=self.args.output,
-                progress_bar=self.progress_bar,
-                on_the_fly=self.args.on_the_fly,
-                timeout=self.args.timeout,
-            )
+            if self.args.consume:
+                from bdown.consume import ConsumingReassembler
+
+                reassembler = ConsumingReassembler(
+                    self.downloader,
+                    self.args.target,
+                    self.args.output,
+                    progress_bar=self.progress_bar,
+                    force=self.args.force,
+                )
+                md5 = reassembler.reassemble()
+            else:
+                md5 = self.downloader.reassemble(
+                    parts_dir=self.args.target,
+                    output_path=self.args.output,
+                    progress_bar=self.progress_bar,
+                    on_the_fly=self.args.on_the_fly,
+                    timeout=self.args.timeout,
+                )
             if md5:
                 self.downloader.md5 = md5
                 self.downloader.save(update_md5_from_total_hash=False)
@@ -140,10 +241,48 @@ def main():
     parser.add_argument(
         "--patch", action="store_true", help="patch missing blocks"
     )
+    parser.add_argument(
+        "--full-check",
+        action="store_true",
+        help="validate existing blocks with their full md5 instead of md5_head",
+    )
+    parser.add_argument(
+        "--paranoid",
+        action="store_true",
+        help="ignore the validation cache and always rehash existing blocks",
+    )
+    parser.add_argument(
+        "--blocks",
+        help="with --patch only download these blocks - comma separated list or file e.g. from --bad-blocks",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="hash all part files in full and check them against the manifest",
+    )
+    parser.add_argument(
+        "--early-exit",
+        action="store_true",
+        help="with --verify stop at the first bad block",
+    )
+    parser.add_argument(
+        "--bad-blocks",
+        help="with --verify save the bad block indices to this file for a --patch --blocks run",
+    )
     parser.add_argument(
         "--split",
         help="Path to local file to split instead of downloading"
     )
+    parser.add_argument(
+        "--virtual",
+        action="store_true",
+        help="with --split only write the block manifest pointing into the local file instead of part files",
+    )
+    parser.add_argument(
+        "--layout",
+        choices=PartLayout.LAYOUTS,
+        help=f"layout of the part files: flat name-0001.part or sharded ab/cd/name-000001.part - default: sharded from {PartLayout.SHARD_THRESHOLD} blocks for new downloads, an existing flat directory is migrated to sharded",
+    )
     parser.add_argument(
         "--timeout",
         type=float,
@@ -156,26 +295,105 @@ def main():
     )
 
     parser.add_argument(
-        "--output", help="Path where the final target file will be saved"
+        "--output",
+        help="Path where the final target file will be saved - use - for stdout or a named pipe to stream the download in order",
+    )
+    parser.add_argument(
+        "--consume",
+        action="store_true",
+        help="with --output remove each part file as soon as it has been copied and verified - needs about 1x instead of 2x the file size on disk, an interrupted run is resumed",
+    )
+    parser.add_argument(
+        "--window",
+        type=int,
+        help="number of blocks buffered in memory when streaming (default: 2 * boost)",
+    )
+    parser.add_argument(
+        "--delta",
+        help="local older copy of the file - unchanged blocks are copied from it, only changed blocks are downloaded (needs --expected)",
+    )
+    parser.add_argument(
+        "--expected",
+        help="with --delta: manifest of the new remote file e.g. from dcheck --create by the publisher",
+    )
+    parser.add_argument(
+        "--reference",
+        help="manifest with the known good md5 of each block e.g. from dcheck --create by the publisher - each block is checked as soon as it is downloaded and refetched on a mismatch",
+    )
+    parser.add_argument(
+        "--mirror",
+        action="append",
+        default=[],
+        help="alternative URL of the same file to refetch mismatching blocks from - may be repeated",
+    )
+    parser.add_argument(
+        "--store",
+        help="directory of a content addressed block store - blocks with a known md5 are linked from there instead of downloaded",
+    )
+    parser.add_argument(
+        "--state-db",
+        help="Path of an optional SQLite state store - the YAML manifest is then only exported",
     )
 
+    IoPolicy.add_arguments(parser)
+
     args = parser.parse_args()
+    IoPolicy.set_default(IoPolicy.ofArgs(args))
     os.makedirs(args.target, exist_ok=True)
     if args.yaml:
         yaml_path = args.yaml
     else:
         yaml_path = os.path.join(args.target, f"{args.name}.yaml")
-    if os.path.exists(yaml_path):
-        downloader = BlockDownload.ofYamlPath(yaml_path)
-        need_download = args.patch
-    else:
-        downloader = BlockDownload(
-            name=args.name, url=args.url, blocksize=args.blocksize, unit=args.unit
-        )
+    downloader = None
+    delta = None
+    if args.delta:
+        if not args.expected:
+            parser.error("--delta needs --expected")
+        from bdown.delta import DeltaUpdate
+
+        delta = DeltaUpdate.ofPaths(args.delta, args.expected, args.target)
+        downloader = delta.expected
+        yaml_path = downloader.yaml_path
         need_download = True
+    elif args.state_db:
+        downloader = BlockDownload.ofStateStore(args.state_db, args.name)
+        need_download = args.patch
+    if downloader is None:
+        if os.path.exists(yaml_path):
+            downloader = BlockDownload.ofYamlPath(yaml_path)
+            need_download = args.patch
+        else:
+            downloader = BlockDownload(
+                name=args.name, url=args.url, blocksize=args.blocksize, unit=args.unit
+            )
+            downloader.part_layout = args.layout or PartLayout.default_layout(downloader.total_blocks)
+            need_download = True
+    if args.layout and args.layout != (downloader.part_layout or PartLayout.FLAT):
+        if args.layout == PartLayout.FLAT:
+            parser.error(f"{downloader.name} has a {downloader.part_layout} layout that can not be made flat")
+        downloader.part_layout = args.layout
+        downloader.yaml_path = yaml_path
+        if os.path.isdir(args.target) and downloader.migrate_parts(args.target):
+            downloader.save(update_md5_from_total_hash=False)
+    if args.state_db and not downloader.state_db:
+        # import an existing YAML manifest into the state store
+        downloader.state_db = args.state_db
+        downloader.state_store.save_download(downloader)
+        downloader.state_store.save_blocks(downloader.name, downloader.blocks)
     downloader.yaml_path = yaml_path
+    downloader.full_check = args.full_check
+    downloader.paranoid = args.paranoid
+    if args.reference:
+        reference = BlockDownload.load_from_yaml_file(args.reference)
+        downloader.set_reference(reference)
+    downloader.mirrors = args.mirror
+    if args.store:
+        from bdown.content_store import ContentStore
+
+        downloader.content_store = ContentStore(args.store)
     worker = BlockDownloadWorker(downloader, args)
     worker.need_download = need_download
+    worker.delta = delta
     worker.work_with_progress()
 
 
@@ -4,9 +4,12 @@ Created on 2025-05-21
 @author: wf
 """
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 from bdown.block import Block, BlockIterator
 from bdown.block_fiddler import BlockFiddler
+from bdown.io_policy import IoPolicy
+from bdown.part_layout import PartLayout
 from basemkit.yamlable import lod_storable
 
 
@@ -16,7 +19,15 @@ class FileSplitter(BlockFiddler):
     Specialized BlockFiddler for splitting files into blocks
     """
 
-    def split(self, file_path: str, target_dir: str, progress_bar=None):
+    def split(
+        self,
+        file_path: str,
+        target_dir: str,
+        progress_bar=None,
+        workers: int = 1,
+        buffer_size: int = 4 * 1024 * 1024,
+        virtual: bool = False,
+    ):
         """
         Split a file into blocks and save as part files
 
@@ -24,42 +35,223 @@ class FileSplitter(BlockFiddler):
             file_path: Path to the file to split
             target_dir: Directory to store part files
             progress_bar: Optional progress bar
+            workers: number of parallel workers - more than one uses
+                a shared source file descriptor, kernel copies and positioned reads
+            buffer_size: read buffer size for hashing in parallel mode
+            virtual: if True only write the block manifest with blocks
+                pointing into the source file instead of part files
         """
         # Update file size from input file
         self.size = os.path.getsize(file_path)
+        if self.part_layout is None:
+            self.part_layout = PartLayout.default_layout(self.total_blocks)
         os.makedirs(target_dir, exist_ok=True)
 
-        # Process each block
-        for i in range(self.total_blocks):
-            start = i * self.blocksize_bytes
-            end = min(start + self.blocksize_bytes - 1, self.size - 1)
-            block_size = end - start + 1
+        if workers > 1 or virtual:
+            self.split_parallel(
+                file_path, target_dir, progress_bar, workers, buffer_size, virtual
+            )
+        else:
+            # Process each block
+            for i in range(self.total_blocks):
+                start = i * self.blocksize_bytes
+                end = min(start + self.blocksize_bytes - 1, self.size - 1)
+                block_size = end - start + 1
 
-            # Create part filename
-            part_name = f"{self.name}-{i:04d}.part"
-            part_path = os.path.join(target_dir, part_name)
+                # Create part filename
+                part_name = self.part_path(i)
+                part_path = os.path.join(target_dir, part_name)
+                os.makedirs(os.path.dirname(part_path), exist_ok=True)
+
+                # Create BlockIterator configuration
+                with open(part_path, "wb") as target_file:
+                    IoPolicy.get_default().preallocate_fd(target_file.fileno(), block_size)
+                    bi = BlockIterator(
+                        index=i,
+                        offset=start,
+                        size=block_size,
+                        block_path=part_name,
+                        progress_bar=progress_bar,
+                        target_file=target_file,
+                        chunk_size=self.chunk_size,
+                        hash_total=self.total_hash
+                    )
 
-            # Create BlockIterator configuration
-            with open(part_path, "wb") as target_file:
-                bi = BlockIterator(
-                    index=i,
-                    offset=start,
-                    size=block_size,
-                    block_path=part_name,
-                    progress_bar=progress_bar,
-                    target_file=target_file,
-                    chunk_size=self.chunk_size,
-                    hash_total=self.total_hash
-                )
-
-                block = Block.ofFile(bi, file_path)
-
-            # Save block metadata
-            block_yaml_path = os.path.join(target_dir, f"{self.name}-{i:04d}.yaml")
-            block.save_to_yaml_file(block_yaml_path)
-            self.blocks.append(block)
+                    block = Block.ofFile(bi, file_path)
+
+                # Save block metadata
+                block_yaml_path = os.path.join(target_dir, self.part_yaml_path(i))
+                block.save_to_yaml_file(block_yaml_path)
+                self.record_block(block)
+                self.blocks.append(block)
 
         # Save metadata
         self.sort_blocks()
         self.yaml_path = os.path.join(target_dir, f"{self.name}.yaml")
-        self.save()
\ No newline at end of file
+        self.save()
+        if self.state_store:
+            self.export_yaml()
+
+    def split_parallel(
+        self,
+        file_path: str,
+        target_dir: str,
+        progress_bar,
+        workers: int,
+        buffer_size: int,
+        virtual: bool = False,
+    ):
+        """
+        Split a file into blocks on a pool of workers sharing
+        one source file descriptor
+
+        Args:
+            file_path: Path to the file to split
+            target_dir: Directory to store part files
+            progress_bar: Optional progress bar
+            workers: number of parallel workers
+            buffer_size: read buffer size for hashing
+            virtual: if True do not write part files
+        """
+        policy = IoPolicy.get_default()
+        src_fd = os.open(file_path, os.O_RDONLY)
+        if policy.sequential:
+            policy.advise(src_fd, 0, self.size, "SEQUENTIAL")
+        # virtual blocks refer to the source file relative to the manifest
+        source_path = os.path.relpath(os.path.abspath(file_path), os.path.abspath(target_dir))
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                futures = []
+                for index, start, end in self.block_ranges(0, self.total_blocks - 1):
+                    future = executor.submit(
+                        self.split_block,
+                        src_fd,
+                        index,
+                        start,
+                        end - start + 1,
+                        target_dir,
+                        progress_bar,
+                        buffer_size,
+                        source_path if virtual else None,
+                    )
+                    futures.append((start, end, future))
+                # the total hash needs the blocks in order - the data
+                # has just been read by the workers and is in the page cache
+                for start, end, future in futures:
+                    block = future.result()
+                    for chunk in self.read_range(src_fd, start, end - start + 1, buffer_size):
+                        self.total_hash.update(chunk)
+                    # the source range is not needed any more
+                    policy.drop(src_fd, start, end - start + 1)
+                    self.blocks.append(block)
+        finally:
+            os.close(src_fd)
+
+    def split_block(
+        self,
+        src_fd: int,
+        index: int,
+        start: int,
+        block_size: int,
+        target_dir: str,
+        progress_bar,
+        buffer_size: int,
+        source_path: str = None,
+    ) -> Block:
+        """
+        copy a single block to its part file and hash it
+
+        Args:
+            source_path: if given only hash the block and create a virtual
+                block pointing to this path instead of writing a part file
+
+        Returns:
+            Block: the block with md5 and md5_head
+        """
+        part_name = self.part_path(index)
+        if source_path is None:
+            part_path = os.path.join(target_dir, part_name)
+            os.makedirs(os.path.dirname(part_path), exist_ok=True)
+            dst_fd = os.open(part_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            policy = IoPolicy.get_default()
+            try:
+                policy.preallocate_fd(dst_fd, block_size)
+                self.copy_range(src_fd, dst_fd, start, block_size, buffer_size)
+                policy.drop_written(dst_fd, 0, block_size)
+            finally:
+                os.close(dst_fd)
+        bi = BlockIterator(
+            index=index,
+            offset=start,
+            size=block_size,
+            block_path=part_name,
+            progress_bar=progress_bar,
+            chunk_size=self.chunk_size,
+        )
+        block = Block.ofIterator(
+            bi, self.read_range(src_fd, start, block_size, buffer_size)
+        )
+        if source_path is not None:
+            block.path = source_path
+            block.size = block_size
+            block.virtual = True
+            self.record_block(block)
+            return block
+        block_yaml_path = os.path.join(target_dir, self.part_yaml_path(index))
+        block.save_to_yaml_file(block_yaml_path)
+        self.record_block(block)
+        return block
+
+    def read_range(self, fd: int, offset: int, count: int, buffer_size: int):
+        """
+        read a byte range with positioned reads - the first chunk has
+        chunk_size bytes to keep md5_head compatible with downloaded blocks
+
+        Args:
+            fd: the file descriptor to read from
+            offset: the start offset
+            count: number of bytes to read
+            buffer_size: size of the following reads
+
+        Yields:
+            bytes: the chunks
+        """
+        bytes_read = 0
+        read_size = self.chunk_size
+        while bytes_read < count:
+            chunk = os.pread(fd, min(read_size, count - bytes_read), offset + bytes_read)
+            if not chunk:
+                break
+            bytes_read += len(chunk)
+            read_size = buffer_size
+            yield chunk
+
+    @staticmethod
+    def copy_range(
+        src_fd: int, dst_fd: int, offset: int, count: int, buffer_size: int
+    ) -> int:
+        """
+        copy a byte range of the source to the start of the destination
+        using the kernel copy_file_range where available
+
+        Returns:
+            int: the number of bytes copied
+        """
+        copied = 0
+        use_kernel_copy = hasattr(os, "copy_file_range")
+        while copied < count:
+            remaining = count - copied
+            if use_kernel_copy:
+                try:
+                    n = os.copy_file_range(src_fd, dst_fd, remaining, offset + copied, copied)
+                except OSError:
+                    # e.g. not supported by the file system - fall back to user space copy
+                    use_kernel_copy = False
+                    continue
+            else:
+                data = os.pread(src_fd, min(buffer_size, remaining), offset + copied)
+                n = os.pwrite(dst_fd, data, copied) if data else 0
+            if n == 0:
+                break
+            copied += n
+        return copied
@@ -0,0 +1,126 @@
+"""
+Created on 2025-06-09
+
+@author: wf
+
+benchmark of the IoPolicy variants - throughput and page cache residency
+of hashing and reassembling a file
+
+Usage:
+    python -m bdown.io_benchmark [--size-mb 512] [--dir /tmp] [file]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from bdown.block import Block
+from bdown.io_policy import IoPolicy, cache_residency
+
+
+class IoBenchmark:
+    """
+    measure the effect of the IoPolicy settings
+    """
+
+    POLICIES = {
+        "default": IoPolicy(),
+        "drop-cache": IoPolicy(drop_cache=True),
+        "direct": IoPolicy(direct=True, drop_cache=True),
+        "no-hints": IoPolicy(sequential=False, preallocate=False),
+    }
+
+    def __init__(self, path: str, chunk_size: int = 1024 * 1024):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.size = os.path.getsize(path)
+
+    def evict(self, path: str):
+        """
+        try to evict the given file from the page cache for a cold start
+        """
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            IoPolicy(drop_cache=True).drop(fd, 0, 0)
+        finally:
+            os.close(fd)
+
+    def run_hash(self, policy: IoPolicy):
+        """
+        hash the file with the given policy
+
+        Returns:
+            tuple: (MB/s, cache residency after the run)
+        """
+        self.evict(self.path)
+        block = Block(block=0, path=os.path.basename(self.path), offset=0)
+        start = time.perf_counter()
+        block.calc_md5(
+            os.path.dirname(self.path), chunk_size=self.chunk_size, io_policy=policy
+        )
+        elapsed = time.perf_counter() - start
+        residency = cache_residency(self.path)
+        return self.size / (1024 * 1024) / elapsed, residency
+
+    def run_copy(self, policy: IoPolicy):
+        """
+        copy the file as a single block to a preallocated output with the given policy
+
+        Returns:
+            tuple: (MB/s, cache residency of the output after the run)
+        """
+        self.evict(self.path)
+        block = Block(block=0, path=os.path.basename(self.path), offset=0)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(self.path), delete=False) as f:
+            output_path = f.name
+            policy.preallocate_fd(f.fileno(), self.size)
+        try:
+            start = time.perf_counter()
+            block.copy_to(
+                os.path.dirname(self.path),
+                output_path,
+                chunk_size=self.chunk_size,
+                io_policy=policy,
+            )
+            elapsed = time.perf_counter() - start
+            residency = cache_residency(output_path)
+        finally:
+            os.remove(output_path)
+        return self.size / (1024 * 1024) / elapsed, residency
+
+    @staticmethod
+    def format_residency(residency) -> str:
+        text = "n/a" if residency is None else f"{residency:6.1%}"
+        return text
+
+    def run(self):
+        print(f"{self.path}: {self.size / (1024 * 1024):.0f} MB")
+        print(f"{'policy':<12} {'hash MB/s':>10} {'cached':>8} {'copy MB/s':>10} {'cached':>8}")
+        for name, policy in self.POLICIES.items():
+            hash_rate, hash_residency = self.run_hash(policy)
+            copy_rate, copy_residency = self.run_copy(policy)
+            print(
+                f"{name:<12} {hash_rate:10.1f} {self.format_residency(hash_residency):>8} "
+                f"{copy_rate:10.1f} {self.format_residency(copy_residency):>8}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark of the page cache friendly I/O policies")
+    parser.add_argument("file", nargs="?", help="file to use - default: a generated sample file")
+    parser.add_argument("--size-mb", type=int, default=512, help="size of the generated sample file (default: 512)")
+    parser.add_argument("--dir", default=None, help="directory of the generated sample file")
+    args = parser.parse_args()
+    if args.file:
+        IoBenchmark(args.file).run()
+        return
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp_dir:
+        path = os.path.join(tmp_dir, "iobench.bin")
+        with open(path, "wb") as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1024 * 1024))
+        IoBenchmark(path).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Created on 2025-06-09
+
+@author: wf
+"""
+import errno
+import mmap
+import os
+from dataclasses import dataclass
+from typing import ClassVar, Iterator, Optional
+
+
+@dataclass
+class IoPolicy:
+    """
+    page cache friendly file I/O for hashing, splitting and reassembly
+    of large files - hints and flags are only applied where the
+    platform supports them
+    """
+
+    sequential: bool = True  # posix_fadvise SEQUENTIAL for readahead
+    drop_cache: bool = False  # posix_fadvise DONTNEED after the data has been consumed
+    direct: bool = False  # O_DIRECT reads bypassing the page cache
+    preallocate: bool = True  # fallocate part and output files
+    alignment: int = 4096  # alignment of O_DIRECT offsets and buffers
+    direct_buffer_size: int = 4 * 1024 * 1024  # size of the aligned O_DIRECT read buffer
+
+    _default: ClassVar[Optional["IoPolicy"]] = None
+
+    @classmethod
+    def get_default(cls) -> "IoPolicy":
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
+    @classmethod
+    def set_default(cls, policy: "IoPolicy"):
+        """
+        set the policy used when no explicit policy is given e.g. from command line options
+        """
+        cls._default = policy
+
+    @staticmethod
+    def add_arguments(parser):
+        """
+        add the I/O policy command line options to the given argparse parser
+        """
+        parser.add_argument(
+            "--drop-cache",
+            action="store_true",
+            help="drop file data from the page cache once it has been consumed to keep hot data cached",
+        )
+        parser.add_argument(
+            "--direct",
+            action="store_true",
+            help="read with O_DIRECT bypassing the page cache where supported",
+        )
+
+    @classmethod
+    def ofArgs(cls, args) -> "IoPolicy":
+        policy = cls(drop_cache=args.drop_cache, direct=args.direct)
+        return policy
+
+    def advise(self, fd: int, offset: int, length: int, advice_name: str):
+        """
+        give the kernel the posix_fadvise hint with the given name if available
+        """
+        advice = getattr(os, f"POSIX_FADV_{advice_name}", None)
+        if advice is None or not hasattr(os, "posix_fadvise"):
+            return
+        try:
+            os.posix_fadvise(fd, offset, length, advice)
+        except OSError:
+            pass
+
+    def drop(self, fd: int, offset: int, length: int):
+        """
+        drop the given consumed range of a file read from the page cache
+        """
+        if self.drop_cache:
+            self.advise(fd, offset, length, "DONTNEED")
+
+    def drop_written(self, fd: int, offset: int, length: int):
+        """
+        drop the given written range from the page cache - dirty
+        pages need to be written back before they can be dropped
+        """
+        if self.drop_cache:
+            os.fdatasync(fd)
+            self.advise(fd, offset, length, "DONTNEED")
+
+    def preallocate_fd(self, fd: int, size: int):
+        """
+        preallocate size bytes for the given file to avoid fragmentation
+        """
+        if not self.preallocate or size <= 0 or not hasattr(os, "posix_fallocate"):
+            return
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError:
+            # e.g. not supported by the file system
+            pass
+
+    def open_read(self, path: str):
+        """
+        open the given file for reading - with O_DIRECT if configured and supported
+
+        Returns:
+            tuple: (fd, direct) the file descriptor and whether O_DIRECT is active
+        """
+        if self.direct and hasattr(os, "O_DIRECT"):
+            try:
+                fd = os.open(path, os.O_RDONLY | os.O_DIRECT)
+                return fd, True
+            except OSError as ex:
+                if ex.errno != errno.EINVAL:
+                    raise
+        fd = os.open(path, os.O_RDONLY)
+        return fd, False
+
+    def read_chunks(
+        self, path: str, offset: int = 0, size: int = None, chunk_size: int = 8192
+    ) -> Iterator[bytes]:
+        """
+        read a byte range of the given file applying this policy
+
+        Args:
+            path: the file to read
+            offset: the start offset
+            size: number of bytes to read - None for up to the end of the file
+            chunk_size: size of the chunks to yield - the last chunk may be shorter
+
+        Yields:
+            bytes: the chunks
+        """
+        fd, direct = self.open_read(path)
+        try:
+            if size is None:
+                size = max(0, os.fstat(fd).st_size - offset)
+            if self.sequential:
+                self.advise(fd, offset, size, "SEQUENTIAL")
+            if direct:
+                yield from self.rechunk(self.read_direct(fd, offset, size), chunk_size)
+            else:
+                # drop the consumed data in steps instead of per chunk
+                drop_step = max(chunk_size, self.direct_buffer_size)
+                dropped = 0
+                bytes_read = 0
+                while bytes_read < size:
+                    chunk = os.pread(fd, min(chunk_size, size - bytes_read), offset + bytes_read)
+                    if not chunk:
+                        break
+                    bytes_read += len(chunk)
+                    yield chunk
+                    if bytes_read - dropped >= drop_step:
+                        self.drop(fd, offset + dropped, bytes_read - dropped)
+                        dropped = bytes_read
+                self.drop(fd, offset + dropped, bytes_read - dropped)
+        finally:
+            os.close(fd)
+
+    def read_direct(self, fd: int, offset: int, size: int) -> Iterator[bytes]:
+        """
+        read a byte range with O_DIRECT using an aligned buffer
+
+        Yields:
+            bytes: the data in pieces of up to direct_buffer_size bytes
+        """
+        buffer_size = max(self.alignment, self.direct_buffer_size - self.direct_buffer_size % self.alignment)
+        # anonymous mmaps are page aligned
+        with mmap.mmap(-1, buffer_size) as buffer:
+            pos = offset - offset % self.alignment
+            skip = offset - pos
+            end = offset + size
+            while pos < end:
+                n = os.preadv(fd, [buffer], pos)
+                if n <= 0:
+                    break
+                data = buffer[skip : min(n, end - pos)]
+                if data:
+                    yield data
+                skip = 0
+                pos += n
+                if n < buffer_size:
+                    break
+
+    @staticmethod
+    def rechunk(pieces: Iterator[bytes], chunk_size: int) -> Iterator[bytes]:
+        """
+        cut the given pieces into chunks of chunk_size bytes
+        """
+        pending = bytearray()
+        for piece in pieces:
+            pending.extend(piece)
+            while len(pending) >= chunk_size:
+                yield bytes(pending[:chunk_size])
+                del pending[:chunk_size]
+        if pending:
+            yield bytes(pending)
+
+
+def cache_residency(path: str) -> Optional[float]:
+    """
+    get the fraction of the pages of the given file that are in the page cache
+    using mincore
+
+    Args:
+        path: the file to check
+
+    Returns:
+        float: the resident fraction 0.0-1.0 or None if mincore is not available
+    """
+    import ctypes
+    import ctypes.util
+
+    size = os.path.getsize(path)
+    if size == 0:
+        return 0.0
+    libc_name = ctypes.util.find_library("c")
+    if not libc_name:
+        return None
+    libc = ctypes.CDLL(libc_name, use_errno=True)
+    if not hasattr(libc, "mincore"):
+        return None
+    libc.mmap.restype = ctypes.c_void_p
+    libc.mmap.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_size_t,
+        ctypes.c_int,
+        ctypes.c_int,
+        ctypes.c_int,
+        ctypes.c_long,
+    ]
+    libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_char_p]
+    page_size = mmap.PAGESIZE
+    pages = (size + page_size - 1) // page_size
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        address = libc.mmap(None, size, mmap.PROT_READ, mmap.MAP_SHARED, fd, 0)
+        if address in (None, ctypes.c_void_p(-1).value):
+            return None
+        try:
+            vector = ctypes.create_string_buffer(pages)
+            if libc.mincore(ctypes.c_void_p(address), size, vector) != 0:
+                return None
+            resident = sum(1 for byte in vector.raw[:pages] if byte & 1)
+        finally:
+            libc.munmap(ctypes.c_void_p(address), size)
+    finally:
+        os.close(fd)
+    return resident / pages
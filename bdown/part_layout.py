@@ -0,0 +1,156 @@
+"""
+Created on 2025-06-11
+
+@author: wf
+"""
+import hashlib
+import os
+from typing import Iterator, List, Optional
+
+from bdown.block import Block
+
+
+class PartLayout:
+    """
+    naming of the part and block YAML files of a download
+
+    flat: all files in the parts directory e.g. name-0123.part
+    sharded: files spread over two levels of subdirectories by a hash
+        of the file name with a wide index e.g. ab/cd/name-000123.part
+        so that directories stay small and names sort for any block count
+    """
+
+    FLAT = "flat"
+    SHARDED = "sharded"
+    LAYOUTS = [FLAT, SHARDED]
+    # block count from which new downloads are sharded by default
+    SHARD_THRESHOLD = 10000
+
+    def __init__(self, name: str, total_blocks: int, layout: Optional[str] = None):
+        """
+        constructor
+
+        Args:
+            name: the name of the download
+            total_blocks: the number of blocks
+            layout: flat or sharded - default: flat
+        """
+        layout = layout or self.FLAT
+        if layout not in self.LAYOUTS:
+            raise ValueError(f"Unsupported part layout: {layout} - must be one of {self.LAYOUTS}")
+        self.name = name
+        self.total_blocks = total_blocks
+        self.layout = layout
+        self.width = max(6, len(str(max(0, total_blocks - 1))))
+
+    @classmethod
+    def default_layout(cls, total_blocks: int) -> str:
+        """
+        the layout for a new download with the given number of blocks
+        """
+        layout = cls.SHARDED if total_blocks >= cls.SHARD_THRESHOLD else cls.FLAT
+        return layout
+
+    def flat_stem(self, index: int) -> str:
+        stem = f"{self.name}-{index:04d}"
+        return stem
+
+    def stem(self, index: int) -> str:
+        """
+        the relative path of the files of the given block without extension
+        """
+        if self.layout == self.FLAT:
+            return self.flat_stem(index)
+        file_name = f"{self.name}-{index:0{self.width}d}"
+        digest = hashlib.md5(file_name.encode()).hexdigest()
+        stem = f"{digest[0:2]}/{digest[2:4]}/{file_name}"
+        return stem
+
+    def part_path(self, index: int) -> str:
+        """
+        the relative path of the part file of the given block
+        """
+        return f"{self.stem(index)}.part"
+
+    def yaml_path(self, index: int) -> str:
+        """
+        the relative path of the block YAML file of the given block
+        """
+        return f"{self.stem(index)}.yaml"
+
+    def find_yaml(self, parts_dir: str, index: int) -> Optional[str]:
+        """
+        find the block YAML file of the given block - in this layout or
+        in a flat directory that has not been migrated yet
+
+        Returns:
+            str: the full path or None if there is no block YAML file
+        """
+        for stem in dict.fromkeys([self.stem(index), self.flat_stem(index)]):
+            yaml_path = os.path.join(parts_dir, f"{stem}.yaml")
+            if os.path.exists(yaml_path):
+                return yaml_path
+        return None
+
+    def block_yaml_files(self, parts_dir: str) -> Iterator[str]:
+        """
+        the existing block YAML files in block order - looked up per block
+        instead of listing a possibly huge directory
+        """
+        for index in range(self.total_blocks):
+            yaml_path = self.find_yaml(parts_dir, index)
+            if yaml_path:
+                yield yaml_path
+
+    def has_flat_files(self, parts_dir: str) -> bool:
+        """
+        check whether the parts directory has at least one flat part or block YAML file
+        """
+        prefix = f"{self.name}-"
+        with os.scandir(parts_dir) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith(prefix) and name.endswith((".part", ".yaml")) and name[len(prefix) : -5].isdigit():
+                    return True
+        return False
+
+    def migrate(self, parts_dir: str, blocks: List[Block]) -> int:
+        """
+        move the files of a flat parts directory into this layout and
+        update the paths of the given manifest blocks
+
+        Args:
+            parts_dir: the parts directory
+            blocks: the blocks of the manifest
+
+        Returns:
+            int: the number of moved blocks
+        """
+        if self.layout == self.FLAT:
+            return 0
+        blocks_by_index = {block.block: block for block in blocks}
+        moved = 0
+        for index in range(self.total_blocks):
+            block = blocks_by_index.get(index)
+            if block is not None and block.virtual:
+                continue
+            flat_part = os.path.join(parts_dir, f"{self.flat_stem(index)}.part")
+            flat_yaml = os.path.join(parts_dir, f"{self.flat_stem(index)}.yaml")
+            if not os.path.exists(flat_part) and not os.path.exists(flat_yaml):
+                continue
+            part_path = os.path.join(parts_dir, self.part_path(index))
+            os.makedirs(os.path.dirname(part_path), exist_ok=True)
+            if os.path.exists(flat_part):
+                os.replace(flat_part, part_path)
+            if os.path.exists(flat_yaml):
+                # the block YAML is moved last - it signals a complete part file
+                part_block = Block.load_from_yaml_file(flat_yaml)  # @UndefinedVariable
+                part_block.path = self.part_path(index)
+                yaml_path = os.path.join(parts_dir, self.yaml_path(index))
+                part_block.save_to_yaml_file(f"{yaml_path}.tmp")
+                os.replace(f"{yaml_path}.tmp", yaml_path)
+                os.remove(flat_yaml)
+            if block is not None:
+                block.path = self.part_path(index)
+            moved += 1
+        return moved
@@ -0,0 +1,239 @@
+"""
+Created on 2025-06-10
+
+@author: wf
+"""
+import io
+import os
+import threading
+import time
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Dict, List
+
+from bdown.block_fiddler import BlockFiddler
+
+
+@dataclass
+class PartExtent:
+    """
+    the location of one block of the logical file
+    """
+
+    index: int
+    start: int  # offset in the logical file
+    size: int
+    path: str  # path of the file containing the block data
+    file_offset: int  # offset of the block data in that file
+    virtual: bool = False
+
+
+class PartsFile(io.RawIOBase):
+    """
+    read only view of a parts directory and its manifest as one logical file
+    without reassembling it - offsets are mapped to the part files via a
+    precomputed offset index and read with positioned reads
+    """
+
+    def __init__(
+        self,
+        fiddler: BlockFiddler,
+        parts_dir: str,
+        wait: bool = False,
+        timeout: float = 300.0,
+        poll_interval: float = 0.2,
+    ):
+        """
+        constructor
+
+        Args:
+            fiddler: the BlockFiddler (e.g. BlockDownload) with the manifest
+            parts_dir: directory containing the part files
+            wait: if True reads of blocks that are still downloading wait
+                until the block is available instead of failing
+            timeout: maximum time to wait for a block in seconds
+            poll_interval: time between checks for a block in seconds
+        """
+        super().__init__()
+        self.fiddler = fiddler
+        self.parts_dir = parts_dir
+        self.wait = wait
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.size = fiddler.size
+        self.position = 0
+        self.fds: Dict[str, int] = {}
+        self.stale_fds: List[int] = []
+        self.lock = threading.Lock()
+        self.extents = self.create_index()
+        self.starts: List[int] = [extent.start for extent in self.extents]
+
+    def create_index(self) -> List[PartExtent]:
+        """
+        create the offset index of all blocks - blocks that are not in the
+        manifest yet are expected in their default part file
+        """
+        blocks_by_index = {block.block: block for block in self.fiddler.blocks}
+        extents = []
+        for index, start, end in self.fiddler.block_ranges(0, self.fiddler.total_blocks - 1):
+            block = blocks_by_index.get(index)
+            if block is not None and block.virtual:
+                extent = PartExtent(
+                    index=index,
+                    start=start,
+                    size=end - start + 1,
+                    path=os.path.join(self.parts_dir, block.path),
+                    file_offset=block.offset,
+                    virtual=True,
+                )
+            else:
+                part_name = self.fiddler.part_path(index)
+                extent = PartExtent(
+                    index=index,
+                    start=start,
+                    size=end - start + 1,
+                    path=os.path.join(self.parts_dir, part_name),
+                    file_offset=0,
+                )
+            extents.append(extent)
+        return extents
+
+    def extent_at(self, offset: int) -> PartExtent:
+        """
+        get the extent containing the given offset of the logical file
+        """
+        i = bisect_right(self.starts, offset) - 1
+        extent = self.extents[i]
+        return extent
+
+    def is_available(self, extent: PartExtent) -> bool:
+        """
+        check whether the block of the given extent is complete - the
+        block yaml is only written once the part file is complete
+        """
+        if extent.virtual:
+            return True
+        yaml_path = extent.path[: -len(".part")] + ".yaml"
+        available = os.path.exists(extent.path) and os.path.exists(yaml_path)
+        return available
+
+    def wait_for(self, extent: PartExtent):
+        """
+        make sure the block of the given extent is available
+
+        Raises:
+            IOError: if the block is not available and waiting is off
+            TimeoutError: if the block does not become available within the timeout
+        """
+        if self.is_available(extent):
+            return
+        if not self.wait:
+            raise IOError(f"block {extent.index} is not available yet")
+        deadline = time.time() + self.timeout
+        while not self.is_available(extent):
+            if time.time() > deadline:
+                raise TimeoutError(f"block {extent.index} not ready after {self.timeout}s")
+            time.sleep(self.poll_interval)
+
+    def get_fd(self, path: str) -> int:
+        """
+        get the cached file descriptor of the given path - a part file that
+        has been replaced e.g. by a new download of its block is opened again
+        """
+        with self.lock:
+            fd = self.fds.get(path)
+            if fd is not None:
+                fd_stat = os.fstat(fd)
+                path_stat = os.stat(path)
+                if (fd_stat.st_dev, fd_stat.st_ino) != (path_stat.st_dev, path_stat.st_ino):
+                    # other threads might still read the old file - closed in close()
+                    self.stale_fds.append(fd)
+                    fd = None
+            if fd is None:
+                fd = os.open(path, os.O_RDONLY)
+                self.fds[path] = fd
+        return fd
+
+    def pread(self, offset: int, size: int) -> bytes:
+        """
+        positioned read of the logical file - does not change the position
+        and may be used from several threads
+
+        Args:
+            offset: the offset in the logical file
+            size: the number of bytes to read
+
+        Returns:
+            bytes: the data - shorter than size at the end of the file
+        """
+        size = min(size, max(0, self.size - offset))
+        pieces = []
+        done = 0
+        while done < size:
+            extent = self.extent_at(offset + done)
+            self.wait_for(extent)
+            extent_offset = offset + done - extent.start
+            count = min(size - done, extent.size - extent_offset)
+            data = os.pread(self.get_fd(extent.path), count, extent.file_offset + extent_offset)
+            if not data:
+                raise IOError(f"{extent.path} is shorter than expected")
+            pieces.append(data)
+            done += len(data)
+        return b"".join(pieces)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"invalid whence {whence}")
+        if position < 0:
+            raise ValueError(f"negative seek position {position}")
+        self.position = position
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        view = memoryview(buffer).cast("B")
+        data = self.pread(self.position, len(view))
+        view[: len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, key):
+        """
+        mmap like access e.g. parts_file[start:stop] or parts_file[offset]
+        """
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.size)
+            if step != 1:
+                raise ValueError("only contiguous slices are supported")
+            data = self.pread(start, max(0, stop - start))
+            return data
+        if key < 0:
+            key += self.size
+        if not 0 <= key < self.size:
+            raise IndexError("index out of range")
+        return self.pread(key, 1)[0]
+
+    def close(self):
+        with self.lock:
+            for fd in list(self.fds.values()) + self.stale_fds:
+                os.close(fd)
+            self.fds.clear()
+            self.stale_fds.clear()
+        super().close()
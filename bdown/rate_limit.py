@@ -0,0 +1,64 @@
+"""
+Created on 2025-06-03
+
+@author: wf
+"""
+import re
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    thread safe token bucket limiting the bandwidth
+    shared by all blocks and jobs using it
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        """
+        constructor
+
+        Args:
+            rate: maximum bytes per second
+            burst: bucket size in bytes (default: one second worth of rate)
+        """
+        if rate <= 0:
+            raise ValueError(f"rate must be positive but is {rate}")
+        self.rate = rate
+        self.burst = burst if burst else rate
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount: int):
+        """
+        take the given number of bytes from the bucket
+        and sleep if the bucket is exhausted
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            # the bucket may go negative - the deficit is paid by waiting
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+    @classmethod
+    def parse_rate(cls, rate_str: str) -> float:
+        """
+        parse a rate like 500K, 10M or 1G (bytes per second)
+
+        Args:
+            rate_str: the rate string
+
+        Returns:
+            float: bytes per second
+        """
+        match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?)B?\s*", rate_str.upper())
+        if not match:
+            raise ValueError(f"invalid rate {rate_str} - use e.g. 500K, 10M or 1G")
+        multipliers = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3}
+        rate = float(match.group(1)) * multipliers[match.group(2)]
+        return rate
@@ -0,0 +1,191 @@
+"""
+Created on 2025-06-10
+
+@author: wf
+"""
+import io
+import os
+from collections import OrderedDict
+
+from bdown.download import BlockDownload
+
+
+class RemoteBlockFile(io.RawIOBase):
+    """
+    random access read only file object for a remote file - reads are served
+    from the .part files already on disk, missing data is fetched on demand
+    with range requests in pages kept in a size limited LRU cache.
+    Sequential reads are detected and fetched with a growing readahead.
+    """
+
+    def __init__(
+        self,
+        download: BlockDownload,
+        parts_dir: str = None,
+        page_size: int = 256 * 1024,
+        cache_size: int = 64 * 1024 * 1024,
+        max_readahead: int = 4 * 1024 * 1024,
+    ):
+        """
+        constructor
+
+        Args:
+            download: the BlockDownload with the url and the block geometry
+            parts_dir: optional directory with already downloaded .part files
+            page_size: size of the pages that are fetched and cached
+            cache_size: maximum number of bytes in the page cache
+            max_readahead: maximum number of bytes fetched ahead for sequential reads
+        """
+        super().__init__()
+        self.download = download
+        self.parts_dir = parts_dir
+        self.page_size = page_size
+        self.cache_size = cache_size
+        self.max_readahead = max(page_size, max_readahead)
+        self.size = download.size
+        self.position = 0
+        self.pages = OrderedDict()
+        self.cached_bytes = 0
+        # sequential read detection
+        self.last_end = None
+        self.readahead_pages = 1
+        # statistics
+        self.requests = 0
+        self.fetched_bytes = 0
+        self.part_bytes = 0
+        self.cache_hits = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"invalid whence {whence}")
+        if position < 0:
+            raise ValueError(f"negative seek position {position}")
+        self.position = position
+        return self.position
+
+    def part_path(self, index: int) -> str:
+        """
+        get the path of the completely downloaded part file of the given
+        block or None - the block yaml is only written once the part is complete
+        """
+        if not self.parts_dir:
+            return None
+        part_path = os.path.join(self.parts_dir, self.download.part_path(index))
+        yaml_path = os.path.join(self.parts_dir, self.download.part_yaml_path(index))
+        if os.path.exists(part_path) and os.path.exists(yaml_path):
+            return part_path
+        return None
+
+    def read_part(self, offset: int, size: int) -> bytes:
+        """
+        read from a part file on disk
+
+        Returns:
+            bytes: the data or None if the block is not on disk
+        """
+        blocksize = self.download.blocksize_bytes
+        index = offset // blocksize
+        part_path = self.part_path(index)
+        if part_path is None:
+            return None
+        block_offset = offset - index * blocksize
+        size = min(size, blocksize - block_offset)
+        with open(part_path, "rb") as f:
+            data = os.pread(f.fileno(), size, block_offset)
+        self.part_bytes += len(data)
+        return data
+
+    def fetch_pages(self, first_page: int, page_count: int):
+        """
+        fetch the given pages with a single range request and cache them
+        """
+        last_page = (self.size - 1) // self.page_size
+        page_count = max(1, min(page_count, last_page - first_page + 1))
+        start = first_page * self.page_size
+        end = min(self.size, (first_page + page_count) * self.page_size) - 1
+        data = self.download.read_range(start, end)
+        self.requests += 1
+        self.fetched_bytes += len(data)
+        for i in range(page_count):
+            page = data[i * self.page_size : (i + 1) * self.page_size]
+            self.cache_page(first_page + i, page)
+
+    def cache_page(self, page_index: int, page: bytes):
+        """
+        add a page to the LRU cache evicting the least recently used pages
+        """
+        if page_index in self.pages:
+            self.cached_bytes -= len(self.pages.pop(page_index))
+        self.pages[page_index] = page
+        self.cached_bytes += len(page)
+        while self.cached_bytes > self.cache_size and len(self.pages) > 1:
+            _evicted_index, evicted = self.pages.popitem(last=False)
+            self.cached_bytes -= len(evicted)
+
+    def read_page(self, page_index: int) -> bytes:
+        """
+        get the page with the given index from the cache or fetch it
+        together with the readahead pages
+        """
+        page = self.pages.get(page_index)
+        if page is not None:
+            self.pages.move_to_end(page_index)
+            self.cache_hits += 1
+            return page
+        self.fetch_pages(page_index, self.readahead_pages)
+        page = self.pages[page_index]
+        return page
+
+    def update_readahead(self, offset: int, size: int):
+        """
+        grow the readahead for sequential reads and reset it for random reads
+        """
+        if offset == self.last_end:
+            max_pages = self.max_readahead // self.page_size
+            self.readahead_pages = min(max_pages, self.readahead_pages * 2)
+        else:
+            self.readahead_pages = 1
+        self.last_end = offset + size
+
+    def readinto(self, buffer) -> int:
+        """
+        read up to len(buffer) bytes at the current position into the given buffer
+
+        Returns:
+            int: the number of bytes read - 0 at the end of the file
+        """
+        view = memoryview(buffer).cast("B")
+        size = min(len(view), max(0, self.size - self.position))
+        if size == 0:
+            return 0
+        self.update_readahead(self.position, size)
+        done = 0
+        while done < size:
+            offset = self.position + done
+            data = self.read_part(offset, size - done)
+            if data is None:
+                page_index = offset // self.page_size
+                page = self.read_page(page_index)
+                page_offset = offset - page_index * self.page_size
+                data = page[page_offset : page_offset + size - done]
+            if not data:
+                break
+            view[done : done + len(data)] = data
+            done += len(data)
+        self.position += done
+        return done
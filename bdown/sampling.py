@@ -0,0 +1,213 @@
+"""
+Created on 2025-06-11
+
+@author: wf
+"""
+import hashlib
+import math
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Tuple
+
+from bdown.block import Status, StatusSymbol
+from bdown.block_fiddler import BlockFiddler
+from bdown.download import BlockDownload
+
+
+class SampleCheck:
+    """
+    statistical integrity check of a large file - instead of hashing every byte
+    a few randomly chosen sub-ranges of each block are compared with the same
+    sub-ranges of a local or remote reference. The samples are reproducible
+    from the seed so both sides pick the same ranges.
+    """
+
+    def __init__(
+        self,
+        fiddler: BlockFiddler,
+        path: str,
+        reference_path: str = None,
+        reference_download: BlockDownload = None,
+        samples: int = 4,
+        sample_size: int = 64 * 1024,
+        seed: int = 0,
+        workers: int = 4,
+        progress_bar=None,
+    ):
+        """
+        constructor
+
+        Args:
+            fiddler: the BlockFiddler with the block geometry
+            path: the file to check
+            reference_path: the local reference file
+            reference_download: the BlockDownload of the remote reference - sampled via range requests
+            samples: number of samples per block
+            sample_size: size of a sample in bytes
+            seed: seed of the sample positions
+            workers: number of blocks sampled in parallel
+            progress_bar: optional progress bar
+        """
+        if (reference_path is None) == (reference_download is None):
+            raise ValueError("either a reference path or a reference download is needed")
+        self.fiddler = fiddler
+        self.path = path
+        self.reference_path = reference_path
+        self.reference_download = reference_download
+        self.samples = max(1, samples)
+        self.sample_size = sample_size
+        self.seed = seed
+        self.workers = workers
+        self.progress_bar = progress_bar
+        self.status = Status()
+        self.messages: Dict[int, str] = {}
+        self.sampled_bytes = 0
+
+    @staticmethod
+    def detection_probability(samples: int, corrupt_fraction: float) -> float:
+        """
+        the probability that at least one of the given number of samples of a
+        block hits a corruption covering the given fraction of the block - a lower
+        bound since each sample covers a range and not only a single byte
+
+        Args:
+            samples: number of samples per block
+            corrupt_fraction: fraction 0.0-1.0 of the block that is corrupt
+
+        Returns:
+            float: the probability 0.0-1.0
+        """
+        if corrupt_fraction >= 1.0:
+            return 1.0
+        probability = 1.0 - (1.0 - corrupt_fraction) ** samples
+        return probability
+
+    @staticmethod
+    def samples_for_confidence(confidence: float, corrupt_fraction: float) -> int:
+        """
+        the number of samples per block needed to detect a corruption covering
+        the given fraction of a block with the given confidence
+
+        Args:
+            confidence: the confidence level e.g. 0.99
+            corrupt_fraction: fraction 0.0-1.0 of the block that is corrupt
+
+        Returns:
+            int: the number of samples per block
+        """
+        if not 0.0 < confidence < 1.0:
+            raise ValueError(f"confidence {confidence} must be between 0 and 1")
+        if not 0.0 < corrupt_fraction <= 1.0:
+            raise ValueError(f"corrupt fraction {corrupt_fraction} must be between 0 and 1")
+        if corrupt_fraction == 1.0:
+            return 1
+        samples = math.ceil(math.log(1.0 - confidence) / math.log(1.0 - corrupt_fraction))
+        return max(1, samples)
+
+    def block_size(self, index: int) -> int:
+        if index == self.fiddler.total_blocks - 1:
+            size = self.fiddler.last_block_size
+        else:
+            size = self.fiddler.blocksize_bytes
+        return size
+
+    def sample_ranges(self, index: int) -> List[Tuple[int, int]]:
+        """
+        get the reproducible sample ranges of the given block
+
+        Args:
+            index: the block index
+
+        Returns:
+            List[Tuple[int, int]]: sorted (offset, size) ranges in the file
+        """
+        start = index * self.fiddler.blocksize_bytes
+        size = self.block_size(index)
+        sample_size = min(self.sample_size, size)
+        if sample_size == size:
+            return [(start, size)]
+        rng = random.Random(f"{self.seed}-{index}")
+        offsets = sorted(rng.randrange(0, size - sample_size + 1) for _ in range(self.samples))
+        ranges = [(start + offset, sample_size) for offset in offsets]
+        return ranges
+
+    def read_local(self, path: str, offset: int, size: int) -> bytes:
+        with open(path, "rb") as f:
+            data = os.pread(f.fileno(), size, offset)
+        return data
+
+    def read_remote(self, offset: int, size: int) -> bytes:
+        """
+        read the given range of the remote reference
+
+        Raises:
+            RangeNotSupported: if the server ignores the range request
+        """
+        data = self.reference_download.read_range(offset, offset + size - 1)
+        return data
+
+    def read_reference(self, offset: int, size: int) -> bytes:
+        if self.reference_download is not None:
+            data = self.read_remote(offset, size)
+        else:
+            data = self.read_local(self.reference_path, offset, size)
+        return data
+
+    def check_block(self, index: int) -> Tuple[StatusSymbol, str, int]:
+        """
+        compare the samples of the given block
+
+        Returns:
+            tuple: (StatusSymbol, message, sampled bytes)
+        """
+        sampled = 0
+        for offset, size in self.sample_ranges(index):
+            md5 = hashlib.md5(self.read_local(self.path, offset, size)).hexdigest()
+            reference_md5 = hashlib.md5(self.read_reference(offset, size)).hexdigest()
+            sampled += size
+            if md5 != reference_md5:
+                return StatusSymbol.FAIL, f"sample at {offset} differs", sampled
+        return StatusSymbol.SUCCESS, "ok", sampled
+
+    def check(self) -> Status:
+        """
+        sample all blocks in parallel
+
+        Returns:
+            Status: the per block status
+        """
+        size = os.path.getsize(self.path)
+        if size != self.fiddler.size:
+            raise ValueError(f"size mismatch {size} != {self.fiddler.size}")
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            futures = {
+                executor.submit(self.check_block, index): index
+                for index in range(self.fiddler.total_blocks)
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                symbol, message, sampled = future.result()
+                self.status.update(symbol, index)
+                self.messages[index] = f"{symbol.value} {message}"
+                self.sampled_bytes += sampled
+                if self.progress_bar:
+                    self.status.set_description(self.progress_bar)
+                    self.progress_bar.update(self.block_size(index))
+        return self.status
+
+    def report(self, corrupt_fraction: float = 0.01):
+        """
+        print the failed blocks, the summary and the confidence
+
+        Args:
+            corrupt_fraction: the corrupt fraction of a block the confidence is given for
+        """
+        for index in sorted(self.status.symbol_blocks[StatusSymbol.FAIL]):
+            print(f"[{index:4}] {self.messages[index]}")
+        probability = self.detection_probability(self.samples, corrupt_fraction)
+        sampled = self.fiddler.format_size(self.sampled_bytes)
+        print(f"Sample check: {self.status.summary()} - {sampled} sampled")
+        print(
+            f"a block with {corrupt_fraction:.2%} corrupt bytes is detected with {probability:.2%} confidence"
+        )
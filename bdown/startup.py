@@ -0,0 +1,130 @@
+"""
+Created on 2025-06-09
+
+@author: wf
+
+startup benchmark of the command line modules based on python -X importtime
+
+Usage:
+    python -m bdown.startup [--budget-ms 500] [--runs 5]
+"""
+import argparse
+import json
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+
+class StartupBenchmark:
+    """
+    measure the import time of the command line modules and check
+    that heavy modules are only imported when they are needed
+    """
+
+    # command line entry modules
+    MODULES = ["bdown.check", "bdown.download_cmd", "bdown.batch", "bdown.daemon", "bdown.distributed"]
+    # modules that must not be imported at startup
+    LAZY_MODULES = ["requests", "urllib3", "tqdm"]
+
+    def __init__(self, python: str = sys.executable, runs: int = 5):
+        """
+        constructor
+
+        Args:
+            python: the python interpreter to use
+            runs: number of runs - the fastest run counts
+        """
+        self.python = python
+        self.runs = runs
+
+    def import_times(self, module: str) -> Dict[str, Tuple[int, int]]:
+        """
+        get the import times of the given module and all modules it imports
+
+        Args:
+            module: the module to import
+
+        Returns:
+            Dict[str, Tuple[int, int]]: module name -> (self, cumulative) microseconds
+        """
+        result = subprocess.run(
+            [self.python, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        times = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:"):
+                continue
+            parts = line[len("import time:") :].split("|")
+            if len(parts) != 3 or not parts[0].strip().isdigit():
+                # the header line
+                continue
+            name = parts[2].strip()
+            times[name] = (int(parts[0]), int(parts[1]))
+        return times
+
+    def startup_ms(self, module: str) -> float:
+        """
+        get the fastest cumulative import time of the given module in milliseconds
+        """
+        best = None
+        for _ in range(self.runs):
+            _self_us, cumulative_us = self.import_times(module)[module]
+            best = cumulative_us if best is None else min(best, cumulative_us)
+        return best / 1000
+
+    def imported_modules(self, code: str) -> List[str]:
+        """
+        get the lazy modules that are imported by running the given code
+        """
+        check = f"import sys\n{code}\nimport json\nprint(json.dumps(sorted(sys.modules)))"
+        result = subprocess.run(
+            [self.python, "-c", check], capture_output=True, text=True, check=True
+        )
+        modules = json.loads(result.stdout.strip().splitlines()[-1])
+        imported = [module for module in self.LAZY_MODULES if module in modules]
+        return imported
+
+    def top_modules(self, module: str, limit: int = 10) -> List[Tuple[str, int]]:
+        """
+        get the modules with the highest self import time
+        """
+        times = self.import_times(module)
+        top = sorted(
+            ((name, self_us) for name, (self_us, _cumulative) in times.items()),
+            key=lambda item: item[1],
+            reverse=True,
+        )[:limit]
+        return top
+
+
+def main():
+    parser = argparse.ArgumentParser(description="startup benchmark of the command line modules")
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=500.0,
+        help="maximum cumulative import time per module in milliseconds (default: 500)",
+    )
+    parser.add_argument("--runs", type=int, default=5, help="number of runs - the fastest counts (default: 5)")
+    parser.add_argument("--top", type=int, default=0, help="show the modules with the highest self import time")
+    args = parser.parse_args()
+    benchmark = StartupBenchmark(runs=args.runs)
+    failed = False
+    for module in StartupBenchmark.MODULES:
+        ms = benchmark.startup_ms(module)
+        eager = benchmark.imported_modules(f"import {module}")
+        ok = ms <= args.budget_ms and not eager
+        failed = failed or not ok
+        symbol = "✅" if ok else "❌"
+        eager_msg = f" eagerly imports {', '.join(eager)}" if eager else ""
+        print(f"{symbol} {module}: {ms:.1f} ms{eager_msg}")
+        for name, self_us in benchmark.top_modules(module, args.top) if args.top else []:
+            print(f"    {self_us / 1000:7.1f} ms {name}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
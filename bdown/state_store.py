@@ -0,0 +1,241 @@
+"""
+Created on 2025-06-04
+
+@author: wf
+"""
+import dataclasses
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from bdown.block import Block, ValidationStamp
+
+
+class SqliteStateStore:
+    """
+    SQLite backed state of downloads and their blocks
+
+    Each block is written in its own transaction so that
+    the state survives crashes without rewriting a complete
+    YAML manifest - YAML is kept as an export format.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS downloads (
+        name TEXT PRIMARY KEY,
+        url TEXT,
+        blocksize INTEGER,
+        unit TEXT,
+        size INTEGER,
+        chunk_size INTEGER,
+        md5 TEXT,
+        part_layout TEXT
+    );
+    CREATE TABLE IF NOT EXISTS blocks (
+        download TEXT NOT NULL,
+        block INTEGER NOT NULL,
+        path TEXT,
+        offset INTEGER,
+        md5 TEXT,
+        md5_head TEXT,
+        size INTEGER,
+        virtual INTEGER,
+        validated TEXT,
+        state TEXT NOT NULL DEFAULT 'done',
+        error TEXT,
+        updated REAL,
+        PRIMARY KEY (download, block)
+    );
+    CREATE INDEX IF NOT EXISTS blocks_state ON blocks (download, state);
+    CREATE INDEX IF NOT EXISTS blocks_offset ON blocks (download, offset);
+    """
+
+    def __init__(self, db_path: str):
+        """
+        constructor
+
+        Args:
+            db_path: path of the SQLite database file
+        """
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript(self.SCHEMA)
+            # columns added after the first release
+            columns = [row["name"] for row in self.connection.execute("PRAGMA table_info(downloads)")]
+            if "part_layout" not in columns:
+                self.connection.execute("ALTER TABLE downloads ADD COLUMN part_layout TEXT")
+            columns = [row["name"] for row in self.connection.execute("PRAGMA table_info(blocks)")]
+            for column, column_type in (("size", "INTEGER"), ("virtual", "INTEGER"), ("validated", "TEXT")):
+                if column not in columns:
+                    self.connection.execute(f"ALTER TABLE blocks ADD COLUMN {column} {column_type}")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def save_download(self, fiddler):
+        """
+        save the metadata of the given BlockFiddler - the blocks
+        are not touched, see save_block
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                """INSERT INTO downloads (name, url, blocksize, unit, size, chunk_size, md5, part_layout)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                url=excluded.url, blocksize=excluded.blocksize, unit=excluded.unit,
+                size=excluded.size, chunk_size=excluded.chunk_size, md5=excluded.md5,
+                part_layout=excluded.part_layout""",
+                (
+                    fiddler.name,
+                    getattr(fiddler, "url", None),
+                    fiddler.blocksize,
+                    fiddler.unit,
+                    fiddler.size,
+                    fiddler.chunk_size,
+                    fiddler.md5,
+                    fiddler.part_layout,
+                ),
+            )
+
+    def load_download(self, name: str) -> Optional[Dict]:
+        """
+        load the metadata of the download with the given name
+
+        Returns:
+            dict: the metadata or None if the download is unknown
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT * FROM downloads WHERE name=?", (name,)
+            ).fetchone()
+        record = dict(row) if row else None
+        return record
+
+    def save_block(self, name: str, block: Block, state: str = "done"):
+        """
+        save the given block in a transaction of its own
+        """
+        self.save_blocks(name, [block], state=state)
+
+    def save_blocks(self, name: str, blocks: List[Block], state: str = "done"):
+        """
+        save the given blocks in one transaction e.g. to import a YAML manifest
+        """
+        now = time.time()
+        rows = [
+            (
+                name,
+                b.block,
+                b.path,
+                b.offset,
+                b.md5,
+                b.md5_head,
+                b.size,
+                None if b.virtual is None else int(b.virtual),
+                json.dumps(dataclasses.asdict(b.validated)) if b.validated else None,
+                state,
+                now,
+            )
+            for b in blocks
+        ]
+        with self.lock, self.connection:
+            self.connection.executemany(
+                """INSERT INTO blocks (download, block, path, offset, md5, md5_head,
+                size, virtual, validated, state, error, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL, ?)
+                ON CONFLICT(download, block) DO UPDATE SET
+                path=excluded.path, offset=excluded.offset, md5=excluded.md5,
+                md5_head=excluded.md5_head, size=excluded.size, virtual=excluded.virtual,
+                validated=excluded.validated, state=excluded.state, error=NULL,
+                updated=excluded.updated""",
+                rows,
+            )
+
+    def mark_failed(self, name: str, index: int, error: str):
+        """
+        record that the block with the given index failed
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                """INSERT INTO blocks (download, block, state, error, updated)
+                VALUES (?, ?, 'failed', ?, ?)
+                ON CONFLICT(download, block) DO UPDATE SET
+                state='failed', error=excluded.error, updated=excluded.updated""",
+                (name, index, error, time.time()),
+            )
+
+    def query_blocks(self, sql: str, params: tuple) -> List[Block]:
+        with self.lock:
+            rows = self.connection.execute(sql, params).fetchall()
+        blocks = [
+            Block(
+                block=row["block"],
+                path=row["path"],
+                offset=row["offset"],
+                md5=row["md5"] or "",
+                md5_head=row["md5_head"] or "",
+                size=row["size"],
+                virtual=None if row["virtual"] is None else bool(row["virtual"]),
+                validated=ValidationStamp(**json.loads(row["validated"])) if row["validated"] else None,
+            )
+            for row in rows
+        ]
+        return blocks
+
+    def get_blocks(self, name: str) -> List[Block]:
+        """
+        get all successfully stored blocks of the given download ordered by index
+        """
+        blocks = self.query_blocks(
+            "SELECT * FROM blocks WHERE download=? AND state='done' ORDER BY block",
+            (name,),
+        )
+        return blocks
+
+    def blocks_in_range(self, name: str, from_offset: int, to_offset: int) -> List[Block]:
+        """
+        get the stored blocks whose offset is in the given range
+
+        Args:
+            name: the download name
+            from_offset: first byte offset (inclusive)
+            to_offset: last byte offset (inclusive)
+        """
+        blocks = self.query_blocks(
+            """SELECT * FROM blocks WHERE download=? AND state='done'
+            AND offset BETWEEN ? AND ? ORDER BY offset""",
+            (name, from_offset, to_offset),
+        )
+        return blocks
+
+    def failed_blocks(self, name: str) -> List[int]:
+        """
+        get the indices of the failed blocks of the given download
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT block FROM blocks WHERE download=? AND state='failed' ORDER BY block",
+                (name,),
+            ).fetchall()
+        indices = [row[0] for row in rows]
+        return indices
+
+    def missing_blocks(self, name: str, total_blocks: int) -> List[int]:
+        """
+        get the indices of the blocks that have not been stored successfully
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT block FROM blocks WHERE download=? AND state='done'",
+                (name,),
+            ).fetchall()
+        done = {row[0] for row in rows}
+        missing = [index for index in range(total_blocks) if index not in done]
+        return missing
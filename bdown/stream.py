@@ -0,0 +1,234 @@
+"""
+Created on 2025-06-07
+
+@author: wf
+"""
+import hashlib
+import io
+import threading
+from typing import Dict
+
+
+class StreamSink:
+    """
+    write blocks that arrive in any order to a sequential stream
+    in block index order using a bounded in-memory reorder window
+    """
+
+    def __init__(self, stream, window: int = 8, first_index: int = 0, compute_md5: bool = True):
+        """
+        constructor
+
+        Args:
+            stream: binary stream with a write method e.g. sys.stdout.buffer or a pipe
+            window: maximum number of blocks ahead of the next block to be written
+                that may be buffered - producers of blocks beyond the window wait
+            first_index: the index of the first block to be written
+            compute_md5: if True compute the md5 of the written stream
+        """
+        if window < 1:
+            raise ValueError(f"window must be at least 1 but is {window}")
+        self.stream = stream
+        self.window = window
+        self.next_index = first_index
+        self.pending: Dict[int, bytes] = {}
+        self.condition = threading.Condition()
+        self.writing = False
+        self.error = None
+        self.bytes_written = 0
+        self.md5 = hashlib.md5() if compute_md5 else None
+
+    def put(self, index: int, data: bytes):
+        """
+        hand over the data of the block with the given index - waits
+        while the block is beyond the reorder window
+
+        Args:
+            index: the block index
+            data: the block data
+
+        Raises:
+            Exception: the error of an aborted sink
+        """
+        with self.condition:
+            while index >= self.next_index + self.window and self.error is None:
+                self.condition.wait()
+            if self.error is not None:
+                raise self.error
+            self.pending[index] = data
+            if self.writing:
+                # the thread currently writing will pick up this block
+                return
+            self.writing = True
+        self.flush_prefix()
+
+    def flush_prefix(self):
+        """
+        write the contiguous prefix of pending blocks - only one
+        thread at a time is writing
+        """
+        try:
+            while True:
+                with self.condition:
+                    data = self.pending.pop(self.next_index, None)
+                    if data is None:
+                        self.writing = False
+                        return
+                self.stream.write(data)
+                if self.md5:
+                    self.md5.update(data)
+                with self.condition:
+                    self.bytes_written += len(data)
+                    self.next_index += 1
+                    self.condition.notify_all()
+        except Exception as ex:
+            self.abort(ex)
+            raise
+
+    def abort(self, error: Exception):
+        """
+        abort the sink - waiting and future producers get the given error
+        """
+        with self.condition:
+            if self.error is None:
+                self.error = error
+            self.writing = False
+            self.pending.clear()
+            self.condition.notify_all()
+
+    def close(self):
+        """
+        flush the stream
+        """
+        if self.error is None:
+            self.stream.flush()
+
+
+class OrderedHash:
+    """
+    hash the chunks of blocks that are streamed in parallel in block
+    order without buffering them - the stream of a block waits until
+    all blocks before it have been hashed
+    """
+
+    def __init__(self, first_index: int = 0):
+        """
+        constructor
+
+        Args:
+            first_index: the index of the first block to be hashed
+        """
+        self.next_index = first_index
+        self.condition = threading.Condition()
+        self.error = None
+        self.md5 = hashlib.md5()
+
+    def update(self, index: int, chunk: bytes):
+        """
+        hash the given chunk of the block with the given index as soon
+        as it is the turn of the block
+
+        Raises:
+            Exception: the error of an aborted hash
+        """
+        with self.condition:
+            while index != self.next_index and self.error is None:
+                self.condition.wait()
+            if self.error is not None:
+                raise self.error
+        self.md5.update(chunk)
+
+    def block_done(self, index: int):
+        """
+        the block with the given index has been hashed completely
+        """
+        with self.condition:
+            if index == self.next_index:
+                self.next_index += 1
+                self.condition.notify_all()
+
+    def block_hash(self, index: int) -> "BlockHash":
+        """
+        get a hash like object for the chunks of the given block
+        """
+        return BlockHash(self, index)
+
+    def abort(self, error: Exception):
+        """
+        abort the hash - waiting blocks get the given error
+        """
+        with self.condition:
+            if self.error is None:
+                self.error = error
+            self.condition.notify_all()
+
+
+class BlockHash:
+    """
+    the update method of an OrderedHash for the chunks of a single block
+    """
+
+    def __init__(self, ordered_hash: OrderedHash, index: int):
+        self.ordered_hash = ordered_hash
+        self.index = index
+
+    def update(self, chunk: bytes):
+        self.ordered_hash.update(self.index, chunk)
+
+
+class DiscardStream(io.RawIOBase):
+    """
+    a writable stream that discards everything e.g. to only hash a download
+    """
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        return len(data)
+
+
+class ChunkReader:
+    """
+    cut a sequential stream of chunks of any size e.g. the body of a
+    response without range support into consecutive blocks
+    """
+
+    def __init__(self, chunks):
+        """
+        constructor
+
+        Args:
+            chunks: iterator of bytes
+        """
+        self.chunks = iter(chunks)
+        self.pending = b""
+        self.position = 0
+
+    def read_chunks(self, size: int, chunk_size: int):
+        """
+        yield the next size bytes in chunks of chunk_size bytes - the last chunk may be shorter
+
+        Raises:
+            EOFError: if the stream ends early
+        """
+        remaining = size
+        while remaining > 0:
+            wanted = min(chunk_size, remaining)
+            while len(self.pending) < wanted:
+                chunk = next(self.chunks, None)
+                if chunk is None:
+                    raise EOFError(f"stream ended at {self.position + len(self.pending)}")
+                self.pending += chunk
+            data = self.pending[:wanted]
+            self.pending = self.pending[wanted:]
+            self.position += wanted
+            remaining -= wanted
+            yield data
+
+    def skip(self, size: int, chunk_size: int = 1024 * 1024):
+        """
+        skip the next size bytes
+        """
+        for _chunk in self.read_chunks(size, chunk_size):
+            pass
@@ -0,0 +1,154 @@
+"""
+Created on 2025-06-06
+
+@author: wf
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List
+
+from bdown.block import Status, StatusSymbol
+from bdown.block_fiddler import BlockFiddler
+
+
+class BlockVerifier:
+    """
+    verify all blocks of a parts directory against their manifest
+    by hashing every part file in full
+    """
+
+    def __init__(
+        self,
+        fiddler: BlockFiddler,
+        parts_dir: str,
+        workers: int = 4,
+        early_exit: bool = False,
+        progress_bar=None,
+    ):
+        """
+        constructor
+
+        Args:
+            fiddler: the BlockFiddler (e.g. BlockDownload) with the manifest blocks
+            parts_dir: directory containing the part files
+            workers: number of parallel hashing threads
+            early_exit: if True stop at the first bad block
+            progress_bar: optional progress bar
+        """
+        self.fiddler = fiddler
+        self.parts_dir = parts_dir
+        self.workers = workers
+        self.early_exit = early_exit
+        self.progress_bar = progress_bar
+        self.status = Status()
+        self.messages: Dict[int, str] = {}
+        self.blocks_by_index = {}
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+
+    def verify_block(self, index: int):
+        """
+        verify the block with the given index
+
+        Returns:
+            tuple: (StatusSymbol, message) or None if skipped because of an early exit
+        """
+        if self.stop_event.is_set():
+            return None
+        block = self.blocks_by_index.get(index)
+        if block is None:
+            result = StatusSymbol.FAIL, "missing in manifest"
+        elif not block.md5:
+            result = StatusSymbol.WARN, "no md5 in manifest"
+        elif not block.file_exists(self.parts_dir):
+            result = StatusSymbol.FAIL, f"{block.path} missing"
+        elif block.is_valid(self.parts_dir, check_head=False, paranoid=True):
+            result = StatusSymbol.SUCCESS, "ok"
+        else:
+            result = StatusSymbol.FAIL, f"{block.path} md5 mismatch"
+        if result[0] != StatusSymbol.SUCCESS and self.early_exit:
+            self.stop_event.set()
+        return result
+
+    def verify(self) -> Status:
+        """
+        verify all blocks in parallel
+
+        Returns:
+            Status: the per block status
+        """
+        self.blocks_by_index = {block.block: block for block in self.fiddler.blocks}
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            futures = {
+                executor.submit(self.verify_block, index): index
+                for index in range(self.fiddler.total_blocks)
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                result = future.result()
+                if result is None:
+                    continue
+                symbol, message = result
+                with self.lock:
+                    self.status.update(symbol, index)
+                    self.messages[index] = f"{symbol.value} {message}"
+                if self.progress_bar:
+                    self.status.set_description(self.progress_bar)
+                    self.progress_bar.update(self.block_size(index))
+        return self.status
+
+    def block_size(self, index: int) -> int:
+        if index == self.fiddler.total_blocks - 1:
+            size = self.fiddler.last_block_size
+        else:
+            size = self.fiddler.blocksize_bytes
+        return size
+
+    @property
+    def bad_blocks(self) -> List[int]:
+        """
+        the sorted indices of the blocks that failed or could not be verified
+        """
+        bad = (
+            self.status.symbol_blocks[StatusSymbol.FAIL]
+            | self.status.symbol_blocks[StatusSymbol.WARN]
+        )
+        bad_blocks = sorted(bad)
+        return bad_blocks
+
+    def report(self):
+        """
+        print the bad blocks and the summary
+        """
+        for index in self.bad_blocks:
+            print(f"[{index:4}] {self.messages[index]}")
+        print(f"Verify: {self.status.summary()}")
+
+    def save_bad_blocks(self, path: str):
+        """
+        save the bad block indices one per line to be used with --patch --blocks
+        """
+        with open(path, "w") as f:
+            for index in self.bad_blocks:
+                f.write(f"{index}\n")
+
+    @staticmethod
+    def parse_blocks(blocks: str) -> List[int]:
+        """
+        parse block indices from a file with one index per line or
+        a comma separated list like 3,7,9
+
+        Args:
+            blocks: the file path or list
+
+        Returns:
+            List[int]: the block indices
+        """
+        if os.path.exists(blocks):
+            with open(blocks, "r") as f:
+                text = f.read()
+        else:
+            text = blocks
+        indices = [int(part) for part in text.replace(",", " ").split()]
+        return indices
@@ -0,0 +1,147 @@
+"""
+Created on 2025-06-02
+
+@author: wf
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+from email.utils import formatdate
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from tests.basetest import BaseTest
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """
+    minimal static file handler with HTTP range request support
+    including ETag/Last-Modified validators and If-Range
+    """
+
+    def log_message(self, format, *args):  # @ReservedAssignment
+        # keep the test output quiet
+        pass
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) or not os.path.exists(path):
+            return super().send_head()
+        stat = os.stat(path)
+        size = stat.st_size
+        etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+        last_modified = formatdate(stat.st_mtime, usegmt=True)
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if if_range and if_range not in (etag, last_modified):
+            # the file has changed - send the full new body
+            range_header = None
+        f = open(path, "rb")
+        match = re.match(r"bytes=(\d+)-(\d*)", range_header) if range_header else None
+        if match:
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else size - 1
+            end = min(end, size - 1)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            f.seek(start)
+            self.range_remaining = end - start + 1
+        else:
+            self.send_response(200)
+            self.range_remaining = size
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(self.range_remaining))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", last_modified)
+        self.end_headers()
+        return f
+
+    def copyfile(self, source, outputfile):
+        remaining = getattr(self, "range_remaining", None)
+        if remaining is None:
+            return super().copyfile(source, outputfile)
+        while remaining > 0:
+            chunk = source.read(min(64 * 1024, remaining))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            remaining -= len(chunk)
+
+
+class NoRangeRequestHandler(RangeRequestHandler):
+    """
+    handler of a server that claims range support but ignores the Range header
+    """
+
+    requests = 0
+
+    def send_head(self):
+        NoRangeRequestHandler.requests += 1
+        del self.headers["Range"]
+        return super().send_head()
+
+
+class BaseHttpTest(BaseTest):
+    """
+    Base class for tests that need a local HTTP server
+    with range request support - no internet access needed
+    """
+
+    handler_class = RangeRequestHandler
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.serve_dir = tempfile.mkdtemp(prefix="bdown-serve-")
+        handler = partial(cls.handler_class, directory=cls.serve_dir)
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        cls.server.daemon_threads = True
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        host, port = cls.server.server_address
+        cls.base_url = f"http://{host}:{port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        shutil.rmtree(cls.serve_dir, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self, debug=False, profile=True):
+        BaseTest.setUp(self, debug=debug, profile=profile)
+        self.work_dir = tempfile.mkdtemp(prefix="bdown-test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        BaseTest.tearDown(self)
+
+    def create_sample(self, name: str, size: int, seed: int = 42):
+        """
+        create a reproducible pseudo random sample file in the served directory
+
+        Args:
+            name: file name
+            size: size in bytes
+            seed: seed for the content
+
+        Returns:
+            tuple: (path, url, md5 hexdigest)
+        """
+        path = os.path.join(self.serve_dir, name)
+        data = bytearray()
+        counter = 0
+        while len(data) < size:
+            data.extend(hashlib.sha256(f"{seed}-{counter}".encode()).digest())
+            counter += 1
+        data = bytes(data[:size])
+        with open(path, "wb") as f:
+            f.write(data)
+        url = f"{self.base_url}/{name}"
+        md5 = hashlib.md5(data).hexdigest()
+        return path, url, md5
@@ -0,0 +1,89 @@
+"""
+Created on 2025-06-02
+
+@author: wf
+"""
+
+import os
+
+from bdown.batch import BatchEntry, BatchManifest, BatchScheduler
+from bdown.download import RemoteFileChanged
+from tests.basehttptest import BaseHttpTest
+
+
+class TestBatch(BaseHttpTest):
+    """
+    Test batch downloads of several files with one shared worker pool
+    """
+
+    def test_batch_download(self):
+        """
+        download three files with a global budget of 4 workers
+        and 2 connections per host and reassemble them
+        """
+        manifest = BatchManifest()
+        expected = {}
+        for i, size in enumerate([300_000, 1_000_000, 65_536]):
+            name = f"sample{i}"
+            _path, url, md5 = self.create_sample(f"{name}.bin", size, seed=i)
+            target = os.path.join(self.work_dir, name)
+            manifest.downloads.append(
+                BatchEntry(url=url, name=name, target=target, blocksize=64, unit="KB")
+            )
+            expected[name] = md5
+
+        manifest_path = os.path.join(self.work_dir, "batch.yaml")
+        manifest.save_to_yaml_file(manifest_path)
+        manifest = BatchManifest.ofFile(manifest_path)
+        self.assertEqual(3, len(manifest.downloads))
+
+        scheduler = BatchScheduler(boost=4, per_host=2)
+        for entry in manifest.downloads:
+            scheduler.add(entry.get_block_download(), entry.target)
+        # all files are on the same host and share its connection pool
+        self.assertEqual(1, len(scheduler.sessions))
+        self.assertEqual(1, len({id(job.bd.session) for job in scheduler.jobs}))
+        scheduler.run()
+        self.assertEqual({}, scheduler.sessions)
+
+        for entry, job in zip(manifest.downloads, scheduler.jobs):
+            self.assertEqual(job.expected_blocks, job.processed_blocks)
+            self.assertTrue(os.path.exists(entry.yaml_path))
+            output_path = os.path.join(self.work_dir, f"{entry.name}.bin")
+            md5 = job.bd.reassemble(entry.target, output_path)
+            self.assertEqual(expected[entry.name], md5)
+
+    def test_text_manifest(self):
+        """
+        read a plain text manifest
+        """
+        manifest_path = os.path.join(self.work_dir, "batch.txt")
+        with open(manifest_path, "w") as f:
+            f.write("# url name target\n")
+            f.write("http://localhost/a.iso a /tmp/a\n\n")
+            f.write("http://localhost/b.iso b /tmp/b\n")
+        manifest = BatchManifest.ofFile(manifest_path)
+        self.assertEqual(["a", "b"], [entry.name for entry in manifest.downloads])
+
+    def test_remote_file_changed(self):
+        """
+        a job whose remote file changes fails without counting the
+        skipped blocks and its download can be used again
+        """
+        path, url, _md5 = self.create_sample("changing.bin", 6 * 16 * 1024)
+        target = os.path.join(self.work_dir, "changing")
+        entry = BatchEntry(url=url, name="changing", target=target, blocksize=16, unit="KB")
+        scheduler = BatchScheduler(boost=2, per_host=2)
+        bd = entry.get_block_download()
+        job = scheduler.add(bd, target, paused=True)
+        # change the remote file after its validators have been pinned
+        stat = os.stat(path)
+        with open(path, "r+b") as f:
+            f.write(b"changed")
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        scheduler.resume(job)
+        scheduler.run()
+        self.assertIsInstance(job.changed, RemoteFileChanged)
+        self.assertEqual(set(), job.processed_blocks)
+        self.assertEqual(job.expected_blocks, job.missed_blocks)
+        self.assertFalse(bd.cancel_event.is_set())
@@ -0,0 +1,116 @@
+"""
+Created on 2025-06-11
+
+@author: wf
+"""
+
+import hashlib
+import os
+import tempfile
+
+from bdown.block import Block, BlockBitmap, Status, StatusSymbol, ValidationStamp
+from bdown.block_table import BlockTable
+from bdown.check import BlockCheck
+from bdown.download import BlockDownload
+from tests.basetest import BaseTest
+
+
+class TestBlockTable(BaseTest):
+    """
+    Test the compact array backed block table
+    """
+
+    def setUp(self, debug=False, profile=True):
+        BaseTest.setUp(self, debug=debug, profile=profile)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        BaseTest.tearDown(self)
+
+    def get_download(self, total_blocks: int = 5) -> BlockDownload:
+        bd = BlockDownload(
+            name="table", url="http://example.com/table.bin", blocksize=1, unit="KB", size=total_blocks * 1024
+        )
+        for index in range(total_blocks):
+            md5 = hashlib.md5(f"block {index}".encode()).hexdigest()
+            block = Block(
+                block=index,
+                path=f"table-{index:04d}.part",
+                offset=index * 1024,
+                md5=md5,
+                md5_head=hashlib.md5(f"head {index}".encode()).hexdigest(),
+                size=1024,
+            )
+            if index % 2 == 0:
+                block.validated = ValidationStamp(size=1024, mtime_ns=12345 + index, inode=77, md5=md5)
+            bd.blocks.append(block)
+        return bd
+
+    def test_bitmap_status(self):
+        """
+        the status bitmaps behave like sets
+        """
+        status = Status()
+        for index in (3, 700, 3):
+            status.update(StatusSymbol.FAIL, index)
+        fail = status.symbol_blocks[StatusSymbol.FAIL]
+        self.assertEqual({3, 700}, fail)
+        self.assertEqual(2, status.count(StatusSymbol.FAIL))
+        self.assertEqual([1, 3, 700], sorted(fail | BlockBitmap([1])))
+        self.assertNotIn(4, fail)
+
+    def test_lazy_blocks(self):
+        """
+        the blocks of a table are equal to the original blocks
+        """
+        bd = self.get_download()
+        table = BlockTable.ofBlocks(reversed(bd.blocks), bd.total_blocks, name=bd.name)
+        self.assertEqual(5, len(table))
+        lazy_blocks = table.as_list()
+        self.assertEqual(bd.blocks, list(lazy_blocks))
+        self.assertEqual(bd.blocks[3], lazy_blocks[3])
+        self.assertEqual(bytes.fromhex(bd.blocks[2].md5), table.md5_digest(2))
+        self.assertIsNone(table.get_block(5))
+
+    def test_streamed_yaml(self):
+        """
+        the streamed YAML of a table backed manifest loads like a regular manifest
+        """
+        bd = self.get_download()
+        plain_path = os.path.join(self.tmp_dir.name, "plain.yaml")
+        bd.save_to_yaml_file(plain_path)
+        table_path = os.path.join(self.tmp_dir.name, "table.yaml")
+        bd.set_block_table(bd.get_block_table())
+        bd.yaml_path = table_path
+        bd.save(update_md5_from_total_hash=False)
+        plain = BlockDownload.load_from_yaml_file(plain_path)
+        streamed = BlockDownload.load_from_yaml_file(table_path)
+        self.assertEqual(plain.blocks, streamed.blocks)
+        self.assertEqual(plain.size, streamed.size)
+        self.assertEqual(bd.blocks[4], bd.get_block(4))
+
+    def test_compare(self):
+        """
+        a table backed manifest is compared with a plain manifest
+        block by block without building an index
+        """
+        bd1 = self.get_download()
+        bd1.set_block_table(bd1.get_block_table())
+        bd2 = self.get_download()
+        bd2.blocks[3].md5 = "0" * 32
+        del bd2.blocks[1]
+        file1 = os.path.join(self.tmp_dir.name, "table.bin")
+        with open(file1, "wb") as f:
+            f.write(b"\0" * 5 * 1024)
+        checker = BlockCheck(name="table", file1=file1, blocksize=1, unit="KB")
+        checker.compare_block_downloads(bd1, bd2)
+        self.assertEqual({0, 2, 4}, checker.status.symbol_blocks[StatusSymbol.SUCCESS])
+        self.assertEqual({3}, checker.status.symbol_blocks[StatusSymbol.FAIL])
+
+    def test_memory(self):
+        """
+        the table needs far less memory than Block objects
+        """
+        table = BlockTable(1_000_000, name="huge")
+        self.assertLess(table.nbytes, 80 * 1_000_000)
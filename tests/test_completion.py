@@ -0,0 +1,92 @@
+"""
+Created on 2025-06-09
+
+@author: wf
+"""
+
+import asyncio
+import glob
+import hashlib
+import os
+import time
+
+from bdown.download import BlockDownload
+from tests.basehttptest import BaseHttpTest
+
+
+class TestCompletion(BaseHttpTest):
+    """
+    Test the block completion iterator and callbacks
+    """
+
+    def setUp(self, debug=False, profile=True):
+        BaseHttpTest.setUp(self, debug=debug, profile=profile)
+        _path, self.url, self.md5 = self.create_sample("complete.bin", 8 * 16 * 1024 + 5)
+        self.target = os.path.join(self.work_dir, "parts")
+
+    def get_download(self) -> BlockDownload:
+        bd = BlockDownload(name="complete", url=self.url, blocksize=16, unit="KB")
+        bd.yaml_path = os.path.join(self.target, "complete.yaml")
+        return bd
+
+    def test_iter_completed_blocks(self):
+        """
+        a slow consumer gets every block as soon as its part file is complete
+        """
+        bd = self.get_download()
+        indices = []
+        for block in bd.iter_completed_blocks(self.target, boost=4, max_pending=1):
+            with open(os.path.join(self.target, block.path), "rb") as f:
+                self.assertEqual(block.md5, hashlib.md5(f.read()).hexdigest())
+            indices.append(block.block)
+            time.sleep(0.01)
+        self.assertEqual(list(range(9)), sorted(indices))
+        output_path = os.path.join(self.work_dir, "complete.out")
+        self.assertEqual(self.md5, bd.reassemble(self.target, output_path))
+
+    def test_early_stop(self):
+        """
+        a consumer that stops early stops the download
+        """
+        bd = self.get_download()
+        for block in bd.iter_completed_blocks(self.target, boost=1, max_pending=1):
+            break
+        parts = glob.glob(os.path.join(self.target, "*.part"))
+        self.assertLess(len(parts), 9)
+
+    def test_async_and_callback(self):
+        """
+        the async iterator and the callback hooks see all blocks
+        """
+        bd = self.get_download()
+        called = []
+        bd.add_block_callback(lambda block: called.append(block.block))
+
+        async def consume():
+            indices = []
+            async for block in bd.aiter_completed_blocks(self.target, boost=3):
+                indices.append(block.block)
+            return indices
+
+        indices = asyncio.run(consume())
+        self.assertEqual(list(range(9)), sorted(indices))
+        self.assertEqual(list(range(9)), sorted(called))
+
+    def test_resume(self):
+        """
+        a resumed download yields the blocks that are already present
+        whether they are in the manifest or only have their block YAML
+        """
+        bd = self.get_download()
+        bd.download(self.target, from_block=0, to_block=4)
+        resumed = BlockDownload.ofYamlPath(bd.yaml_path)
+        indices = [block.block for block in resumed.iter_completed_blocks(self.target, boost=2)]
+        self.assertEqual(list(range(9)), sorted(indices))
+        # a crash before the manifest was saved leaves only the block YAMLs
+        os.remove(bd.yaml_path)
+        fresh = self.get_download()
+        indices = [block.block for block in fresh.iter_completed_blocks(self.target, boost=2)]
+        self.assertEqual(list(range(9)), sorted(indices))
+        self.assertEqual(9, len(fresh.blocks))
+        output_path = os.path.join(self.work_dir, "complete.out")
+        self.assertEqual(self.md5, fresh.reassemble(self.target, output_path))
@@ -0,0 +1,84 @@
+"""
+Created on 2025-06-09
+
+@author: wf
+"""
+
+import glob
+import hashlib
+import os
+
+from bdown.consume import ConsumingReassembler
+from bdown.content_store import ContentStore
+from bdown.download import BlockDownload
+from tests.basehttptest import BaseHttpTest
+
+
+class TestConsume(BaseHttpTest):
+    """
+    Test the low disk reassembly that consumes the part files
+    """
+
+    def test_consume_and_resume(self):
+        """
+        a run interrupted by a bad part file is resumed after patching
+        """
+        _path, url, md5 = self.create_sample("consume.bin", 5 * 16 * 1024 + 42)
+        target = os.path.join(self.work_dir, "parts")
+        yaml_path = os.path.join(target, "consume.yaml")
+        bd = BlockDownload(name="consume", url=url, blocksize=16, unit="KB")
+        bd.yaml_path = yaml_path
+        bd.download(target, boost=2)
+        with open(os.path.join(target, "consume-0003.part"), "r+b") as f:
+            f.seek(1000)
+            f.write(b"damaged")
+
+        output_path = os.path.join(self.work_dir, "consume.out")
+        bd = BlockDownload.ofYamlPath(yaml_path)
+        with self.assertRaises(ValueError):
+            ConsumingReassembler(bd, target, output_path).reassemble()
+        parts = sorted(os.path.basename(p) for p in glob.glob(os.path.join(target, "*.part")))
+        self.assertEqual(["consume-0003.part", "consume-0004.part", "consume-0005.part"], parts)
+
+        bd.download(target, block_indices=[3], force=True)
+        bd = BlockDownload.ofYamlPath(yaml_path)
+        self.assertEqual(md5, ConsumingReassembler(bd, target, output_path).reassemble())
+        self.assertEqual([], glob.glob(os.path.join(target, "*.part")))
+        self.assertFalse(os.path.exists(f"{output_path}.consume.yaml"))
+
+    def test_consume_with_content_store(self):
+        """
+        a part file that is hardlinked into the content store is copied
+        instead of becoming the output so the stored block stays intact
+        """
+        _path, url, md5 = self.create_sample("stored.bin", 3 * 16 * 1024 + 7)
+        target = os.path.join(self.work_dir, "parts")
+        bd = BlockDownload(name="stored", url=url, blocksize=16, unit="KB")
+        bd.yaml_path = os.path.join(target, "stored.yaml")
+        store = ContentStore(os.path.join(self.work_dir, "store"))
+        bd.content_store = store
+        bd.download(target)
+        output_path = os.path.join(self.work_dir, "stored.out")
+        bd = BlockDownload.ofYamlPath(bd.yaml_path)
+        self.assertEqual(md5, ConsumingReassembler(bd, target, output_path).reassemble())
+        for block in bd.blocks:
+            with open(store.path_for(block.md5), "rb") as f:
+                self.assertEqual(block.md5, hashlib.md5(f.read()).hexdigest())
+
+    def test_consume_force(self):
+        """
+        a stale output without a consume state is only replaced with force
+        """
+        _path, url, md5 = self.create_sample("stale.bin", 2 * 16 * 1024 + 3)
+        target = os.path.join(self.work_dir, "parts")
+        bd = BlockDownload(name="stale", url=url, blocksize=16, unit="KB")
+        bd.yaml_path = os.path.join(target, "stale.yaml")
+        bd.download(target)
+        output_path = os.path.join(self.work_dir, "stale.out")
+        with open(output_path, "wb") as f:
+            f.write(b"stale output of an earlier run")
+        with self.assertRaises(FileExistsError):
+            ConsumingReassembler(bd, target, output_path).reassemble()
+        self.assertEqual(md5, ConsumingReassembler(bd, target, output_path, force=True).reassemble())
+        self.assertEqual(2 * 16 * 1024 + 3, os.path.getsize(output_path))
+        self.assertEqual([], glob.glob(os.path.join(target, "*.part")))
@@ -0,0 +1,45 @@
+"""
+Created on 2025-06-08
+
+@author: wf
+"""
+
+import os
+import shutil
+
+from bdown.content_store import ContentStore
+from bdown.download import BlockDownload
+from tests.basehttptest import BaseHttpTest
+
+
+class TestContentStore(BaseHttpTest):
+    """
+    Test deduplication of blocks via the content addressed store
+    """
+
+    def test_dedup_download(self):
+        """
+        a second download with a known manifest takes all blocks from the store
+        """
+        _path, url, md5 = self.create_sample("dedup.bin", 5 * 16 * 1024 + 99)
+        store = ContentStore(os.path.join(self.work_dir, "store"))
+        first_target = os.path.join(self.work_dir, "first")
+        bd = BlockDownload(name="dedup", url=url, blocksize=16, unit="KB")
+        bd.yaml_path = os.path.join(first_target, "dedup.yaml")
+        bd.content_store = store
+        bd.download(first_target, boost=2)
+        self.assertEqual(0, store.hits)
+        self.assertEqual(6, store.misses)
+
+        second_target = os.path.join(self.work_dir, "second")
+        os.makedirs(second_target)
+        second_yaml = os.path.join(second_target, "dedup.yaml")
+        shutil.copyfile(bd.yaml_path, second_yaml)
+        bd2 = BlockDownload.ofYamlPath(second_yaml)
+        bd2.content_store = store
+        bd2.download(second_target, boost=2)
+        self.assertEqual(6, store.hits)
+        self.assertAlmostEqual(0.5, store.hit_rate)
+        output_path = os.path.join(self.work_dir, "dedup.out")
+        self.assertEqual(md5, bd2.reassemble(second_target, output_path))
+
@@ -0,0 +1,131 @@
+"""
+Created on 2025-06-03
+
+@author: wf
+"""
+
+import hashlib
+import json
+import os
+import time
+import urllib.request
+
+from bdown.daemon import DownloadDaemon
+from tests.basehttptest import BaseHttpTest
+
+
+class TestDaemon(BaseHttpTest):
+    """
+    Test the resident download daemon and its job API
+    """
+
+    def setUp(self, debug=False, profile=True):
+        super().setUp(debug, profile)
+        self.state_dir = os.path.join(self.work_dir, "state")
+
+    def api(self, api_url: str, path: str, body: dict = None):
+        data = json.dumps(body).encode() if body is not None else None
+        method = "POST" if body is not None else "GET"
+        request = urllib.request.Request(f"{api_url}{path}", data=data, method=method)
+        with urllib.request.urlopen(request) as response:
+            result = json.loads(response.read())
+        return result
+
+    def wait_for_state(self, daemon, job_id: str, states, timeout: float = 20.0):
+        start = time.time()
+        while time.time() - start < timeout:
+            status = daemon.status(job_id)
+            if status["state"] in states:
+                return status
+            time.sleep(0.05)
+        self.fail(f"job {job_id} did not reach {states}: {daemon.status(job_id)}")
+
+    def test_submit_and_query(self):
+        """
+        submit jobs via the HTTP API and wait for the reassembled files
+        """
+        daemon = DownloadDaemon(self.state_dir, boost=4, per_host=2)
+        daemon.start()
+        server = daemon.serve_http(port=0)
+        host, port = server.server_address
+        api_url = f"http://{host}:{port}"
+        try:
+            expected = {}
+            for i in range(2):
+                name = f"daemon{i}"
+                _path, url, md5 = self.create_sample(f"{name}.bin", 200_000 + i, seed=i)
+                spec = {
+                    "url": url,
+                    "name": name,
+                    "target": os.path.join(self.work_dir, name),
+                    "blocksize": 64,
+                    "unit": "KB",
+                    "output": os.path.join(self.work_dir, f"{name}.bin"),
+                }
+                status = self.api(api_url, "/jobs", spec)
+                expected[status["id"]] = (md5, spec["output"])
+            for job_id, (md5, output) in expected.items():
+                self.wait_for_state(daemon, job_id, ["done"])
+                status = self.api(api_url, f"/jobs/{job_id}")
+                self.assertEqual(4, status["blocks_total"])
+                self.assertEqual(4, status["blocks_done"])
+                with open(output, "rb") as f:
+                    self.assertEqual(md5, hashlib.md5(f.read()).hexdigest())
+            self.assertEqual(2, len(self.api(api_url, "/jobs")))
+        finally:
+            daemon.stop()
+
+    def test_pause_resume_restart(self):
+        """
+        pause a throttled job, restart the daemon and let the job complete
+        """
+        _path, url, _md5 = self.create_sample("slow.bin", 256 * 1024)
+        spec = {
+            "url": url,
+            "name": "slow",
+            "target": os.path.join(self.work_dir, "slow"),
+            "blocksize": 16,
+            "unit": "KB",
+        }
+        daemon = DownloadDaemon(self.state_dir, boost=2, per_host=2, rate_limit=256 * 1024)
+        daemon.start()
+        job = daemon.submit(spec)
+        daemon.pause(job.id)
+        self.assertEqual("paused", daemon.status(job.id)["state"])
+        daemon.stop()
+
+        daemon = DownloadDaemon(self.state_dir, boost=4, per_host=4)
+        daemon.start()
+        try:
+            self.assertEqual("paused", daemon.status(job.id)["state"])
+            daemon.resume(job.id)
+            status = self.wait_for_state(daemon, job.id, ["done", "failed"])
+            self.assertEqual("done", status["state"])
+        finally:
+            daemon.stop()
+
+    def test_cancel(self):
+        """
+        cancel a paused job
+        """
+        _path, url, _md5 = self.create_sample("cancel.bin", 64 * 1024)
+        daemon = DownloadDaemon(self.state_dir)
+        daemon.start()
+        try:
+            job = daemon.submit(
+                {
+                    "url": url,
+                    "name": "cancel",
+                    "target": os.path.join(self.work_dir, "cancel"),
+                    "blocksize": 16,
+                    "unit": "KB",
+                }
+            )
+            daemon.pause(job.id)
+            daemon.cancel(job.id)
+            status = self.wait_for_state(daemon, job.id, ["cancelled", "done"])
+            self.assertIn(status["state"], ["cancelled", "done"])
+            status, result = daemon.handle("GET", "/jobs/unknown", {})
+            self.assertEqual(404, status)
+        finally:
+            daemon.stop()
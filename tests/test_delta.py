@@ -0,0 +1,42 @@
+"""
+Created on 2025-06-08
+
+@author: wf
+"""
+
+import os
+import shutil
+
+from bdown.check import BlockCheck
+from bdown.delta import DeltaUpdate
+from tests.basehttptest import BaseHttpTest
+
+
+class TestDelta(BaseHttpTest):
+    """
+    Test the delta update from a local older copy
+    """
+
+    def test_delta_update(self):
+        """
+        only the changed blocks of the new version are downloaded
+        """
+        new_path, url, md5 = self.create_sample("delta.bin", 6 * 16 * 1024 + 321)
+        old_path = os.path.join(self.work_dir, "delta-old.bin")
+        shutil.copyfile(new_path, old_path)
+        with open(old_path, "r+b") as f:
+            for index in (1, 4):
+                f.seek(index * 16 * 1024 + 100)
+                f.write(b"outdated")
+
+        checker = BlockCheck(name="delta", file1=old_path, blocksize=16, unit="KB")
+        checker.get_or_create_yaml(old_path, url)
+        checker.get_or_create_yaml(new_path, url)
+
+        target = os.path.join(self.work_dir, "parts")
+        delta = DeltaUpdate.ofPaths(old_path, new_path + ".yaml", target)
+        bd = delta.update(boost=2)
+        self.assertEqual([0, 2, 3, 5, 6], delta.unchanged_blocks)
+        self.assertEqual(4 * 16 * 1024 + 321, delta.copied_bytes)
+        output_path = os.path.join(self.work_dir, "delta.out")
+        self.assertEqual(md5, bd.reassemble(target, output_path))
@@ -0,0 +1,65 @@
+"""
+Created on 2025-06-10
+
+@author: wf
+"""
+
+import hashlib
+import os
+import tempfile
+
+from bdown.block import StatusSymbol
+from bdown.check import BlockCheck
+from bdown.download import BlockDownload
+from tests.basetest import BaseTest
+
+
+class TestDirectCompare(BaseTest):
+    """
+    Test the direct parallel comparison of two local files
+    """
+
+    def setUp(self, debug=False, profile=True):
+        BaseTest.setUp(self, debug=debug, profile=profile)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data = os.urandom(6 * 16 * 1024 + 99)
+        changed = bytearray(self.data)
+        for index in (2, 4):
+            changed[index * 16 * 1024 + 77] ^= 0xFF
+        self.path1 = os.path.join(self.tmp_dir.name, "a.bin")
+        self.path2 = os.path.join(self.tmp_dir.name, "b.bin")
+        for path, data in ((self.path1, self.data), (self.path2, bytes(changed))):
+            with open(path, "wb") as f:
+                f.write(data)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        BaseTest.tearDown(self)
+
+    def get_checker(self) -> BlockCheck:
+        checker = BlockCheck(
+            name="a.bin", file1=self.path1, file2=self.path2, blocksize=16, unit="KB"
+        )
+        return checker
+
+    def test_compare_direct(self):
+        """
+        all differing blocks are reported and the manifests are cached
+        """
+        status = self.get_checker().compare_direct(url="http://example.com/a.bin", workers=3, cache_yaml=True)
+        self.assertEqual({2, 4}, status.symbol_blocks[StatusSymbol.FAIL])
+        self.assertEqual(5, status.count(StatusSymbol.SUCCESS))
+        bd = BlockDownload.ofYamlPath(self.path1 + ".yaml")
+        self.assertEqual(7, len(bd.blocks))
+        block = bd.blocks[3]
+        expected = hashlib.md5(self.data[3 * 16 * 1024 : 4 * 16 * 1024]).hexdigest()
+        self.assertEqual(expected, block.md5)
+        self.assertTrue(os.path.exists(self.path2 + ".yaml"))
+
+    def test_raw_early_exit(self):
+        """
+        a raw comparison stops at the first differing block
+        """
+        status = self.get_checker().compare_direct(workers=1, early_exit=True, raw=True)
+        self.assertEqual({2}, status.symbol_blocks[StatusSymbol.FAIL])
+        self.assertEqual({0, 1}, status.symbol_blocks[StatusSymbol.SUCCESS])
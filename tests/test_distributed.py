@@ -0,0 +1,132 @@
+"""
+Created on 2025-06-11
+
+@author: wf
+"""
+
+import hashlib
+import os
+import threading
+
+from bdown.block import Block
+from bdown.distributed import DownloadCoordinator, DownloadWorker
+from bdown.download import BlockDownload
+from tests.basehttptest import BaseHttpTest
+
+
+class TestDistributed(BaseHttpTest):
+    """
+    Test the distributed download with a coordinator and block range leases
+    """
+
+    def setUp(self, debug=False, profile=True):
+        BaseHttpTest.setUp(self, debug=debug, profile=profile)
+        self.path, self.url, self.md5 = self.create_sample("cluster.bin", 10 * 16 * 1024 + 7)
+
+    def get_coordinator(self, lease_timeout: float = 10.0) -> DownloadCoordinator:
+        bd = BlockDownload(name="cluster", url=self.url, blocksize=16, unit="KB")
+        bd.yaml_path = os.path.join(self.work_dir, "cluster.yaml")
+        coordinator = DownloadCoordinator(bd, self.work_dir, range_blocks=3, lease_timeout=lease_timeout)
+        return coordinator
+
+    def check_reassembly(self, bd: BlockDownload):
+        output = os.path.join(self.work_dir, "cluster.out")
+        bd.reassemble(self.work_dir, output)
+        with open(output, "rb") as f:
+            self.assertEqual(self.md5, hashlib.md5(f.read()).hexdigest())
+
+    def test_workers(self):
+        """
+        two workers share the leases and the merged manifest is complete
+        """
+        coordinator = self.get_coordinator()
+        self.assertEqual([(0, 2), (3, 5), (6, 8), (9, 10)], coordinator.ranges)
+        server = coordinator.serve_http(port=0)
+        host, port = server.server_address
+        api_url = f"http://{host}:{port}"
+        workers = [
+            DownloadWorker(api_url, self.work_dir, boost=2, worker_id=f"w{i}", poll_interval=0.05)
+            for i in range(2)
+        ]
+        threads = [threading.Thread(target=worker.run) for worker in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=30)
+        coordinator.stop()
+        status = coordinator.status()
+        self.assertTrue(status["finished"])
+        self.assertEqual(4, sum(worker.completed_leases for worker in workers))
+        self.assertEqual(11, sum(status["workers"].values()))
+        merged = BlockDownload.ofYamlPath(coordinator.bd.yaml_path)
+        self.assertEqual("complete_consistent", merged.blocks_state)
+        self.check_reassembly(merged)
+        # a restarted coordinator has nothing left to hand out
+        restarted = DownloadCoordinator(merged, self.work_dir)
+        self.assertEqual({"done": True}, restarted.acquire("late"))
+
+    def test_lease_expiry(self):
+        """
+        the range of an expired lease is handed out again and
+        conflicting blocks are rejected
+        """
+        coordinator = self.get_coordinator(lease_timeout=0.0)
+        lost = coordinator.acquire("lost")
+        self.assertEqual((0, 2), (lost["from_block"], lost["to_block"]))
+        retry = coordinator.acquire("retry")
+        self.assertEqual((0, 2), (retry["from_block"], retry["to_block"]))
+        status, result = coordinator.handle("POST", f"/leases/{lost['id']}/renew", {})
+        self.assertEqual(409, status)
+        self.assertIn("expired", result["error"])
+        bd = BlockDownload(**retry["download"])
+        bd.download(self.work_dir, from_block=0, to_block=2)
+        blocks = [block.to_dict() for block in bd.blocks]
+        status, result = coordinator.handle("POST", f"/leases/{retry['id']}/complete", {"blocks": blocks[:2]})
+        self.assertEqual(409, status)
+        self.assertIn("needs blocks 0-2", result["error"])
+        status, _result = coordinator.handle("POST", f"/leases/{retry['id']}/complete", {"blocks": blocks})
+        self.assertEqual(200, status)
+        # the late blocks of the lost lease must match the merged blocks
+        blocks[1]["md5"] = "0" * 32
+        status, result = coordinator.handle("POST", f"/leases/{lost['id']}/complete", {"blocks": blocks})
+        self.assertEqual(409, status)
+        self.assertIn("conflicts", result["error"])
+        self.assertEqual(1, coordinator.status()["done"])
+
+    def test_lease_again_on_shared_target(self):
+        """
+        a range that is leased again on the same directory is completed with the
+        blocks of the lost worker and an incomplete part file is downloaded again
+        """
+        coordinator = self.get_coordinator(lease_timeout=0.0)
+        server = coordinator.serve_http(port=0)
+        host, port = server.server_address
+        lost = coordinator.acquire("lost")
+        # the lost worker finished its blocks but never handed them in
+        BlockDownload(**lost["download"]).download(self.work_dir, from_block=0, to_block=2)
+        os.remove(os.path.join(self.work_dir, coordinator.bd.part_yaml_path(2)))
+        worker = DownloadWorker(f"http://{host}:{port}", self.work_dir, worker_id="retry")
+        retry = coordinator.acquire("retry")
+        self.assertEqual((0, 2), (retry["from_block"], retry["to_block"]))
+        self.assertTrue(worker.work_lease(retry))
+        coordinator.stop()
+        self.assertEqual(1, coordinator.status()["done"])
+        self.assertEqual([0, 1, 2], [block.block for block in coordinator.bd.blocks])
+
+    def test_rejected_lease(self):
+        """
+        a lease whose blocks are rejected is given back and the worker goes on
+        """
+        coordinator = self.get_coordinator()
+        server = coordinator.serve_http(port=0)
+        host, port = server.server_address
+        worker = DownloadWorker(f"http://{host}:{port}", self.work_dir, worker_id="w")
+        lease = coordinator.acquire("w")
+        # a merged block that conflicts with the remote block
+        coordinator.bd.blocks.append(
+            Block(block=1, path=coordinator.bd.part_path(1), offset=16 * 1024, md5="0" * 32)
+        )
+        self.assertFalse(worker.work_lease(lease))
+        coordinator.stop()
+        self.assertEqual("failed", coordinator.leases[lease["id"]].state)
+        self.assertEqual((0, 2), coordinator.pending[0])
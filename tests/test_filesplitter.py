@@ -4,7 +4,10 @@ Created on 2025-05-21
 @author: wf
 """
 
+import hashlib
 import os
+import shutil
+import tempfile
 
 from bdown.download import BlockDownload
 
@@ -60,3 +63,74 @@ class TestFileSplitter(BaseBlockTest):
 
             self.assertEqual(split_md5, actual_md5)
             self.assertEqual(orig_md5, actual_md5)
+
+    def test_parallel_split(self):
+        """
+        Split a local file serially and in parallel and
+        verify that both produce identical block metadata
+        """
+        tmp_dir = tempfile.mkdtemp(prefix="bdown-split-")
+        try:
+            file_path = os.path.join(tmp_dir, "sample.bin")
+            data = os.urandom(5 * 64 * 1024 + 1234)
+            with open(file_path, "wb") as f:
+                f.write(data)
+            splitters = {}
+            for workers in [1, 4]:
+                splitter = FileSplitter(name="sample", blocksize=64, unit="KB")
+                target_dir = os.path.join(tmp_dir, f"split{workers}")
+                splitter.split(file_path, target_dir, workers=workers)
+                splitters[workers] = splitter
+                for block in splitter.blocks:
+                    self.assertEqual(block.md5, block.calc_md5(target_dir))
+            serial, parallel = splitters[1], splitters[4]
+            self.assertEqual(6, len(parallel.blocks))
+            self.assertEqual(hashlib.md5(data).hexdigest(), parallel.md5)
+            self.assertEqual(serial.md5, parallel.md5)
+            for serial_block, parallel_block in zip(serial.blocks, parallel.blocks):
+                self.assertEqual(serial_block.to_dict(), parallel_block.to_dict())
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def test_virtual_split(self):
+        """
+        Split a local file virtually and verify that the
+        manifest only blocks validate and reassemble
+        """
+        tmp_dir = tempfile.mkdtemp(prefix="bdown-split-")
+        try:
+            file_path = os.path.join(tmp_dir, "sample.bin")
+            data = os.urandom(3 * 64 * 1024 + 99)
+            with open(file_path, "wb") as f:
+                f.write(data)
+            split_dir = os.path.join(tmp_dir, "split")
+            virtual_dir = os.path.join(tmp_dir, "virtual")
+            splitter = FileSplitter(name="sample", blocksize=64, unit="KB")
+            splitter.split(file_path, split_dir, workers=2)
+            vsplitter = FileSplitter(name="sample", blocksize=64, unit="KB")
+            vsplitter.split(file_path, virtual_dir, virtual=True)
+            # only the manifest has been written
+            self.assertEqual(["sample.yaml"], os.listdir(virtual_dir))
+            self.assertEqual(splitter.md5, vsplitter.md5)
+
+            bd = BlockDownload.ofYamlPath(os.path.join(virtual_dir, "sample.yaml"))
+            self.assertEqual("complete_consistent", bd.blocks_state)
+            for block, vblock in zip(splitter.blocks, bd.blocks):
+                self.assertTrue(vblock.virtual)
+                self.assertEqual(os.path.join("..", "sample.bin"), vblock.path)
+                self.assertEqual(block.md5, vblock.md5)
+                self.assertEqual(block.md5_head, vblock.md5_head)
+                self.assertTrue(vblock.is_valid(virtual_dir, check_head=False))
+
+            output_path = os.path.join(tmp_dir, "reassembled.bin")
+            md5 = bd.reassemble(virtual_dir, output_path)
+            self.assertEqual(hashlib.md5(data).hexdigest(), md5)
+
+            # a change in the source file is detected
+            with open(file_path, "r+b") as f:
+                f.seek(2 * 64 * 1024 + 10)
+                f.write(b"changed")
+            self.assertTrue(bd.blocks[1].is_valid(virtual_dir, check_head=False))
+            self.assertFalse(bd.blocks[2].is_valid(virtual_dir, check_head=False))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -0,0 +1,67 @@
+"""
+Created on 2025-06-09
+
+@author: wf
+"""
+
+import hashlib
+import os
+import tempfile
+
+from bdown.block import Block
+from bdown.io_policy import IoPolicy, cache_residency
+from tests.basetest import BaseTest
+
+
+class TestIoPolicy(BaseTest):
+    """
+    Test the page cache friendly I/O policy
+    """
+
+    def setUp(self, debug=False, profile=True):
+        BaseTest.setUp(self, debug=debug, profile=profile)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "io.bin")
+        self.data = os.urandom(3 * 1024 * 1024 + 777)
+        with open(self.path, "wb") as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        BaseTest.tearDown(self)
+
+    def test_read_chunks(self):
+        """
+        all policies read the same unaligned ranges in chunks of the requested size
+        """
+        policies = [
+            IoPolicy(),
+            IoPolicy(drop_cache=True),
+            IoPolicy(direct=True, direct_buffer_size=64 * 1024),
+            IoPolicy(sequential=False, preallocate=False),
+        ]
+        for policy in policies:
+            for offset, size in [(0, None), (12345, 1024 * 1024 + 3), (5000, 10)]:
+                chunks = list(policy.read_chunks(self.path, offset, size, chunk_size=8192))
+                end = len(self.data) if size is None else offset + size
+                self.assertEqual(self.data[offset:end], b"".join(chunks), f"{policy}")
+                self.assertTrue(all(len(chunk) == 8192 for chunk in chunks[:-1]))
+
+    def test_calc_md5_and_copy_to(self):
+        """
+        hashing and copying with cache dropping and O_DIRECT give the same results
+        """
+        policy = IoPolicy(direct=True, drop_cache=True)
+        block = Block(block=0, path="io.bin", offset=0)
+        md5 = block.calc_md5(self.tmp_dir.name, io_policy=policy)
+        self.assertEqual(hashlib.md5(self.data).hexdigest(), md5)
+        output_path = os.path.join(self.tmp_dir.name, "out.bin")
+        with open(output_path, "wb") as f:
+            policy.preallocate_fd(f.fileno(), len(self.data))
+        self.assertEqual(len(self.data), block.copy_to(self.tmp_dir.name, output_path, io_policy=policy))
+        with open(output_path, "rb") as f:
+            self.assertEqual(self.data, f.read())
+        residency = cache_residency(output_path)
+        if residency is not None:
+            self.assertGreaterEqual(residency, 0.0)
+            self.assertLessEqual(residency, 1.0)
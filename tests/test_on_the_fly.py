@@ -0,0 +1,59 @@
+"""
+Created on 2025-06-12
+
+@author: wf
+"""
+
+import hashlib
+import os
+import threading
+import time
+
+from bdown.download import BlockDownload
+from tests.basehttptest import BaseHttpTest, RangeRequestHandler
+
+
+class SlowRangeRequestHandler(RangeRequestHandler):
+    """
+    handler of a slow server that sends its data in small delayed chunks
+    """
+
+    def copyfile(self, source, outputfile):
+        remaining = getattr(self, "range_remaining", None)
+        while remaining is None or remaining > 0:
+            chunk = source.read(4096 if remaining is None else min(4096, remaining))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            outputfile.flush()
+            if remaining is not None:
+                remaining -= len(chunk)
+            time.sleep(0.01)
+
+
+class TestOnTheFly(BaseHttpTest):
+    """
+    Test the on the fly reassembly of a running download
+    """
+
+    handler_class = SlowRangeRequestHandler
+
+    def test_reassemble_while_downloading(self):
+        """
+        a reader reassembling while a slow download is running only
+        copies complete blocks
+        """
+        _path, url, md5 = self.create_sample("otf.bin", 6 * 32 * 1024 + 99)
+        bd = BlockDownload(name="otf", url=url, blocksize=32, unit="KB")
+        bd.yaml_path = os.path.join(self.work_dir, "otf.yaml")
+        bd.prepare_download(self.work_dir)
+        download = threading.Thread(target=bd.download, args=(self.work_dir,), kwargs={"boost": 3})
+        download.start()
+        # a second process would load the early saved manifest
+        reader = BlockDownload.load_from_yaml_file(bd.yaml_path)
+        output = os.path.join(self.work_dir, "otf.out")
+        reassembled_md5 = reader.reassemble(self.work_dir, output, on_the_fly=True, timeout=30)
+        download.join()
+        self.assertEqual(md5, reassembled_md5)
+        with open(output, "rb") as f:
+            self.assertEqual(md5, hashlib.md5(f.read()).hexdigest())
@@ -0,0 +1,100 @@
+"""
+Created on 2025-06-11
+
+@author: wf
+"""
+
+import glob
+import hashlib
+import os
+from unittest import mock
+
+from bdown.download import BlockDownload
+from bdown.part_layout import PartLayout
+from tests.basehttptest import BaseHttpTest
+
+
+class TestPartLayout(BaseHttpTest):
+    """
+    Test the flat and sharded part file layouts
+    """
+
+    def setUp(self, debug=False, profile=True):
+        BaseHttpTest.setUp(self, debug=debug, profile=profile)
+        self.path, self.url, self.md5 = self.create_sample("layout.bin", 6 * 16 * 1024 + 11)
+        self.yaml_path = os.path.join(self.work_dir, "layout.yaml")
+
+    def get_download(self, part_layout: str = None) -> BlockDownload:
+        bd = BlockDownload(
+            name="layout", url=self.url, blocksize=16, unit="KB", part_layout=part_layout
+        )
+        bd.yaml_path = self.yaml_path
+        return bd
+
+    def check_reassembly(self, bd: BlockDownload):
+        output = os.path.join(self.work_dir, "layout.out")
+        bd.reassemble(self.work_dir, output)
+        with open(output, "rb") as f:
+            self.assertEqual(self.md5, hashlib.md5(f.read()).hexdigest())
+
+    def test_naming(self):
+        """
+        flat names are kept, sharded names are wide and spread over subdirectories
+        """
+        flat = PartLayout("iso", 12)
+        self.assertEqual("iso-0011.part", flat.part_path(11))
+        sharded = PartLayout("iso", 12, PartLayout.SHARDED)
+        part_path = sharded.part_path(11)
+        self.assertRegex(part_path, r"^[0-9a-f]{2}/[0-9a-f]{2}/iso-000011\.part$")
+        self.assertEqual(part_path.replace(".part", ".yaml"), sharded.yaml_path(11))
+        self.assertTrue(PartLayout("iso", 2_000_000, PartLayout.SHARDED).part_path(5).endswith("iso-0000005.part"))
+        self.assertEqual(PartLayout.SHARDED, PartLayout.default_layout(10000))
+        self.assertEqual(PartLayout.FLAT, PartLayout.default_layout(9999))
+
+    def test_sharded_download(self):
+        """
+        a sharded download can be resumed and reassembled
+        """
+        bd = self.get_download(PartLayout.SHARDED)
+        bd.download(self.work_dir, boost=3)
+        self.assertEqual([], glob.glob(os.path.join(self.work_dir, "*.part")))
+        resumed = BlockDownload.ofYamlPath(self.yaml_path)
+        self.assertEqual("complete_consistent", resumed.blocks_state)
+        self.assertEqual(bd.part_path(3), resumed.get_block(3).path)
+        self.check_reassembly(resumed)
+
+    def test_migrate_flat(self):
+        """
+        a partial flat download is migrated when it is continued with a sharded layout
+        """
+        bd = self.get_download()
+        bd.download(self.work_dir, to_block=2)
+        self.assertEqual(3, len(glob.glob(os.path.join(self.work_dir, "layout-*.part"))))
+        resumed = BlockDownload.ofYamlPath(self.yaml_path)
+        resumed.part_layout = PartLayout.SHARDED
+        resumed.download(self.work_dir)
+        self.assertEqual([], glob.glob(os.path.join(self.work_dir, "layout-*")))
+        migrated = BlockDownload.ofYamlPath(self.yaml_path)
+        self.assertEqual(PartLayout.SHARDED, migrated.part_layout)
+        self.assertEqual(7, len(migrated.blocks))
+        for block in migrated.blocks:
+            self.assertEqual(migrated.part_path(block.block), block.path)
+        self.check_reassembly(migrated)
+
+    def test_migrate_once(self):
+        """
+        the flat files are only looked for until the manifest records the sharded layout
+        """
+        bd = self.get_download()
+        bd.download(self.work_dir, to_block=2)
+        resumed = BlockDownload.ofYamlPath(self.yaml_path)
+        resumed.part_layout = PartLayout.SHARDED
+        resumed.download(self.work_dir, to_block=4)
+        self.assertEqual([], glob.glob(os.path.join(self.work_dir, "**", "*.tmp"), recursive=True))
+        with mock.patch.object(PartLayout, "has_flat_files", side_effect=AssertionError("unexpected scan")):
+            with mock.patch.object(PartLayout, "migrate", side_effect=AssertionError("unexpected migration")):
+                again = BlockDownload.ofYamlPath(self.yaml_path)
+                again.download(self.work_dir)
+                sharded = self.get_download(PartLayout.SHARDED)
+                sharded.download(os.path.join(self.work_dir, "sharded"), to_block=0)
+        self.check_reassembly(again)
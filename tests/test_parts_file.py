@@ -0,0 +1,87 @@
+"""
+Created on 2025-06-10
+
+@author: wf
+"""
+
+import os
+import threading
+
+from bdown.download import BlockDownload
+from bdown.filesplitter import FileSplitter
+from bdown.parts_file import PartsFile
+from tests.basehttptest import BaseHttpTest
+
+
+class TestPartsFile(BaseHttpTest):
+    """
+    Test reading a parts directory as one logical file
+    """
+
+    def setUp(self, debug=False, profile=True):
+        BaseHttpTest.setUp(self, debug=debug, profile=profile)
+        self.path, self.url, _md5 = self.create_sample("logical.bin", 5 * 16 * 1024 + 300)
+        with open(self.path, "rb") as f:
+            self.data = f.read()
+        self.target = os.path.join(self.work_dir, "parts")
+
+    def test_read_across_blocks(self):
+        """
+        reads, slices and seeks across block boundaries
+        """
+        bd = BlockDownload(name="logical", url=self.url, blocksize=16, unit="KB")
+        bd.yaml_path = os.path.join(self.target, "logical.yaml")
+        bd.download(self.target, boost=2)
+        with PartsFile(bd, self.target) as pf:
+            self.assertEqual(self.data, pf.read())
+            pf.seek(16 * 1024 - 10)
+            self.assertEqual(self.data[16 * 1024 - 10 : 48 * 1024 + 5], pf.read(32 * 1024 + 15))
+            self.assertEqual(self.data[-400:], pf[-400:])
+            self.assertEqual(self.data[12345], pf[12345])
+            self.assertEqual(len(self.data), len(pf))
+
+    def test_virtual_split(self):
+        """
+        a virtual split manifest reads from the source file
+        """
+        splitter = FileSplitter(name="logical", blocksize=16, unit="KB")
+        splitter.split(file_path=self.path, target_dir=self.target, virtual=True)
+        with PartsFile(splitter, self.target) as pf:
+            self.assertEqual(self.data, pf.read())
+
+    def test_wait_for_block(self):
+        """
+        a read of a block that is still missing waits for its download
+        """
+        bd = BlockDownload(name="logical", url=self.url, blocksize=16, unit="KB")
+        bd.yaml_path = os.path.join(self.target, "logical.yaml")
+        bd.download(self.target, from_block=0, to_block=1)
+        pf = PartsFile(bd, self.target)
+        with self.assertRaises(IOError):
+            pf.pread(30 * 1024, 4 * 1024)
+        pf.wait = True
+        pf.poll_interval = 0.01
+        results = []
+        reader = threading.Thread(target=lambda: results.append(pf.pread(30 * 1024, 4 * 1024)))
+        reader.start()
+        bd.download(self.target, from_block=2, to_block=2)
+        reader.join(timeout=10)
+        self.assertEqual([self.data[30 * 1024 : 34 * 1024]], results)
+        pf.close()
+
+    def test_replaced_part(self):
+        """
+        a part file that is replaced by a new download of its block is read again
+        """
+        bd = BlockDownload(name="logical", url=self.url, blocksize=16, unit="KB")
+        bd.yaml_path = os.path.join(self.target, "logical.yaml")
+        bd.download(self.target)
+        part_file = os.path.join(self.target, bd.part_path(1))
+        with PartsFile(bd, self.target) as pf:
+            self.assertEqual(self.data[16 * 1024 : 16 * 1024 + 10], pf.pread(16 * 1024, 10))
+            # a new download replaces the part file by a rename
+            with open(f"{part_file}.tmp", "wb") as f:
+                f.write(b"x" * 16 * 1024)
+            os.replace(f"{part_file}.tmp", part_file)
+            self.assertEqual(b"x" * 10, pf.pread(16 * 1024, 10))
+            self.assertEqual(1, len(pf.stale_fds))
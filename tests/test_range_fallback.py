@@ -0,0 +1,91 @@
+"""
+Created on 2025-06-11
+
+@author: wf
+"""
+
+import hashlib
+import os
+
+from bdown.batch import BatchEntry, BatchScheduler
+from bdown.content_store import ContentStore
+from bdown.download import BlockDownload, RangeNotSupported
+from tests.basehttptest import BaseHttpTest, NoRangeRequestHandler
+
+
+class TestRangeFallback(BaseHttpTest):
+    """
+    Test the range capability probe and the single stream fallback
+    """
+
+    handler_class = NoRangeRequestHandler
+
+    def setUp(self, debug=False, profile=True):
+        BaseHttpTest.setUp(self, debug=debug, profile=profile)
+        self.path, self.url, self.md5 = self.create_sample("norange.bin", 5 * 16 * 1024 + 321)
+        NoRangeRequestHandler.requests = 0
+
+    def test_strict_range_check(self):
+        """
+        a full body answer to a range request is rejected
+        """
+        bd = BlockDownload(name="norange", url=self.url, blocksize=16, unit="KB")
+        self.assertFalse(bd.supports_ranges())
+        with self.assertRaises(RangeNotSupported):
+            bd.get_range_response(16 * 1024, 32 * 1024 - 1)
+
+    def test_single_stream_fallback(self):
+        """
+        the download uses a single request and still creates all blocks
+        """
+        bd = BlockDownload(name="norange", url=self.url, blocksize=16, unit="KB")
+        bd.yaml_path = os.path.join(self.work_dir, "norange.yaml")
+        bd.download(self.work_dir, boost=4)
+        # HEAD, probe and the single stream
+        self.assertEqual(3, NoRangeRequestHandler.requests)
+        self.assertEqual(6, len(bd.blocks))
+        with open(self.path, "rb") as f:
+            data = f.read()
+        for block in bd.blocks:
+            expected = hashlib.md5(data[block.offset : block.offset + 16 * 1024]).hexdigest()
+            self.assertEqual(expected, block.md5)
+        output = os.path.join(self.work_dir, "norange.out")
+        bd.reassemble(self.work_dir, output)
+        with open(output, "rb") as f:
+            self.assertEqual(self.md5, hashlib.md5(f.read()).hexdigest())
+
+    def test_single_stream_reference(self):
+        """
+        a block that does not match the reference stays missing and
+        the accepted blocks go to the content store
+        """
+        reference = BlockDownload(name="norange", url=self.url, blocksize=16, unit="KB")
+        reference.download(os.path.join(self.work_dir, "reference"))
+        reference.get_block(2).md5 = "0" * 32
+        bd = BlockDownload(name="norange", url=self.url, blocksize=16, unit="KB")
+        bd.yaml_path = os.path.join(self.work_dir, "norange.yaml")
+        bd.set_reference(reference)
+        bd.content_store = ContentStore(os.path.join(self.work_dir, "store"))
+        bd.download(self.work_dir)
+        self.assertEqual([0, 1, 3, 4, 5], [block.block for block in bd.blocks])
+        self.assertFalse(os.path.exists(os.path.join(self.work_dir, bd.part_path(2))))
+        self.assertFalse(os.path.exists(os.path.join(self.work_dir, bd.part_yaml_path(2))))
+        for block in bd.blocks:
+            self.assertTrue(bd.content_store.has(block.md5))
+
+    def test_batch_single_stream(self):
+        """
+        a batch job against a server without range support is
+        downloaded by a single worker with one stream
+        """
+        target = os.path.join(self.work_dir, "batch")
+        scheduler = BatchScheduler(boost=4, per_host=4)
+        entry = BatchEntry(url=self.url, name="norange", target=target, blocksize=16, unit="KB")
+        job = scheduler.add(entry.get_block_download(), target)
+        self.assertTrue(job.single_stream)
+        scheduler.run()
+        # HEAD, probe and the single stream
+        self.assertEqual(3, NoRangeRequestHandler.requests)
+        self.assertEqual(job.expected_blocks, job.processed_blocks)
+        output = os.path.join(self.work_dir, "norange.out")
+        self.assertEqual(self.md5, job.bd.reassemble(target, output))
@@ -0,0 +1,82 @@
+"""
+Created on 2025-06-08
+
+@author: wf
+"""
+
+import io
+import os
+import shutil
+
+from bdown.check import BlockCheck
+from bdown.download import BlockDownload
+from tests.basehttptest import BaseHttpTest
+
+
+class TestReference(BaseHttpTest):
+    """
+    Test the on the fly verification against a reference manifest
+    """
+
+    def setUp(self, debug=False, profile=True):
+        BaseHttpTest.setUp(self, debug=debug, profile=profile)
+        self.good_path, self.good_url, self.md5 = self.create_sample(
+            "ref.bin", 4 * 16 * 1024 + 10
+        )
+        bad_path = os.path.join(self.serve_dir, "ref-bad.bin")
+        shutil.copyfile(self.good_path, bad_path)
+        with open(bad_path, "r+b") as f:
+            f.seek(2 * 16 * 1024 + 5000)
+            f.write(b"bitrot")
+        self.bad_url = f"{self.base_url}/ref-bad.bin"
+        checker = BlockCheck(name="ref", file1=self.good_path, blocksize=16, unit="KB")
+        checker.get_or_create_yaml(self.good_path, self.good_url)
+        self.reference = BlockDownload.load_from_yaml_file(self.good_path + ".yaml")
+
+    def test_refetch_from_mirror(self):
+        """
+        a corrupt block from the primary URL is refetched from the mirror
+        """
+        target = os.path.join(self.work_dir, "parts")
+        bd = BlockDownload(name="ref", url=self.bad_url, blocksize=16, unit="KB")
+        bd.yaml_path = os.path.join(target, "ref.yaml")
+        bd.set_reference(self.reference)
+        bd.mirrors = [self.good_url]
+        bd.download(target, boost=2)
+        output_path = os.path.join(self.work_dir, "ref.out")
+        self.assertEqual(self.md5, bd.reassemble(target, output_path))
+
+        stream = io.BytesIO()
+        bd.blocks = []
+        self.assertEqual(self.md5, bd.download_to_stream(stream, boost=2))
+
+    def test_mismatch_without_mirror(self):
+        """
+        a block that never matches the reference fails
+        """
+        target = os.path.join(self.work_dir, "parts")
+        bd = BlockDownload(name="ref", url=self.bad_url, blocksize=16, unit="KB")
+        bd.yaml_path = os.path.join(target, "ref.yaml")
+        bd.set_reference(self.reference)
+        with self.assertRaises(ValueError):
+            bd.download(target, from_block=2, to_block=2)
+        # no unverified part or block YAML is left for a resume to pick up
+        self.assertFalse(os.path.exists(os.path.join(target, bd.part_path(2))))
+        self.assertFalse(os.path.exists(os.path.join(target, bd.part_yaml_path(2))))
+        self.assertEqual([], BlockDownload.ofYamlPath(bd.yaml_path).blocks)
+
+    def test_resume_with_reference(self):
+        """
+        an existing block that does not match the reference is downloaded again
+        """
+        target = os.path.join(self.work_dir, "parts")
+        bd = BlockDownload(name="ref", url=self.bad_url, blocksize=16, unit="KB")
+        bd.yaml_path = os.path.join(target, "ref.yaml")
+        bd.download(target)
+        resumed = BlockDownload.ofYamlPath(bd.yaml_path)
+        resumed.url = self.good_url
+        resumed.etag = resumed.last_modified = None
+        resumed.set_reference(self.reference)
+        resumed.download(target)
+        output_path = os.path.join(self.work_dir, "ref.out")
+        self.assertEqual(self.md5, resumed.reassemble(target, output_path))
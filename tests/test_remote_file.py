@@ -0,0 +1,80 @@
+"""
+Created on 2025-06-10
+
+@author: wf
+"""
+
+import io
+import os
+import zipfile
+
+from bdown.download import BlockDownload, RangeNotSupported
+from bdown.remote_file import RemoteBlockFile
+from tests.basehttptest import BaseHttpTest, NoRangeRequestHandler
+
+
+class TestRemoteFile(BaseHttpTest):
+    """
+    Test the random access file object over range requests
+    """
+
+    def test_zipfile(self):
+        """
+        read a single member of a remote zip file
+        """
+        members = {f"member{i}.bin": os.urandom(50 * 1024) for i in range(8)}
+        zip_path = os.path.join(self.serve_dir, "remote.zip")
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_STORED) as zf:
+            for name, data in members.items():
+                zf.writestr(name, data)
+        bd = BlockDownload(name="remote", url=f"{self.base_url}/remote.zip", blocksize=64, unit="KB")
+        remote = RemoteBlockFile(bd, page_size=16 * 1024, cache_size=64 * 1024)
+        with zipfile.ZipFile(remote) as zf:
+            self.assertEqual(sorted(members), sorted(zf.namelist()))
+            self.assertEqual(members["member5.bin"], zf.read("member5.bin"))
+        # only a part of the file has been fetched
+        self.assertLess(remote.fetched_bytes, os.path.getsize(zip_path))
+        self.assertLessEqual(remote.cached_bytes, 64 * 1024)
+
+    def test_parts_and_readahead(self):
+        """
+        downloaded parts are read from disk, sequential reads use readahead
+        """
+        _path, url, _md5 = self.create_sample("ahead.bin", 4 * 64 * 1024 + 100)
+        with open(_path, "rb") as f:
+            data = f.read()
+        bd = BlockDownload(name="ahead", url=url, blocksize=64, unit="KB")
+        target = os.path.join(self.work_dir, "parts")
+        bd.yaml_path = os.path.join(target, "ahead.yaml")
+        bd.download(target, from_block=1, to_block=1)
+        remote = RemoteBlockFile(bd, parts_dir=target, page_size=4 * 1024)
+        stream = io.BufferedReader(remote, buffer_size=4 * 1024)
+        self.assertEqual(data, stream.read())
+        self.assertEqual(64 * 1024, remote.part_bytes)
+        # the readahead needs far fewer requests than pages
+        pages = (len(data) - 64 * 1024) // (4 * 1024)
+        self.assertLess(remote.requests, pages / 4)
+        remote.seek(70000)
+        self.assertEqual(data[70000:70100], remote.read(100))
+        remote.seek(-10, io.SEEK_END)
+        self.assertEqual(data[-10:], remote.read())
+
+
+class TestRemoteFileWithoutRanges(BaseHttpTest):
+    """
+    Test the random access file object with a server that ignores ranges
+    """
+
+    handler_class = NoRangeRequestHandler
+
+    def test_full_body_rejected(self):
+        """
+        a full body answer is rejected even for the first page instead of
+        reading the whole remote file to serve one page
+        """
+        _path, url, _md5 = self.create_sample("norange.bin", 8 * 16 * 1024)
+        bd = BlockDownload(name="norange", url=url, blocksize=64, unit="KB")
+        remote = RemoteBlockFile(bd, page_size=16 * 1024)
+        with self.assertRaises(RangeNotSupported):
+            remote.read(100)
+        self.assertEqual(0, remote.fetched_bytes)
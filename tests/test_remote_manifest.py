@@ -0,0 +1,36 @@
+"""
+Created on 2025-06-08
+
+@author: wf
+"""
+
+import os
+
+from bdown.check import BlockCheck, create_remote_yaml
+from bdown.download import BlockDownload
+from tests.basehttptest import BaseHttpTest
+
+
+class TestRemoteManifest(BaseHttpTest):
+    """
+    Test the hash only manifest creation for a remote file
+    """
+
+    def test_remote_manifest_matches_local(self):
+        """
+        the remote manifest has the same blocks as dcheck --create of a local copy
+        """
+        path, url, md5 = self.create_sample("remote.bin", 5 * 16 * 1024 + 1234)
+        remote_path = os.path.join(self.work_dir, "remote.bin")
+        bd = create_remote_yaml(url, remote_path, 16, "KB", boost=3)
+        self.assertEqual(md5, bd.md5)
+        # no payload on disk
+        self.assertEqual(["remote.bin.yaml"], os.listdir(self.work_dir))
+
+        checker = BlockCheck(name="remote", file1=path, blocksize=16, unit="KB")
+        local = checker.get_or_create_yaml(path, url)
+        remote = BlockDownload.load_from_yaml_file(remote_path + ".yaml")
+        self.assertEqual(local.total_blocks, len(remote.blocks))
+        for local_block, remote_block in zip(local.blocks, remote.blocks):
+            for attr in ("block", "path", "offset", "size", "md5", "md5_head"):
+                self.assertEqual(getattr(local_block, attr), getattr(remote_block, attr))
@@ -0,0 +1,102 @@
+"""
+Created on 2025-06-11
+
+@author: wf
+"""
+
+import os
+import shutil
+
+from bdown.block import StatusSymbol
+from bdown.block_fiddler import BlockFiddler
+from bdown.download import BlockDownload, RangeNotSupported
+from bdown.sampling import SampleCheck
+from tests.basehttptest import BaseHttpTest, NoRangeRequestHandler
+
+
+class TestSampling(BaseHttpTest):
+    """
+    Test the statistical sampling check against a local and a remote reference
+    """
+
+    def setUp(self, debug=False, profile=True):
+        BaseHttpTest.setUp(self, debug=debug, profile=profile)
+        self.size = 8 * 16 * 1024 + 500
+        self.reference, self.url, _md5 = self.create_sample("sampled.bin", self.size)
+        self.path = os.path.join(self.work_dir, "sampled.bin")
+        shutil.copyfile(self.reference, self.path)
+
+    def corrupt_block(self, index: int):
+        """
+        overwrite the complete block with the given index
+        """
+        with open(self.path, "r+b") as f:
+            f.seek(index * 16 * 1024)
+            f.write(b"\0" * 16 * 1024)
+
+    def test_confidence(self):
+        """
+        the number of samples needed for a confidence level
+        """
+        samples = SampleCheck.samples_for_confidence(0.99, 0.01)
+        self.assertEqual(459, samples)
+        self.assertGreaterEqual(SampleCheck.detection_probability(samples, 0.01), 0.99)
+        self.assertLess(SampleCheck.detection_probability(samples - 1, 0.01), 0.99)
+        with self.assertRaises(ValueError):
+            SampleCheck.samples_for_confidence(1.0, 0.01)
+
+    def test_sample_local(self):
+        """
+        a corrupt block is found with reproducible samples
+        """
+        self.corrupt_block(5)
+        fiddler = BlockFiddler(name="sampled.bin", blocksize=16, unit="KB", size=self.size)
+        checker = SampleCheck(
+            fiddler, self.path, reference_path=self.reference, samples=3, sample_size=1024, seed=7
+        )
+        self.assertEqual(checker.sample_ranges(2), checker.sample_ranges(2))
+        self.assertEqual(3, len(checker.sample_ranges(2)))
+        # the last block is smaller than a sample and compared in full
+        self.assertEqual([(8 * 16 * 1024, 500)], checker.sample_ranges(8))
+        status = checker.check()
+        self.assertEqual({5}, status.symbol_blocks[StatusSymbol.FAIL])
+        self.assertEqual(8, status.count(StatusSymbol.SUCCESS))
+        # the corrupt block stops at its first differing sample
+        self.assertEqual(7 * 3 * 1024 + 1024 + 500, checker.sampled_bytes)
+
+    def test_sample_remote(self):
+        """
+        samples are compared with the remote reference via range requests
+        """
+        self.corrupt_block(1)
+        reference_download = BlockDownload(name="sampled.bin", url=self.url, blocksize=16, unit="KB")
+        checker = SampleCheck(
+            reference_download,
+            self.path,
+            reference_download=reference_download,
+            samples=2,
+            sample_size=4096,
+            workers=3,
+        )
+        status = checker.check()
+        self.assertEqual({1}, status.symbol_blocks[StatusSymbol.FAIL])
+        self.assertEqual(8, status.count(StatusSymbol.SUCCESS))
+
+
+class TestSamplingWithoutRanges(BaseHttpTest):
+    """
+    Test the sampling check against a remote reference that ignores ranges
+    """
+
+    handler_class = NoRangeRequestHandler
+
+    def test_full_body_rejected(self):
+        """
+        a full body answer to a sample range fails instead of being read
+        """
+        size = 4 * 16 * 1024
+        reference, url, _md5 = self.create_sample("unranged.bin", size)
+        reference_download = BlockDownload(name="unranged.bin", url=url, blocksize=16, unit="KB")
+        checker = SampleCheck(reference_download, reference, reference_download=reference_download, sample_size=4096)
+        with self.assertRaises(RangeNotSupported):
+            checker.check()
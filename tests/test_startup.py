@@ -0,0 +1,53 @@
+"""
+Created on 2025-06-09
+
+@author: wf
+"""
+
+import os
+
+from bdown.check import BlockCheck
+from bdown.startup import StartupBenchmark
+from tests.basehttptest import BaseHttpTest
+
+
+class TestStartup(BaseHttpTest):
+    """
+    Test the startup budget and the lazy imports of the command line modules
+    """
+
+    def test_lazy_imports(self):
+        """
+        the command line modules do not import the HTTP stack or tqdm at startup
+        """
+        benchmark = StartupBenchmark()
+        for module in StartupBenchmark.MODULES:
+            self.assertEqual([], benchmark.imported_modules(f"import {module}"), module)
+
+    def test_yaml_compare_without_http(self):
+        """
+        comparing two YAML manifests never imports requests
+        """
+        path, url, _md5 = self.create_sample("startup.bin", 3 * 16 * 1024)
+        checker = BlockCheck(name="startup", file1=path, blocksize=16, unit="KB")
+        checker.get_or_create_yaml(path, url)
+        yaml_path = path + ".yaml"
+        code = (
+            "from bdown.check import BlockCheck\n"
+            f"checker = BlockCheck(name='startup', file1={yaml_path!r}, file2={yaml_path!r}, blocksize=16, unit='KB')\n"
+            "checker.compare()\n"
+            "assert checker.status.success"
+        )
+        imported = StartupBenchmark().imported_modules(code)
+        self.assertNotIn("requests", imported)
+        self.assertNotIn("urllib3", imported)
+
+    def test_startup_budget(self):
+        """
+        the import time of the command line modules stays within the budget
+        """
+        budget_ms = float(os.environ.get("BDOWN_STARTUP_BUDGET_MS", "500"))
+        benchmark = StartupBenchmark(runs=3)
+        for module in ["bdown.check", "bdown.download_cmd"]:
+            ms = benchmark.startup_ms(module)
+            self.assertLessEqual(ms, budget_ms, f"{module} startup {ms:.1f} ms")
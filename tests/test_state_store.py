@@ -0,0 +1,83 @@
+"""
+Created on 2025-06-04
+
+@author: wf
+"""
+
+import os
+
+from bdown.download import BlockDownload
+from bdown.filesplitter import FileSplitter
+from tests.basehttptest import BaseHttpTest
+
+
+class TestStateStore(BaseHttpTest):
+    """
+    Test the SQLite backed block state store
+    """
+
+    def test_state_store(self):
+        """
+        download part of a file with a state store, query it,
+        resume from the store and export the YAML manifest
+        """
+        _path, url, md5 = self.create_sample("state.bin", 10 * 16 * 1024 + 100)
+        target = os.path.join(self.work_dir, "parts")
+        state_db = os.path.join(self.work_dir, "state.db")
+        yaml_path = os.path.join(target, "state.yaml")
+        bd = BlockDownload(
+            name="state", url=url, blocksize=16, unit="KB", state_db=state_db
+        )
+        bd.yaml_path = yaml_path
+        bd.download(target, from_block=0, to_block=5, boost=2)
+        self.assertEqual(11, bd.total_blocks)
+
+        store = bd.state_store
+        self.assertEqual([6, 7, 8, 9, 10], store.missing_blocks("state", bd.total_blocks))
+        in_range = store.blocks_in_range("state", 16 * 1024, 3 * 16 * 1024)
+        self.assertEqual([1, 2, 3], [block.block for block in in_range])
+        store.mark_failed("state", 7, "HTTP 503")
+        self.assertEqual([7], store.failed_blocks("state"))
+
+        # resume from the store
+        bd2 = BlockDownload.ofStateStore(state_db, "state")
+        self.assertEqual(url, bd2.url)
+        self.assertEqual(6, len(bd2.blocks))
+        bd2.yaml_path = yaml_path
+        bd2.download(target, boost=3)
+        self.assertEqual([], bd2.state_store.missing_blocks("state", bd2.total_blocks))
+        self.assertEqual([], bd2.state_store.failed_blocks("state"))
+
+        # the exported YAML manifest is complete
+        bd3 = BlockDownload.ofYamlPath(yaml_path)
+        self.assertEqual(11, len(bd3.blocks))
+        output_path = os.path.join(self.work_dir, "state.bin")
+        self.assertEqual(md5, bd3.reassemble(target, output_path))
+        self.assertIsNone(BlockDownload.ofStateStore(state_db, "unknown"))
+
+    def test_virtual_split_with_state_store(self):
+        """
+        a virtual split with a state store keeps the size, virtual and
+        validated fields of its blocks and reassembles
+        """
+        path, _url, md5 = self.create_sample("virtual.bin", 100000)
+        target = os.path.join(self.work_dir, "virtual")
+        state_db = os.path.join(self.work_dir, "virtual.db")
+        splitter = FileSplitter(name="virtual", blocksize=16, unit="KB", state_db=state_db)
+        splitter.split(path, target, virtual=True)
+        self.assertEqual(["virtual.yaml"], sorted(os.listdir(target)))
+        bd = BlockDownload.ofYamlPath(os.path.join(target, "virtual.yaml"))
+        self.assertEqual(7, len(bd.blocks))
+        self.assertTrue(all(block.virtual for block in bd.blocks))
+        self.assertEqual(100000 - 6 * 16 * 1024, bd.blocks[-1].size)
+        output_path = os.path.join(self.work_dir, "virtual.out")
+        self.assertEqual(md5, bd.reassemble(target, output_path))
+        self.assertEqual(100000, os.path.getsize(output_path))
+
+        # validation stamps survive a round trip through the store
+        block = bd.blocks[0]
+        self.assertTrue(block.is_valid(target, check_head=False))
+        splitter.state_store.save_block("virtual", block)
+        stored = splitter.state_store.get_blocks("virtual")[0]
+        self.assertEqual(block.validated, stored.validated)
+        self.assertTrue(stored.is_unchanged(target))
@@ -0,0 +1,106 @@
+"""
+Created on 2025-06-07
+
+@author: wf
+"""
+
+import hashlib
+import io
+import os
+import random
+import threading
+import time
+
+from bdown.download import BlockDownload
+from bdown.stream import OrderedHash, StreamSink
+from tests.basehttptest import BaseHttpTest
+
+
+class TestStream(BaseHttpTest):
+    """
+    Test ordered streaming of blocks that arrive in any order
+    """
+
+    def test_stream_sink_order_and_window(self):
+        """
+        blocks put in random order by several threads are written in order
+        and never more than window blocks are buffered
+        """
+        blocks = [os.urandom(1000) for _ in range(40)]
+        stream = io.BytesIO()
+        sink = StreamSink(stream, window=4)
+        max_pending = []
+
+        def producer(indices):
+            for index in indices:
+                time.sleep(random.random() / 1000)
+                sink.put(index, blocks[index])
+                max_pending.append(len(sink.pending))
+
+        threads = [
+            threading.Thread(target=producer, args=(range(i, 40, 4),)) for i in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        sink.close()
+        self.assertEqual(b"".join(blocks), stream.getvalue())
+        self.assertLessEqual(max(max_pending), 4)
+        self.assertEqual(hashlib.md5(b"".join(blocks)).hexdigest(), sink.md5.hexdigest())
+
+    def test_stream_sink_abort(self):
+        """
+        an aborted sink releases waiting producers with the error
+        """
+        sink = StreamSink(io.BytesIO(), window=1)
+        errors = []
+
+        def waiting_producer():
+            try:
+                sink.put(5, b"too far ahead")
+            except Exception as ex:
+                errors.append(ex)
+
+        thread = threading.Thread(target=waiting_producer)
+        thread.start()
+        sink.abort(IOError("block 0 failed"))
+        thread.join(timeout=5)
+        self.assertEqual(1, len(errors))
+        self.assertIsInstance(errors[0], IOError)
+
+    def test_ordered_hash(self):
+        """
+        chunks of blocks hashed by parallel threads in reverse start
+        order give the md5 of the blocks in index order
+        """
+        blocks = [[os.urandom(100) for _ in range(5)] for _ in range(8)]
+        ordered_hash = OrderedHash()
+
+        def hash_block(index):
+            block_hash = ordered_hash.block_hash(index)
+            for chunk in blocks[index]:
+                block_hash.update(chunk)
+            ordered_hash.block_done(index)
+
+        threads = [threading.Thread(target=hash_block, args=(index,)) for index in reversed(range(8))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        data = b"".join(b"".join(chunks) for chunks in blocks)
+        self.assertEqual(hashlib.md5(data).hexdigest(), ordered_hash.md5.hexdigest())
+
+    def test_download_to_stream(self):
+        """
+        stream a parallel download without part files
+        """
+        _path, url, md5 = self.create_sample("stream.bin", 20 * 8 * 1024 + 77)
+        bd = BlockDownload(name="stream", url=url, blocksize=8, unit="KB")
+        bd.yaml_path = os.path.join(self.work_dir, "stream.yaml")
+        stream = io.BytesIO()
+        streamed_md5 = bd.download_to_stream(stream, boost=4, window=3)
+        self.assertEqual(md5, streamed_md5)
+        self.assertEqual(md5, hashlib.md5(stream.getvalue()).hexdigest())
+        self.assertEqual(21, len(bd.blocks))
+        self.assertEqual(["stream.yaml"], os.listdir(self.work_dir))
@@ -0,0 +1,74 @@
+"""
+Created on 2025-06-05
+
+@author: wf
+"""
+
+import os
+from unittest.mock import patch
+
+from bdown.block import Block
+from bdown.download import BlockDownload
+from tests.basehttptest import BaseHttpTest
+
+
+class TestValidationCache(BaseHttpTest):
+    """
+    Test skipping the rehashing of provably unchanged part files
+    """
+
+    def test_block_validation_cache(self):
+        """
+        a verified block is only rehashed after a change or in paranoid mode
+        """
+        part_path = os.path.join(self.work_dir, "cache-0000.part")
+        with open(part_path, "wb") as f:
+            f.write(os.urandom(100_000))
+        block = Block(block=0, path="cache-0000.part", offset=0)
+        block.md5 = block.calc_md5(self.work_dir)
+        block.md5_head = block.calc_md5(self.work_dir, chunk_limit=1)
+
+        with patch.object(Block, "calc_md5", wraps=block.calc_md5) as calc_md5:
+            self.assertTrue(block.is_valid(self.work_dir, check_head=False))
+            self.assertEqual(1, calc_md5.call_count)
+            self.assertIsNotNone(block.validated)
+            # cached
+            self.assertTrue(block.is_valid(self.work_dir, check_head=False))
+            self.assertTrue(block.is_valid(self.work_dir, check_head=True))
+            self.assertEqual(1, calc_md5.call_count)
+            # paranoid
+            self.assertTrue(block.is_valid(self.work_dir, check_head=False, paranoid=True))
+            self.assertEqual(2, calc_md5.call_count)
+
+        # the stamp survives a YAML round trip
+        block = Block.from_yaml(block.to_yaml())
+        self.assertTrue(block.is_unchanged(self.work_dir))
+
+        # a modified file is rehashed and found invalid
+        with open(part_path, "r+b") as f:
+            f.seek(50_000)
+            f.write(b"corrupt")
+        os.utime(part_path, ns=(0, 0))
+        self.assertFalse(block.is_unchanged(self.work_dir))
+        self.assertFalse(block.is_valid(self.work_dir, check_head=False))
+        self.assertIsNone(block.validated)
+
+    def test_restart_full_check(self):
+        """
+        a restarted download with full check skips hashing unchanged parts
+        """
+        _path, url, _md5 = self.create_sample("restart.bin", 8 * 16 * 1024)
+        target = os.path.join(self.work_dir, "parts")
+        yaml_path = os.path.join(target, "restart.yaml")
+        bd = BlockDownload(name="restart", url=url, blocksize=16, unit="KB")
+        bd.yaml_path = yaml_path
+        bd.download(target, boost=2)
+
+        bd = BlockDownload.ofYamlPath(yaml_path)
+        bd.full_check = True
+        with patch.object(Block, "calc_md5") as calc_md5, patch.object(
+            BlockDownload, "fetch_block"
+        ) as fetch_block:
+            bd.download(target)
+            self.assertEqual(0, calc_md5.call_count)
+            self.assertEqual(0, fetch_block.call_count)
@@ -0,0 +1,71 @@
+"""
+Created on 2025-06-11
+
+@author: wf
+"""
+
+import os
+from unittest import mock
+
+from bdown.download import BlockDownload, RemoteFileChanged
+from tests.basehttptest import BaseHttpTest
+
+
+class TestValidators(BaseHttpTest):
+    """
+    Test the ETag/Last-Modified pinning and the If-Range drift detection
+    """
+
+    def setUp(self, debug=False, profile=True):
+        BaseHttpTest.setUp(self, debug=debug, profile=profile)
+        self.path, self.url, _md5 = self.create_sample("pinned.bin", 4 * 16 * 1024 + 10)
+        self.yaml_path = os.path.join(self.work_dir, "pinned.yaml")
+
+    def get_download(self) -> BlockDownload:
+        bd = BlockDownload(name="pinned", url=self.url, blocksize=16, unit="KB")
+        bd.yaml_path = self.yaml_path
+        return bd
+
+    def change_remote(self):
+        """
+        change the remote file keeping its size
+        """
+        stat = os.stat(self.path)
+        with open(self.path, "r+b") as f:
+            f.write(b"changed")
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    def test_pinned_in_manifest(self):
+        """
+        the validators of the HEAD request are stored in the manifest and a known
+        manifest does not need a HEAD request
+        """
+        bd = self.get_download()
+        self.assertIsNotNone(bd.etag)
+        self.assertIsNotNone(bd.last_modified)
+        bd.download(self.work_dir, to_block=1)
+        with mock.patch("requests.head", side_effect=AssertionError("unexpected HEAD")):
+            resumed = BlockDownload.ofYamlPath(self.yaml_path)
+            self.assertEqual(bd.etag, resumed.etag)
+            resumed.download(self.work_dir, boost=2)
+        self.assertEqual(4 + 1, len(resumed.blocks))
+
+    def test_drift_detected(self):
+        """
+        a change of the remote file in the middle of a download stops the download
+        """
+        bd = self.get_download()
+        bd.download(self.work_dir, to_block=1)
+        self.change_remote()
+        resumed = BlockDownload.ofYamlPath(self.yaml_path)
+        # probed before the change - the block requests see the drift
+        resumed.range_support = True
+        with self.assertRaises(RemoteFileChanged):
+            resumed.download(self.work_dir, from_block=2, boost=2)
+        self.assertFalse(os.path.exists(os.path.join(self.work_dir, "pinned-0002.yaml")))
+
+        # the next download of the same instance starts afresh for the new version
+        resumed.blocks = []
+        resumed.etag = resumed.last_modified = None
+        resumed.download(self.work_dir, from_block=2, force=True)
+        self.assertEqual([2, 3, 4], [block.block for block in resumed.blocks])
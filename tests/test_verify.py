@@ -0,0 +1,58 @@
+"""
+Created on 2025-06-06
+
+@author: wf
+"""
+
+import os
+
+from bdown.block import StatusSymbol
+from bdown.download import BlockDownload
+from bdown.verify import BlockVerifier
+from tests.basehttptest import BaseHttpTest
+
+
+class TestVerify(BaseHttpTest):
+    """
+    Test the full integrity verification of a parts directory
+    """
+
+    def test_verify_and_patch(self):
+        """
+        corrupt the tail of one block and remove another, verify,
+        patch the bad blocks and verify again
+        """
+        _path, url, md5 = self.create_sample("verify.bin", 6 * 16 * 1024 + 500)
+        target = os.path.join(self.work_dir, "parts")
+        yaml_path = os.path.join(target, "verify.yaml")
+        bd = BlockDownload(name="verify", url=url, blocksize=16, unit="KB")
+        bd.yaml_path = yaml_path
+        bd.download(target, boost=3)
+
+        # corrupt the tail - the md5_head stays valid
+        with open(os.path.join(target, "verify-0002.part"), "r+b") as f:
+            f.seek(15 * 1024)
+            f.write(b"corrupt")
+        os.remove(os.path.join(target, "verify-0004.part"))
+
+        bd = BlockDownload.ofYamlPath(yaml_path)
+        verifier = BlockVerifier(bd, target, workers=3)
+        status = verifier.verify()
+        self.assertEqual(5, status.count(StatusSymbol.SUCCESS))
+        self.assertEqual([2, 4], verifier.bad_blocks)
+        self.assertFalse(status.success)
+        bad_blocks_path = os.path.join(self.work_dir, "bad.txt")
+        verifier.save_bad_blocks(bad_blocks_path)
+        self.assertEqual([2, 4], BlockVerifier.parse_blocks(bad_blocks_path))
+        self.assertEqual([2, 4], BlockVerifier.parse_blocks("2,4"))
+
+        early_verifier = BlockVerifier(bd, target, workers=1, early_exit=True)
+        early_verifier.verify()
+        self.assertEqual([2], early_verifier.bad_blocks)
+
+        bd.download(target, block_indices=verifier.bad_blocks, force=True)
+        bd = BlockDownload.ofYamlPath(yaml_path)
+        verifier = BlockVerifier(bd, target)
+        self.assertTrue(verifier.verify().success)
+        output_path = os.path.join(self.work_dir, "verify.bin")
+        self.assertEqual(md5, bd.reassemble(target, output_path))